@@ -0,0 +1,355 @@
+'''Summaries of every daily record file, grouped by lab, plot or month
+
+    python -m analytics --by lab month --jobs 4 > summary.csv
+
+Each abq_data_record_<date>.csv, live or archived, is parsed in a pool
+of processes, one file per task, into columns of float64 for the numeric
+fields (NaN where a value is blank) and coded columns for the grouping
+fields. Rows that repeat the header or have the wrong number of fields
+are skipped, and numbers that won't parse are taken as blank; both are
+counted and reported. The worker summarises its file per group and the
+summaries are merged in the parent. Parsed columns are cached in
+abq_cache/ keyed by the file's size and modification time, so a rerun
+only parses new or changed days.
+
+NumPy is used for the columns when it is installed; otherwise they are
+plain arrays and summarised in Python.
+'''
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+
+from archive import day_files, open_text
+from schema import RECORD_SCHEMA
+from stats import Running
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+NUMERIC = [f.name for f in RECORD_SCHEMA if f.type in (int, float)]
+# Grouping dimensions and the key each record is grouped under
+DIMENSIONS = {
+    'lab': ('Lab', lambda value: value),
+    'plot': ('Plot', lambda value: value),
+    'month': ('Date', lambda value: value[:7]),
+}
+_CACHE_VERSION = 2
+
+
+def discover(directory='.'):
+    """Return the daily record files in directory, live or archived,
+    oldest first"""
+    return day_files(directory)
+
+
+class Columns:
+    """A parsed daily file: numeric columns and coded key columns
+
+    numbers maps each numeric field to an array of float64. keys maps
+    each grouping field to (table, codes), where codes holds an index
+    into the table of distinct strings for every record. skipped counts
+    the rows left out and invalid the numbers that would not parse.
+    """
+
+    __slots__ = ('count', 'numbers', 'keys', 'skipped', 'invalid')
+
+    def __init__(self, count, numbers, keys, skipped=0, invalid=0):
+        self.count = count
+        self.numbers = numbers
+        self.keys = keys
+        self.skipped = skipped
+        self.invalid = invalid
+
+    @classmethod
+    def parse(cls, filename):
+        with open_text(filename) as fh:
+            reader = csv.reader(fh)
+            header = next(reader, None) or []
+            rows = list(reader)
+        positions = {name: i for i, name in enumerate(header)}
+        width = len(header)
+        read = len(rows)
+        # Files merged by hand can hold a header again part way down
+        rows = [row for row in rows if len(row) == width and row != header]
+        skipped = read - len(rows)
+        columns = list(zip(*rows)) if rows else [()] * width
+        nan = math.nan
+        numbers = {}
+        invalid = 0
+        for name in NUMERIC:
+            column = columns[positions[name]] if name in positions else ()
+            try:
+                values = array('d', [float(v) if v else nan for v in column])
+            except ValueError:
+                values = array('d')
+                for v in column:
+                    try:
+                        values.append(float(v) if v else nan)
+                    except ValueError:
+                        values.append(nan)
+                        invalid += 1
+            if len(values) < len(rows):
+                values.extend([nan] * (len(rows) - len(values)))
+            numbers[name] = values
+        keys = {}
+        for field, _ in DIMENSIONS.values():
+            column = (
+                columns[positions[field]] if field in positions
+                else [''] * len(rows)
+            )
+            table = {}
+            codes = array('H', [table.setdefault(v, len(table)) for v in column])
+            keys[field] = (list(table), codes)
+        return cls(len(rows), numbers, keys, skipped, invalid)
+
+    def dump(self, fh, stamp):
+        """Write the columns after a JSON header line"""
+        header = {
+            'version': _CACHE_VERSION,
+            'stamp': stamp,
+            'count': self.count,
+            'skipped': self.skipped,
+            'invalid': self.invalid,
+            'numbers': list(self.numbers),
+            'keys': {field: table for field, (table, _) in self.keys.items()},
+        }
+        fh.write(json.dumps(header).encode() + b'\n')
+        for values in self.numbers.values():
+            fh.write(values.tobytes())
+        for _, codes in self.keys.values():
+            fh.write(codes.tobytes())
+
+    @classmethod
+    def load(cls, fh, stamp):
+        """Read columns written by dump(), or return None if they are
+        stale"""
+        header = json.loads(fh.readline())
+        if header.get('version') != _CACHE_VERSION or header['stamp'] != stamp:
+            return None
+        count = header['count']
+        numbers = {}
+        for name in header['numbers']:
+            values = array('d')
+            values.frombytes(fh.read(count * values.itemsize))
+            numbers[name] = values
+        keys = {}
+        for field, table in header['keys'].items():
+            codes = array('H')
+            codes.frombytes(fh.read(count * codes.itemsize))
+            keys[field] = (table, codes)
+        return cls(count, numbers, keys, header['skipped'], header['invalid'])
+
+
+def _stamp(filename):
+    status = os.stat(filename)
+    return [status.st_size, status.st_mtime_ns]
+
+
+def read_columns(filename, cache=None):
+    """Return (Columns, whether they came from the cache) for a file"""
+    stamp = _stamp(filename)
+    cached = Path(cache) / (Path(filename).name + '.cols') if cache else None
+    if cached is not None:
+        try:
+            with open(cached, 'rb') as fh:
+                columns = Columns.load(fh, stamp)
+            if columns is not None:
+                return columns, True
+        except (OSError, ValueError, KeyError):
+            pass
+    columns = Columns.parse(filename)
+    if cached is not None:
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        temporary = cached.with_name(cached.name + f'.{os.getpid()}.tmp')
+        with open(temporary, 'wb') as fh:
+            columns.dump(fh, stamp)
+        os.replace(temporary, cached)
+    return columns, False
+
+
+def _summarise_numpy(columns, codes, table):
+    summary = {}
+    codes = numpy.frombuffer(codes, dtype=numpy.uint16)
+    numbers = {
+        name: numpy.frombuffer(values, dtype=numpy.float64)
+        for name, values in columns.numbers.items()
+    }
+    for code, key in enumerate(table):
+        mask = codes == code
+        fields = {}
+        for name, values in numbers.items():
+            values = values[mask]
+            values = values[~numpy.isnan(values)]
+            if not len(values):
+                fields[name] = Running()
+                continue
+            mean = values.mean()
+            fields[name] = Running((
+                len(values), float(mean), float(((values - mean) ** 2).sum()),
+                float(values.min()), float(values.max())
+            ))
+        summary[key] = (int(mask.sum()), fields)
+    return summary
+
+
+def _summarise_python(columns, codes, table):
+    counts = [0] * len(table)
+    fields = [{name: Running() for name in NUMERIC} for _ in table]
+    for code in codes:
+        counts[code] += 1
+    for name, values in columns.numbers.items():
+        for code, value in zip(codes, values):
+            if value == value:
+                fields[code][name].add(value)
+    return {key: (counts[i], fields[i]) for i, key in enumerate(table)}
+
+
+def summarise(columns, dimensions):
+    """Return {dimension: {key: (records, {field: Running})}} for a file"""
+    summarise_group = _summarise_numpy if numpy else _summarise_python
+    summaries = {}
+    for dimension in dimensions:
+        field, key_of = DIMENSIONS[dimension]
+        table, codes = columns.keys[field]
+        merged = {}
+        for key, (count, fields) in summarise_group(
+            columns, codes, table
+        ).items():
+            _merge(merged, key_of(key), count, fields)
+        summaries[dimension] = merged
+    return summaries
+
+
+def _merge(summary, key, count, fields):
+    if key not in summary:
+        summary[key] = (count, fields)
+        return
+    total, running = summary[key]
+    for name, other in fields.items():
+        running[name].merge(other)
+    summary[key] = (total + count, running)
+
+
+def summarise_file(filename, dimensions, cache=None):
+    """Worker task: summarise one daily file, returning the summaries,
+    whether they came from the cache and the rows skipped and numbers
+    unread"""
+    columns, cached = read_columns(filename, cache)
+    return (
+        summarise(columns, dimensions), cached,
+        columns.skipped, columns.invalid
+    )
+
+
+class Report:
+    """Summaries of many daily files merged together"""
+
+    def __init__(self, dimensions):
+        self.dimensions = list(dimensions)
+        self.summaries = {dimension: {} for dimension in self.dimensions}
+        self.files = 0
+        self.cached = 0
+        self.skipped = 0
+        self.invalid = 0
+
+    def add(self, summaries, cached=False, skipped=0, invalid=0):
+        self.files += 1
+        self.cached += cached
+        self.skipped += skipped
+        self.invalid += invalid
+        for dimension, groups in summaries.items():
+            merged = self.summaries[dimension]
+            for key, (count, fields) in groups.items():
+                _merge(merged, key, count, fields)
+
+    def rows(self):
+        """Yield a flat dict per group, ordered by dimension and key"""
+        for dimension in self.dimensions:
+            groups = self.summaries[dimension]
+            for key in sorted(groups, key=lambda k: (len(k), k)):
+                count, fields = groups[key]
+                row = {'group': dimension, 'key': key, 'records': count}
+                for name, running in fields.items():
+                    row[f'{name} mean'] = running.mean if running.count else ''
+                    row[f'{name} stdev'] = running.stdev if running.count else ''
+                    row[f'{name} min'] = running.min
+                    row[f'{name} max'] = running.max
+                yield row
+
+
+def build_report(filenames, dimensions=('lab', 'plot', 'month'), jobs=None,
+                 cache=None):
+    """Summarise filenames in a pool of jobs processes"""
+    report = Report(dimensions)
+    if jobs == 1:
+        for filename in filenames:
+            report.add(*summarise_file(filename, dimensions, cache))
+        return report
+    with ProcessPoolExecutor(jobs) as executor:
+        results = executor.map(
+            summarise_file, filenames,
+            [dimensions] * len(filenames), [cache] * len(filenames)
+        )
+        for result in results:
+            report.add(*result)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Summarise the ABQ daily record files'
+    )
+    parser.add_argument(
+        '--directory', default='.', help='where the daily files live'
+    )
+    parser.add_argument(
+        '--by', nargs='+', choices=list(DIMENSIONS),
+        default=list(DIMENSIONS), help='how to group the records'
+    )
+    parser.add_argument(
+        '--jobs', type=int, default=None,
+        help='worker processes (default: one per CPU)'
+    )
+    parser.add_argument(
+        '--cache', default=None,
+        help='where parsed files are cached (default: DIRECTORY/abq_cache)'
+    )
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--format', choices=('csv', 'json'), default='csv')
+    args = parser.parse_args(argv)
+
+    cache = None
+    if not args.no_cache:
+        cache = args.cache or Path(args.directory) / 'abq_cache'
+    filenames = discover(args.directory)
+    report = build_report(filenames, args.by, args.jobs, cache)
+    rows = list(report.rows())
+    if args.format == 'json':
+        json.dump(rows, sys.stdout, indent=1)
+        print()
+    elif rows:
+        writer = csv.DictWriter(sys.stdout, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(
+        f'{report.files} files summarised, {report.cached} from the cache',
+        file=sys.stderr
+    )
+    if report.skipped or report.invalid:
+        print(
+            f'{report.skipped} malformed or repeated header rows skipped, '
+            f'{report.invalid} unreadable numbers left out',
+            file=sys.stderr
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,425 @@
+'''Compressed archive of closed daily record files
+
+    python -m archive rotate --keep 7
+    python -m archive cat 2025-03-01 2025-03-02 > march.csv
+
+rotate() moves every daily file older than the last few days into
+abq_archive/<year>/<month>/, compressed in independent blocks of about
+64KiB. Gzip archives (.csv.gz) are BGZF: each block is a gzip member
+whose header holds its compressed length, so they still open with gzip
+or zcat. When the standard library has zstd (Python 3.14 on), archives
+are .csv.zst, each frame preceded by a skippable frame holding the
+lengths, which zstd itself passes over.
+
+Either way a reader walks the block headers to find where each block
+starts and only decompresses the blocks it reads, so open_day() hands
+back a seekable binary file whose offsets are the offsets of the
+original CSV. Row offsets kept elsewhere (the notes index, RecordFile)
+stay valid once a day is archived.
+'''
+from bisect import bisect_right
+from datetime import date, timedelta
+from pathlib import Path
+import argparse
+import csv
+import io
+import locale
+import os
+import re
+import shutil
+import struct
+import sys
+import zlib
+
+try:
+    from compression import zstd
+except ImportError:
+    zstd = None
+
+ARCHIVE = 'abq_archive'
+_DAY = re.compile(r'abq_data_record_(\d{4})-(\d{2})-(\d{2})\.csv')
+
+
+class Gzip:
+    """BGZF framing: gzip members with their length in a BC subfield"""
+
+    suffix = '.gz'
+    # bgzip's default, so a compressed block always fits BSIZE
+    block_size = 0xff00
+    _header = struct.Struct('<4BI2BH2BHH')
+    _eof = bytes.fromhex(
+        '1f8b08040000000000ff0600424302001b0003000000000000000000'
+    )
+
+    def compress(self, data):
+        deflate = zlib.compressobj(6, zlib.DEFLATED, -15)
+        body = deflate.compress(data) + deflate.flush()
+        trailer = struct.pack('<II', zlib.crc32(data), len(data))
+        length = self._header.size + len(body) + len(trailer)
+        header = self._header.pack(
+            0x1f, 0x8b, 8, 4, 0, 0, 0xff, 6, ord('B'), ord('C'), 2,
+            length - 1
+        )
+        return header + body + trailer
+
+    def finish(self):
+        return self._eof
+
+    def blocks(self, fh):
+        """Yield (offset, length, uncompressed size) of each block"""
+        offset = 0
+        while True:
+            fh.seek(offset)
+            header = fh.read(self._header.size)
+            if not header:
+                return
+            magic = header[:4]
+            if len(header) < self._header.size or magic != b'\x1f\x8b\x08\x04':
+                raise ValueError(f'not a block gzip file at {offset}')
+            extra_length = struct.unpack_from('<H', header, 10)[0]
+            extra = header[12:] + fh.read(extra_length - 6)
+            length = None
+            while len(extra) >= 4:
+                ident, size = extra[:2], struct.unpack_from('<H', extra, 2)[0]
+                if ident == b'BC' and size == 2:
+                    length = struct.unpack_from('<H', extra, 4)[0] + 1
+                extra = extra[4 + size:]
+            if length is None:
+                raise ValueError(f'gzip member at {offset} has no length')
+            fh.seek(offset + length - 4)
+            yield offset, length, struct.unpack('<I', fh.read(4))[0]
+            offset += length
+
+    def decompress(self, block):
+        header = 12 + struct.unpack_from('<H', block, 10)[0]
+        return zlib.decompress(block[header:-8], -15)
+
+
+class Zstd:
+    """zstd frames, each after a skippable frame giving its lengths"""
+
+    suffix = '.zst'
+    block_size = 0x10000
+    _skippable = struct.Struct('<IIII')
+    _magic = 0x184d2a5a
+
+    def compress(self, data):
+        frame = zstd.compress(data)
+        return self._skippable.pack(
+            self._magic, 8, len(frame), len(data)
+        ) + frame
+
+    def finish(self):
+        return b''
+
+    def blocks(self, fh):
+        offset = 0
+        while True:
+            fh.seek(offset)
+            header = fh.read(self._skippable.size)
+            if not header:
+                return
+            magic, size, length, uncompressed = self._skippable.unpack(header)
+            if magic != self._magic or size != 8:
+                raise ValueError(f'not a block zstd file at {offset}')
+            yield offset, self._skippable.size + length, uncompressed
+            offset += self._skippable.size + length
+
+    def decompress(self, block):
+        return zstd.decompress(block[self._skippable.size:])
+
+
+codecs = {'gzip': Gzip, 'zstd': Zstd}
+default_codec = 'zstd' if zstd is not None else 'gzip'
+
+
+def _codec_for(filename):
+    for codec in codecs.values():
+        if str(filename).endswith(codec.suffix):
+            return codec()
+    raise ValueError(f'{filename} is not an archived day')
+
+
+class BlockReader(io.RawIOBase):
+    """A seekable, read-only view of the CSV inside an archived day
+
+    Only the block holding the current position is kept decompressed.
+    """
+
+    def __init__(self, filename, codec=None):
+        self.filename = Path(filename)
+        self.codec = codec or _codec_for(filename)
+        self._fh = open(filename, 'rb')
+        self._blocks = []
+        self._starts = []
+        self.size = 0
+        try:
+            for offset, length, size in self.codec.blocks(self._fh):
+                if size:
+                    self._blocks.append((offset, length))
+                    self._starts.append(self.size)
+                    self.size += size
+        except (ValueError, struct.error):
+            self._fh.close()
+            raise
+        self._position = 0
+        self._current = None
+        self._data = b''
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError('negative seek position')
+        self._position = offset
+        return offset
+
+    def _block(self, number):
+        if number != self._current:
+            offset, length = self._blocks[number]
+            self._fh.seek(offset)
+            self._data = self.codec.decompress(self._fh.read(length))
+            self._current = number
+        return self._data
+
+    def readinto(self, buffer):
+        if self._position >= self.size:
+            return 0
+        number = bisect_right(self._starts, self._position) - 1
+        data = self._block(number)
+        start = self._position - self._starts[number]
+        count = min(len(buffer), len(data) - start)
+        buffer[:count] = data[start:start + count]
+        self._position += count
+        return count
+
+    def close(self):
+        if not self.closed:
+            self._fh.close()
+        super().close()
+
+
+def is_archived(filename):
+    return str(filename).endswith(tuple(c.suffix for c in codecs.values()))
+
+
+def day_name(filename):
+    """Return the name of the daily file a live or archived path holds"""
+    name = Path(filename).name
+    for codec in codecs.values():
+        if name.endswith(codec.suffix):
+            return name[:-len(codec.suffix)]
+    return name
+
+
+def archive_path(directory, name, codec=default_codec):
+    """Return where a daily file is archived: <archive>/<year>/<month>/"""
+    match = _DAY.fullmatch(name)
+    if match is None:
+        raise ValueError(f'{name} is not a daily record file')
+    year, month, _ = match.groups()
+    return (
+        Path(directory) / ARCHIVE / year / month / (name + codecs[codec].suffix)
+    )
+
+
+def locate(directory, name):
+    """Return the path holding a daily file, live or archived, or None"""
+    live = Path(directory) / name
+    if live.exists():
+        return live
+    for codec in codecs:
+        try:
+            archived = archive_path(directory, name, codec)
+        except ValueError:
+            return None
+        if archived.exists():
+            return archived
+    return None
+
+
+def day_files(directory='.'):
+    """Return every daily file, live or archived, oldest first
+
+    Files whose names don't hold a YYYY-MM-DD date are left out.
+    """
+    directory = Path(directory)
+    files = {
+        f.name: f for f in directory.glob('abq_data_record_*.csv')
+        if _DAY.fullmatch(f.name)
+    }
+    for codec in codecs.values():
+        pattern = f'*/*/abq_data_record_*.csv{codec.suffix}'
+        for archived in (directory / ARCHIVE).glob(pattern):
+            if _DAY.fullmatch(day_name(archived)):
+                files.setdefault(day_name(archived), archived)
+    return [files[name] for name in sorted(files)]
+
+
+def open_day(filename):
+    """Open a live or archived daily file for reading bytes"""
+    if is_archived(filename):
+        reader = BlockReader(filename)
+        return io.BufferedReader(reader, buffer_size=reader.codec.block_size)
+    return open(filename, 'rb')
+
+
+def open_text(filename, encoding=None):
+    """Open a live or archived daily file for csv to read"""
+    return io.TextIOWrapper(
+        open_day(filename),
+        encoding=encoding or locale.getpreferredencoding(False), newline=''
+    )
+
+
+def size(filename):
+    """Return the size of the CSV a live or archived path holds"""
+    if is_archived(filename):
+        with BlockReader(filename) as reader:
+            return reader.size
+    return Path(filename).stat().st_size
+
+
+def read_records(filename, encoding=None):
+    """Yield the records of a live or archived daily file as dicts"""
+    with open_text(filename, encoding) as fh:
+        yield from csv.DictReader(fh)
+
+
+def records(directory='.', start=None, end=None):
+    """Yield every record saved from start to end, inclusive, in order
+
+    start and end are date strings; the days are read one after another,
+    whether live or archived, and only a block at a time.
+    """
+    for filename in day_files(directory):
+        datestring = '-'.join(_DAY.fullmatch(day_name(filename)).groups())
+        if start and datestring < start or end and datestring > end:
+            continue
+        yield from read_records(filename)
+
+
+def archive_day(filename, directory='.', codec=default_codec):
+    """Compress a daily file into the archive and remove it
+
+    The archive is written under a temporary name, checked against the
+    file and synced before the file and its index sidecar are removed.
+    """
+    filename = Path(filename)
+    codec_name = codec
+    codec = codecs[codec]()
+    target = archive_path(directory, filename.name, codec_name)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    temporary = target.with_name(target.name + '.tmp')
+    with open(filename, 'rb') as source, open(temporary, 'wb') as fh:
+        while True:
+            block = source.read(codec.block_size)
+            if not block:
+                break
+            fh.write(codec.compress(block))
+        fh.write(codec.finish())
+        fh.flush()
+        os.fsync(fh.fileno())
+        written = source.tell()
+    with BlockReader(temporary, codec) as reader:
+        if reader.size != written or written != filename.stat().st_size:
+            # Appended to while it was being archived; leave it live
+            temporary.unlink()
+            return None
+    shutil.copystat(filename, temporary)
+    os.replace(temporary, target)
+    filename.unlink()
+    filename.with_name(filename.name + '.idx').unlink(missing_ok=True)
+    return target
+
+
+def rotate(directory='.', keep=7, codec=default_codec, today=None):
+    """Archive the daily files more than keep days old
+
+    A day with shards in abq_shards/ is merged first and its shards
+    deleted, the daily file then holding all of its records; a day
+    whose shards are still being written to is left for next time.
+    Returns the archived paths.
+    """
+    # models imports this module
+    from models import retire_shards
+
+    directory = Path(directory)
+    today = today or date.today()
+    cutoff = (today - timedelta(days=keep)).isoformat()
+    shards = directory / 'abq_shards'
+    # Days still in shards alone have no daily file until they're merged
+    names = {f.name for f in directory.glob('abq_data_record_*.csv')}
+    names.update(
+        f.name.partition('.')[0] + '.csv'
+        for f in shards.glob('abq_data_record_*.csv')
+    )
+    archived = []
+    for name in sorted(names):
+        match = _DAY.fullmatch(name)
+        if match is None or '-'.join(match.groups()) >= cutoff:
+            continue
+        filename = directory / name
+        if any(shards.glob(f'{filename.stem}.*.csv')):
+            try:
+                if not retire_shards('-'.join(match.groups()), directory):
+                    continue
+            except TimeoutError:
+                # Another merge holds the lock; try again next time
+                continue
+        target = archive_day(filename, directory, codec)
+        if target is not None:
+            archived.append(target)
+    return archived
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Compress old ABQ daily record files, or read them back'
+    )
+    parser.add_argument(
+        '--directory', default='.', help='where the daily files live'
+    )
+    commands = parser.add_subparsers(dest='command', required=True)
+    rotation = commands.add_parser('rotate', help='archive old daily files')
+    rotation.add_argument(
+        '--keep', type=int, default=7, help='days to leave uncompressed'
+    )
+    rotation.add_argument(
+        '--codec', choices=[c for c in codecs if c != 'zstd' or zstd],
+        default=default_codec
+    )
+    reading = commands.add_parser('cat', help='print days as one CSV')
+    reading.add_argument('dates', nargs='+')
+    args = parser.parse_args(argv)
+
+    if args.command == 'rotate':
+        for target in rotate(args.directory, args.keep, args.codec):
+            print(target)
+        return
+    writer = None
+    for datestring in args.dates:
+        filename = locate(args.directory, f'abq_data_record_{datestring}.csv')
+        if filename is None:
+            print(f'No records for {datestring}', file=sys.stderr)
+            continue
+        for record in read_records(filename):
+            if writer is None:
+                writer = csv.DictWriter(sys.stdout, fieldnames=list(record))
+                writer.writeheader()
+            writer.writerow(record)
+
+
+if __name__ == '__main__':
+    main()
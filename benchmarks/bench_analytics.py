@@ -0,0 +1,64 @@
+'''Time the analytics report over a year of daily files
+
+Run from the repository root:
+
+    python -m benchmarks.bench_analytics [days] [records per day] [jobs]
+
+Compares parsing every file in this process with a process pool, and a
+rerun that reads the cached columns.
+'''
+from datetime import date, timedelta
+import random
+import sys
+import tempfile
+
+import analytics
+from benchmarks.common import sample_record, timed, report
+from models import RecordStore
+from schema import RECORD_SCHEMA
+
+
+def make_files(directory, days, per_day):
+    rng = random.Random(1)
+    start = date(2025, 1, 1)
+    for day in range(days):
+        datestring = (start + timedelta(days=day)).isoformat()
+        records = []
+        for i in range(per_day):
+            record = sample_record(i, rng)
+            record['Date'] = datestring
+            records.append(record)
+        with RecordStore(
+            directory, fields=RECORD_SCHEMA.types, index=False,
+            flush_every=per_day
+        ) as store:
+            store.write_many(records, datestring)
+
+
+def main(days=365, per_day=500, jobs=None):
+    total = days * per_day
+    print(f'NumPy columns: {"yes" if analytics.numpy else "no"}')
+    with tempfile.TemporaryDirectory() as directory:
+        make_files(directory, days, per_day)
+        filenames = analytics.discover(directory)
+        cache = f'{directory}/abq_cache'
+        seconds, _ = timed(analytics.build_report, filenames, jobs=1)
+        report('serial, no cache', total, seconds)
+        seconds, _ = timed(analytics.build_report, filenames, jobs=jobs)
+        report('process pool, no cache', total, seconds)
+        seconds, _ = timed(
+            analytics.build_report, filenames, jobs=jobs, cache=cache
+        )
+        report('process pool, filling the cache', total, seconds)
+        seconds, result = timed(
+            analytics.build_report, filenames, jobs=jobs, cache=cache
+        )
+        report('process pool, from the cache', total, seconds)
+        print(f'    {result.cached} of {result.files} files from the cache')
+
+
+if __name__ == '__main__':
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 365
+    per_day = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    jobs = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    main(days, per_day, jobs)
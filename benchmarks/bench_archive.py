@@ -0,0 +1,81 @@
+'''Time rotating old daily files into the archive and reading them back
+
+Run from the repository root:
+
+    python -m benchmarks.bench_archive [days] [records per day] [codec]
+
+Reports how long rotation takes and how much it saves, then compares
+streaming every record from live files with streaming them from the
+archive, the peak memory of the archived read, and the cost of seeking
+to a row in an archived day.
+'''
+from datetime import date, timedelta
+from pathlib import Path
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import archive
+from benchmarks.bench_analytics import make_files
+from benchmarks.common import timed, report
+from models import scan_rows
+
+
+def disk_usage(paths):
+    return sum(Path(p).stat().st_size for p in paths)
+
+
+def count(records):
+    return sum(1 for _ in records)
+
+
+def main(days=365, per_day=500, codec=archive.default_codec):
+    total = days * per_day
+    with tempfile.TemporaryDirectory() as directory:
+        make_files(directory, days, per_day)
+        live = archive.day_files(directory)
+        with open(live[0], 'rb') as fh:
+            offsets = [offset for offset, _ in scan_rows(fh)][1:]
+        before = disk_usage(live)
+
+        seconds, _ = timed(count, archive.records(directory))
+        report('stream records, live files', total, seconds)
+
+        today = date(2025, 1, 1) + timedelta(days=days)
+        seconds, archived = timed(archive.rotate, directory, 0, codec, today)
+        report(
+            f'rotate into the archive ({codec})', len(archived), seconds,
+            'days'
+        )
+        after = disk_usage(archive.day_files(directory))
+        print(
+            f'    {before / 2 ** 20:.1f} MiB -> {after / 2 ** 20:.1f} MiB '
+            f'({after / before:.0%})'
+        )
+
+        seconds, _ = timed(count, archive.records(directory))
+        report('stream records, archived', total, seconds)
+        # A pass of its own, as tracing slows everything down
+        tracemalloc.start()
+        count(archive.records(directory))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f'    peak memory while streaming {peak / 2 ** 10:.0f} KiB')
+
+        rng = random.Random(3)
+        samples = rng.sample(offsets, min(200, len(offsets)))
+        with archive.open_day(archived[0]) as fh:
+            start = time.perf_counter()
+            for offset in samples:
+                next(scan_rows(fh, offset))
+            seconds = time.perf_counter() - start
+        report('seek to a row in an archived day', len(samples), seconds, 'rows')
+
+
+if __name__ == '__main__':
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 365
+    per_day = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    codec = sys.argv[3] if len(sys.argv) > 3 else archive.default_codec
+    main(days, per_day, codec)
@@ -0,0 +1,59 @@
+'''Records per second through bulk_import on one core
+
+    python -m benchmarks.bench_bulk_import [records]
+
+Writes a CSV and a JSON-lines file of sample readings (with a few bad
+values and equipment faults mixed in) and times importing each.
+'''
+import csv
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks.common import sample_record, timed, report
+from bulk_import import Importer, read_csv, read_jsonl
+from schema import RECORD_SCHEMA
+
+
+def make_records(count):
+    records = []
+    for i in range(count):
+        record = sample_record(i)
+        if not i % 97:
+            record['Humidity'] = 99
+        if not i % 89:
+            record['Equipment Fault'] = True
+        records.append(record)
+    return records
+
+
+def main(count=200000):
+    records = make_records(count)
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        csv_input = directory / 'input.csv'
+        with open(csv_input, 'w', newline='') as fh:
+            writer = csv.DictWriter(fh, fieldnames=RECORD_SCHEMA.names)
+            writer.writeheader()
+            writer.writerows(records)
+        jsonl_input = directory / 'input.jsonl'
+        with open(jsonl_input, 'w') as fh:
+            fh.writelines(json.dumps(r) + '\n' for r in records)
+        for name, filename, read in (
+            ('csv', csv_input, read_csv), ('jsonl', jsonl_input, read_jsonl)
+        ):
+            out = directory / name
+            importer = Importer(out, out.with_suffix('.errors.csv'))
+
+            def run():
+                with open(filename, newline='') as fh:
+                    importer.run(read(fh))
+                importer.close()
+            seconds, _ = timed(run)
+            report(f'bulk import {name} ({importer.rejected} rejected)',
+                   count, seconds)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
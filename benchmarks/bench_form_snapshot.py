@@ -0,0 +1,99 @@
+'''Per-save and per-reset cost of reading and writing the form variables
+
+    python -m benchmarks.bench_form_snapshot
+
+Uses the same 17 variables as DataRecordForm on a Tcl interpreter without
+a display, with a write trace on Notes standing in for BoundText.
+Compares one get()/set() per variable with VariableSnapshot. The reset
+figures only cover the variables themselves, and on them the snapshot
+is slower: about 20us, and 17us for the template reset that
+DataRecordForm.reset() runs, against 10us one variable at a time. The
+extra goes on lifting and restoring the traces so that each one fires
+once, after every field has its new value, rather than once per
+intermediate state. Whether that pays for itself depends on the live
+widgets and validation behind the traces, which only bench_gui measures
+(reset per variable / snapshot / template).
+'''
+import time
+import tkinter as tk
+
+from variables import VariableSnapshot
+
+ROUNDS = 20000
+TYPES = {
+    'Date': tk.StringVar, 'Time': tk.StringVar, 'Technician': tk.StringVar,
+    'Lab': tk.StringVar, 'Plot': tk.StringVar, 'Seed Sample': tk.StringVar,
+    'Humidity': tk.DoubleVar, 'Light': tk.DoubleVar,
+    'Temperature': tk.DoubleVar, 'Equipment Fault': tk.BooleanVar,
+    'Plants': tk.IntVar, 'Blossoms': tk.IntVar, 'Fruit': tk.IntVar,
+    'Min Height': tk.DoubleVar, 'Max Height': tk.DoubleVar,
+    'Med Height': tk.DoubleVar, 'Notes': tk.StringVar,
+}
+
+
+def per_variable_get(variables):
+    data = dict()
+    fault = variables['Equipment Fault'].get()
+    for key, variable in variables.items():
+        if fault and key in ('Light', 'Humidity', 'Temperature'):
+            data[key] = ''
+        else:
+            try:
+                data[key] = variable.get()
+            except tk.TclError:
+                raise ValueError(key)
+    return data
+
+
+def per_variable_reset(variables):
+    for var in variables.values():
+        if isinstance(var, tk.BooleanVar):
+            var.set(False)
+        else:
+            var.set('')
+
+
+def snapshot_get(snapshot, fault_index, tk):
+    """What DataRecordForm.get() now does"""
+    values = snapshot.read()
+    fault = tk.getboolean(values[fault_index])
+    skip = ('Light', 'Humidity', 'Temperature') if fault else ()
+    return snapshot.convert(values, skip)
+
+
+def fill(variables):
+    for key, var in variables.items():
+        var.set({tk.StringVar: 'x', tk.DoubleVar: 1.5, tk.IntVar: 3,
+                 tk.BooleanVar: False}[type(var)])
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        func(*args)
+    return (time.perf_counter() - start) / ROUNDS * 1e6
+
+
+def main():
+    root = tk.Tcl()
+    variables = {key: cls(root) for key, cls in TYPES.items()}
+    variables['Notes'].trace_add('write', lambda *_: None)
+    snapshot = VariableSnapshot(variables)
+    defaults = {
+        key: False if isinstance(var, tk.BooleanVar) else ''
+        for key, var in variables.items()
+    }
+    fill(variables)
+    fault_index = snapshot.keys.index('Equipment Fault')
+    args = (snapshot, fault_index, root)
+    assert snapshot_get(*args) == per_variable_get(variables)
+    print(f'get per variable  {timed(per_variable_get, variables):7.1f}us')
+    print(f'get snapshot      {timed(snapshot_get, *args):7.1f}us')
+    print(f'reset per variable {timed(per_variable_reset, variables):6.1f}us')
+    print(f'reset snapshot     {timed(snapshot.set, defaults):6.1f}us')
+    template = snapshot.template(defaults)
+    print(f'reset template     {timed(snapshot.apply, template):6.1f}us')
+
+
+if __name__ == '__main__':
+    main()
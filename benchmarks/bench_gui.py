@@ -0,0 +1,274 @@
+'''Drive the application with synthetic input and time what users feel
+
+Run from the repository root:
+
+    python -m benchmarks.bench_gui [--output gui_benchmark.json] [--repeat 200]
+
+Without a DISPLAY (or with --xvfb) the application runs on a private Xvfb
+server. Keystrokes are sent with event_generate, so each timing covers
+Tk's own handling of the key as well as our validation. Measured:
+
+    keystroke latency on the DateEntry, and on the Time and Plot
+    ValidatedComboboxes
+    filling in a valid record and saving it
+    resetting the form, and the same reset done one variable at a time
+    and with VariableSnapshot.set(), for comparison
+    typing into a Notes field already holding a large note
+    cold startup in a fresh interpreter, to the first drawn window
+
+The results are written as JSON with p50/p95/p99 per measurement, plus
+the Python and Tk versions and the commit, so runs can be compared.
+'''
+from contextlib import contextmanager
+from pathlib import Path
+from time import perf_counter, sleep
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+
+from instrument import Profile
+
+ROOT = Path(__file__).resolve().parent.parent
+
+RECORD = {
+    'Date': '2026-10-18', 'Time': '8:00', 'Technician': 'J Simms',
+    'Lab': 'A', 'Plot': '12', 'Seed Sample': 'AX0012',
+    'Humidity': '24.5', 'Light': '50.25', 'Temperature': '21.3',
+    'Equipment Fault': '0', 'Plants': '9', 'Blossoms': '210', 'Fruit': '31',
+    'Min Height': '5.5', 'Max Height': '14.25', 'Med Height': '9.75',
+    'Notes': 'Some leaf curl on the west edge',
+}
+
+# Run in a fresh interpreter to time startup, printing seconds taken
+STARTUP = '''
+from time import perf_counter
+start = perf_counter()
+import data_entry_app
+app = data_entry_app.Application()
+app.update()
+print(perf_counter() - start)
+app.destroy()
+'''
+
+KEYSYMS = {'-': 'minus', ':': 'colon', '.': 'period', ' ': 'space'}
+
+
+@contextmanager
+def virtual_display(force=False):
+    """Run inside an Xvfb server unless a display is already there"""
+    if os.environ.get('DISPLAY') and not force:
+        yield os.environ['DISPLAY']
+        return
+    number = 99
+    while Path(f'/tmp/.X{number}-lock').exists():
+        number += 1
+    display = f':{number}'
+    server = subprocess.Popen(
+        ['Xvfb', display, '-screen', '0', '1280x1024x24', '-nolisten', 'tcp'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    socket = Path(f'/tmp/.X11-unix/X{number}')
+    deadline = perf_counter() + 10
+    while not socket.exists():
+        if server.poll() is not None or perf_counter() > deadline:
+            server.kill()
+            raise RuntimeError(f'Xvfb did not start on {display}')
+        sleep(.05)
+    previous = os.environ.get('DISPLAY')
+    os.environ['DISPLAY'] = display
+    try:
+        yield display
+    finally:
+        server.terminate()
+        server.wait()
+        if previous is None:
+            del os.environ['DISPLAY']
+        else:
+            os.environ['DISPLAY'] = previous
+
+
+def type_text(widget, text, profile=None, name=None):
+    """Send a keystroke per character, timing each one"""
+    for char in text:
+        keysym = KEYSYMS.get(char, char)
+        start = perf_counter()
+        widget.event_generate('<KeyPress>', keysym=keysym)
+        widget.update_idletasks()
+        if profile is not None:
+            profile.record(name, perf_counter() - start)
+
+
+def focus(app, widget):
+    widget.focus_force()
+    app.update()
+
+
+def bench_keystrokes(app, profile, repeat):
+    inputs = app.recordform.inputs
+    cases = [
+        ('keystroke DateEntry', inputs['Date'].input, '2026-10-18'),
+        ('keystroke ValidatedCombobox Time', inputs['Time'].input, '12:00'),
+        ('keystroke ValidatedCombobox Plot', inputs['Plot'].input, '12'),
+    ]
+    for name, widget, text in cases:
+        focus(app, widget)
+        for _ in range(max(1, repeat // len(text))):
+            widget.delete(0, 'end')
+            type_text(widget, text, profile, name)
+    app.recordform.reset()
+
+
+def bench_save(app, profile, repeat):
+    form = app.recordform
+    first = datetime.date(2000, 1, 1)
+    for i in range(repeat):
+        # A new Date each time, so no save stops to ask about a duplicate
+        record = dict(RECORD, Date=(first + datetime.timedelta(i)).isoformat())
+        start = perf_counter()
+        form.restore(record)
+        app._on_save()
+        app.update_idletasks()
+        profile.record('fill and save', perf_counter() - start)
+        form.restore(RECORD)
+        start = perf_counter()
+        form.reset()
+        app.update_idletasks()
+        profile.record('reset', perf_counter() - start)
+    # Let the background saves finish so they don't skew what follows
+    while app.savequeue and app.savequeue.pending():
+        app.update()
+
+
+def bench_reset(app, profile, repeat):
+    """Time the ways of resetting a filled form with its widgets live
+
+    bench_form_snapshot times the variables alone, where setting them one
+    at a time is fastest. Here each variable also has widgets and
+    validation attached, which the snapshot and the template write to
+    only once.
+    """
+    form = app.recordform
+    defaults = form._defaults
+    def per_variable():
+        for key, var in form._vars.items():
+            var.set(defaults[key])
+    cases = [
+        ('reset per variable', per_variable),
+        ('reset snapshot', lambda: form._snapshot.set(defaults)),
+        ('reset template', form.reset),
+    ]
+    for _ in range(repeat):
+        for name, reset in cases:
+            form.restore(RECORD)
+            app.update_idletasks()
+            start = perf_counter()
+            reset()
+            app.update_idletasks()
+            profile.record(name, perf_counter() - start)
+    form.reset()
+
+
+def bench_notes(app, profile, repeat, size=200000):
+    notes = app.recordform.inputs['Notes'].input
+    app.recordform.restore({'Notes': 'x' * size})
+    focus(app, notes)
+    notes.mark_set('insert', 'end')
+    start = perf_counter()
+    type_text(notes, 'a' * repeat)
+    seconds = perf_counter() - start
+    profile.record('BoundText keystroke, large note', seconds / repeat)
+    start = perf_counter()
+    notes.sync()
+    profile.record('BoundText sync, large note', perf_counter() - start)
+    app.recordform.reset()
+    return repeat / seconds
+
+
+def bench_startup(directory, runs):
+    """Return [(seconds in the interpreter, seconds wall clock)]"""
+    env = dict(os.environ, PYTHONPATH=str(ROOT))
+    times = []
+    for _ in range(runs):
+        start = perf_counter()
+        output = subprocess.run(
+            [sys.executable, '-c', STARTUP], cwd=directory, env=env,
+            check=True, capture_output=True, text=True
+        ).stdout
+        times.append((float(output.split()[-1]), perf_counter() - start))
+    return times
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--output', default='gui_benchmark.json')
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--startup-runs', type=int, default=10)
+    parser.add_argument(
+        '--xvfb', action='store_true',
+        help='use Xvfb even when there is a display'
+    )
+    args = parser.parse_args(argv)
+    output = Path(args.output).resolve()
+
+    profile = Profile()
+    with virtual_display(args.xvfb), tempfile.TemporaryDirectory() as directory:
+        # The application keeps its files in the working directory
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            from data_entry_app import Application
+            app = Application()
+            while not app.recordform.built():
+                app.update()
+            tk_version = app.tk.call('info', 'patchlevel')
+            bench_keystrokes(app, profile, args.repeat)
+            bench_save(app, profile, args.repeat)
+            bench_reset(app, profile, args.repeat)
+            typing_rate = bench_notes(app, profile, args.repeat)
+            app.destroy()
+        finally:
+            os.chdir(cwd)
+        for inside, wall in bench_startup(directory, args.startup_runs):
+            profile.record('cold startup', inside)
+            profile.record('cold startup, with interpreter', wall)
+
+    results = {
+        'meta': {
+            'time': datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit': _commit(),
+            'python': platform.python_version(),
+            'tk': tk_version,
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+        },
+        'results': profile.summary(),
+        'notes_chars_per_second': typing_rate,
+    }
+    with open(output, 'w') as fh:
+        json.dump(results, fh, indent=1)
+    for name, stats in results['results'].items():
+        print(
+            f'{name:<40} p50={stats["p50_ms"]:8.3f}ms '
+            f'p95={stats["p95_ms"]:8.3f}ms p99={stats["p99_ms"]:8.3f}ms'
+        )
+    print(f'{"Notes typing":<40} {typing_rate:.0f} chars/s')
+    print(f'written to {output}')
+
+
+if __name__ == '__main__':
+    main()
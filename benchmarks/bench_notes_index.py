@@ -0,0 +1,102 @@
+'''Time building and searching the notes index over years of daily files
+
+Run from the repository root:
+
+    python -m benchmarks.bench_notes_index [days] [records per day] [jobs]
+
+Compares indexing every file in this process with the process pool of a
+rebuild, then times an incremental update after one more day of saves
+and term and phrase queries against a plain scan of every file.
+'''
+from datetime import date, timedelta
+from pathlib import Path
+import csv
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_analytics import make_files
+from benchmarks.common import sample_record, timed, report
+from models import RecordStore
+from notes_index import NotesIndex
+from schema import RECORD_SCHEMA
+
+PHRASES = [
+    'powdery mildew on lower leaves', 'sensor reset after power cut',
+    'aphids near the door', 'irrigation line leaking', 'leaf curl',
+    'fruit split after watering', 'humidity sensor reset twice',
+    'light meter drift', 'seedlings wilting', 'mould on the trays',
+]
+
+QUERIES = ['mildew', 'sensor reset', '"sensor reset"', 'leaf curl', 'zebra']
+
+
+def add_notes(directory, rng):
+    """Give a third of the records notes, rewriting each file"""
+    for path in sorted(directory.glob('abq_data_record_*.csv')):
+        with open(path, newline='') as fh:
+            rows = list(csv.DictReader(fh))
+        for row in rows:
+            if rng.random() < .33:
+                row['Notes'] = rng.choice(PHRASES)
+        with open(path, 'w', newline='') as fh:
+            writer = csv.DictWriter(fh, fieldnames=RECORD_SCHEMA.names)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def grep(directory, phrase):
+    """Search the way it was done before the index"""
+    count = 0
+    for path in directory.glob('abq_data_record_*.csv'):
+        with open(path, newline='') as fh:
+            for row in csv.DictReader(fh):
+                count += phrase in row['Notes'].lower()
+    return count
+
+
+def main(days=365 * 3, per_day=100, jobs=None):
+    total = days * per_day
+    rng = random.Random(2)
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        make_files(directory, days, per_day)
+        add_notes(directory, rng)
+
+        index = NotesIndex(directory)
+        seconds, _ = timed(index.update_all)
+        report('index in this process', total, seconds)
+        seconds, postings = timed(index.rebuild, jobs)
+        report('rebuild in a process pool', total, seconds)
+        print(f'    {postings} postings')
+
+        datestring = (date(2025, 1, 1) + timedelta(days=days)).isoformat()
+        with RecordStore(
+            directory, fields=RECORD_SCHEMA.types, index=False
+        ) as store:
+            for i in range(per_day):
+                record = sample_record(i, rng)
+                record['Notes'] = rng.choice(PHRASES)
+                store.write(record, datestring)
+                start = time.perf_counter()
+                index.update(store._filename(datestring))
+                seconds = time.perf_counter() - start
+        report('update after a save (last of the day)', 1, seconds)
+
+        for query in QUERIES:
+            best = min(
+                timed(index.search, query, 1000)[0] for _ in range(5)
+            )
+            count = len(index.search(query, 1000))
+            print(f'{"search " + query:<40} {count:>9} found {best * 1000:8.2f}ms')
+        seconds, count = timed(grep, directory, 'sensor reset')
+        print(f'{"scan every file for sensor reset":<40} {count:>9} found {seconds * 1000:8.2f}ms')
+        index.close()
+
+
+if __name__ == '__main__':
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 365 * 3
+    per_day = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    jobs = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    main(days, per_day, jobs)
@@ -0,0 +1,52 @@
+'''How quickly RecordFile opens a large daily file, and what it holds
+
+    python -m benchmarks.bench_record_file [records]
+
+Writes a file of 500,000 records by default (one in every thousand with a
+multi-line Notes field), then times opening it and reading random pages
+the way RecordList does.
+'''
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.common import sample_record, timed
+from models import RecordFile, RecordStore
+
+PAGE_SIZE = 200
+
+
+def main(count=500000):
+    with tempfile.TemporaryDirectory() as directory:
+        with RecordStore(directory, flush_every=10000) as store:
+            for i in range(count):
+                record = sample_record(i)
+                if not i % 1000:
+                    record['Notes'] = 'Mildew on\nplot, "see" photo'
+                store.write(record)
+            filename = store.filename
+        seconds, recordfile = timed(RecordFile, filename)
+        print(f'open {len(recordfile)} rows: {seconds * 1000:.1f}ms')
+        tracemalloc.start()
+        held = RecordFile(filename)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del held
+        print(f'memory held: {current / 2**20:.1f}MiB '
+              f'(peak {peak / 2**20:.1f}MiB)')
+        latencies = []
+        for _ in range(200):
+            start = random.randrange(len(recordfile))
+            begin = time.perf_counter()
+            recordfile.rows(start, start + PAGE_SIZE)
+            latencies.append(time.perf_counter() - begin)
+        latencies.sort()
+        print(f'random page of {PAGE_SIZE}: median '
+              f'{latencies[len(latencies) // 2] * 1000:.2f}ms, '
+              f'max {latencies[-1] * 1000:.2f}ms')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500000)
@@ -0,0 +1,49 @@
+'''Key lookups through RecordIndex compared with scanning the CSV
+
+    python -m benchmarks.bench_record_index [records]
+'''
+import csv
+import random
+import sys
+import tempfile
+
+from benchmarks.common import sample_record, timed
+from models import RecordIndex, RecordStore
+
+LOOKUPS = 200
+
+
+def scan(filename, key):
+    with open(filename, newline='') as fh:
+        for row in csv.DictReader(fh):
+            if (row['Date'], row['Time'], row['Lab'], row['Plot']) == key:
+                return row
+
+
+def main(count=500000):
+    with tempfile.TemporaryDirectory() as directory:
+        keys = []
+        with RecordStore(directory, flush_every=10000) as store:
+            for i in range(count):
+                record = sample_record(i)
+                record['Plot'] = str(i)
+                store.write(record)
+                keys.append((record['Date'], record['Time'],
+                             record['Lab'], record['Plot']))
+            filename = store.filename
+        seconds, index = timed(RecordIndex, filename)
+        print(f'load sidecar index of {len(index)} keys: '
+              f'{seconds * 1000:.1f}ms')
+        index.rebuild()
+        seconds, _ = timed(index.rebuild)
+        print(f'rebuild index: {seconds * 1000:.1f}ms')
+        sample = random.sample(keys, LOOKUPS)
+        seconds, _ = timed(lambda: [index.get(k) for k in sample])
+        print(f'indexed lookup: {seconds / LOOKUPS * 1000:.3f}ms each')
+        sample = sample[:5]
+        seconds, _ = timed(lambda: [scan(filename, k) for k in sample])
+        print(f'full scan lookup: {seconds / len(sample) * 1000:.3f}ms each')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500000)
@@ -0,0 +1,59 @@
+'''Compare RecordStore with opening the daily file on every save
+
+Run from the repository root:
+
+    python -m benchmarks.bench_record_store [records] [directory]
+
+Pass a directory on the slow network share to measure the real thing.
+'''
+from pathlib import Path
+import csv
+import sys
+import tempfile
+
+from benchmarks.common import sample_record, timed, report
+from models import RecordStore, daily_filename
+
+
+def save_per_open(directory, records):
+    """The original Application._on_save behaviour"""
+    for data in records:
+        filename = daily_filename(directory=directory)
+        newfile = not Path(filename).exists()
+        with open(filename, 'a', newline='') as fh:
+            csvwriter = csv.DictWriter(fh, fieldnames=data.keys())
+            if newfile:
+                csvwriter.writeheader()
+            csvwriter.writerow(data)
+
+
+def save_record_store(directory, records, **kwargs):
+    with RecordStore(directory, **kwargs) as store:
+        for data in records:
+            store.write(data)
+
+
+def main(count=20000, base=None):
+    records = [sample_record(i) for i in range(count)]
+    cases = [
+        ('open per save', save_per_open, {}),
+        ('RecordStore flush every record', save_record_store, {}),
+        ('RecordStore flush every 100', save_record_store,
+         {'flush_every': 100}),
+        ('RecordStore flush every 250ms', save_record_store,
+         {'flush_every': count + 1, 'flush_interval': 250}),
+        ('RecordStore fsync every record', save_record_store,
+         {'fsync': True}),
+        ('RecordStore fsync every 100', save_record_store,
+         {'flush_every': 100, 'fsync': True}),
+    ]
+    for name, func, kwargs in cases:
+        with tempfile.TemporaryDirectory(dir=base) as directory:
+            seconds, _ = timed(func, directory, records, **kwargs)
+        report(name, count, seconds)
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    base = sys.argv[2] if len(sys.argv) > 2 else None
+    main(count, base)
@@ -0,0 +1,65 @@
+'''Cost of passing a whole record through a Tk variable
+
+    python -m benchmarks.bench_record_var
+
+Compares the JSONVar of tkinter_classes_demo.py, which encodes on every
+set() and decodes on every get(), with variables.RecordVar, which caches
+the decoded record and skips writes that change nothing. Runs on a Tcl
+interpreter without a display, with a write trace that reads the record
+back as the demo's Application does.
+'''
+import time
+import tkinter as tk
+
+from benchmarks.common import sample_record
+from tkinter_classes_demo import JSONVar
+from variables import RecordVar
+
+ROUNDS = 20000
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        func(*args)
+    return (time.perf_counter() - start) / ROUNDS * 1e6
+
+
+def main():
+    root = tk.Tcl()
+    records = [sample_record(i) for i in range(2)]
+    records[1]['Notes'] = 'Some leaf curl on the west edge. ' * 10
+    print(f'{"":<34} {"JSONVar":>10} {"RecordVar":>10}')
+    for cls in (JSONVar, RecordVar):
+        var = cls(root)
+        var.set(records[0])
+        assert dict(var.get()) == records[0]
+    results = {}
+    for cls in (JSONVar, RecordVar):
+        var = cls(root)
+        fired = []
+        var.trace_add('write', lambda *_: fired.append(var.get()))
+        flip = iter(range(2 * ROUNDS))
+        results[cls] = {
+            'set, a new record each time': timed(
+                lambda: var.set(records[next(flip) % 2])
+            ),
+        }
+        del fired[:]
+        results[cls]['set, the same record again'] = timed(
+            var.set, records[0]
+        )
+        results[cls]['traces fired, same record'] = len(fired)
+        results[cls]['get'] = timed(var.get)
+        results[cls]['get x10 (a trace per field)'] = timed(
+            lambda: [var.get() for _ in range(10)]
+        )
+    for name in results[JSONVar]:
+        old, new = results[JSONVar][name], results[RecordVar][name]
+        if name.startswith('traces'):
+            print(f'{name:<34} {old:>10} {new:>10}')
+        else:
+            print(f'{name:<34} {old:>8.2f}us {new:>8.2f}us')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+'''Time from clicking Save until the form is usable again
+
+Compares writing on the Tk thread with handing the record to SaveQueue.
+A delay per write stands in for a slow or busy disk:
+
+    python -m benchmarks.bench_save_latency [records] [delay_ms]
+
+To measure the real application, run it with ABQ_SAVE_LATENCY=1 set; it
+prints the same figures on exit. Set Application.background_saves to
+False for the synchronous numbers.
+'''
+import sys
+import tempfile
+import time
+
+from benchmarks.common import sample_record
+from models import RecordStore, SaveQueue
+
+
+class SlowStore(RecordStore):
+    """A RecordStore that sleeps on every write"""
+
+    def __init__(self, *args, delay=0.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.delay = delay
+
+    def write(self, data, datestring=None):
+        time.sleep(self.delay)
+        super().write(data, datestring)
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+    return (
+        f'p50={pct(.5):8.3f}ms p95={pct(.95):8.3f}ms '
+        f'max={latencies[-1]:8.3f}ms'
+    )
+
+
+def synchronous(store, records):
+    latencies = []
+    for data in records:
+        start = time.perf_counter()
+        store.write(data)
+        latencies.append((time.perf_counter() - start) * 1000)
+    store.close()
+    return latencies
+
+
+def background(store, records):
+    latencies = []
+    savequeue = SaveQueue(store)
+    for data in records:
+        start = time.perf_counter()
+        savequeue.submit(data)
+        latencies.append((time.perf_counter() - start) * 1000)
+    savequeue.close()
+    while not savequeue.results.empty():
+        data, error = savequeue.results.get()
+        if error is not None:
+            raise error
+    return latencies
+
+
+def main(count=200, delay_ms=20):
+    records = [sample_record(i) for i in range(count)]
+    for name, func in (('synchronous', synchronous),
+                       ('background', background)):
+        with tempfile.TemporaryDirectory() as directory:
+            store = SlowStore(directory, delay=delay_ms / 1000)
+            latencies = func(store, records)
+        print(f'{name:<12} {count} saves, {delay_ms}ms disk: '
+              f'{percentiles(latencies)}')
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    delay_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 20
+    main(count, delay_ms)
@@ -0,0 +1,57 @@
+'''Compare the memory held by saved records as dicts and in a SessionBuffer
+
+Run from the repository root:
+
+    python -m benchmarks.bench_session [records]
+
+Memory is measured with tracemalloc, so it counts everything allocated
+to hold the records (the dicts and their boxed values, or the columns
+and string tables).
+'''
+import random
+import sys
+import tracemalloc
+
+from benchmarks.common import sample_record, timed, report
+from session import SessionBuffer
+
+
+def measure(build, *args):
+    """Return (seconds, bytes still allocated, result) for build(*args)"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        seconds, result = timed(build, *args)
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return seconds, after - before, result
+
+
+def as_dicts(count, rng):
+    return [sample_record(i, rng) for i in range(count)]
+
+
+def as_buffer(count, rng):
+    buffer = SessionBuffer()
+    for i in range(count):
+        buffer.append(sample_record(i, rng))
+    return buffer
+
+
+def main(count=1000000):
+    results = {}
+    for name, build in (('dicts', as_dicts), ('SessionBuffer', as_buffer)):
+        seconds, size, records = measure(build, count, random.Random(1))
+        report(f'{name} build', count, seconds)
+        print(f'    {size / 2 ** 20:8.1f} MiB, {size / count:6.1f} bytes/record')
+        results[name] = records
+    buffer = results['SessionBuffer']
+    seconds, _ = timed(lambda: [record['Humidity'] for record in buffer])
+    report('SessionBuffer row view reads', count, seconds)
+    seconds, _ = timed(lambda: sum(buffer.column('Humidity')))
+    report('SessionBuffer column sum', count, seconds)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,87 @@
+'''Compare writers sharing one daily file with writers using shards
+
+Run from the repository root:
+
+    python -m benchmarks.bench_shards [records per writer] [writers] [directory]
+
+Each writer is a separate process saving records the way the form does,
+flushing every record. Sharing a file is the original behaviour and
+also reports the damage done: extra header rows and broken rows. The
+shard case then times merge_shards() building the daily file.
+'''
+from multiprocessing import Process
+import csv
+import sys
+import tempfile
+
+from benchmarks.bench_record_store import save_per_open
+from benchmarks.common import sample_record, timed, report
+from models import ShardStore, daily_filename, merge_shards
+from schema import RECORD_SCHEMA
+
+
+def shared_writer(directory, count, number):
+    save_per_open(directory, [sample_record(i) for i in range(count)])
+
+
+def shard_writer(directory, count, number):
+    records = [sample_record(i) for i in range(count)]
+    with ShardStore(
+        directory, fields=RECORD_SCHEMA.types, writer=f'writer{number}'
+    ) as store:
+        for data in records:
+            store.write(data)
+
+
+def run_writers(target, directory, count, writers):
+    processes = [
+        Process(target=target, args=(directory, count, number))
+        for number in range(writers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+def damage(filename):
+    """Count repeated headers and rows with the wrong number of fields"""
+    headers = broken = rows = 0
+    with open(filename, newline='') as fh:
+        reader = csv.reader(fh)
+        header = next(reader)
+        for row in reader:
+            rows += 1
+            if row == header:
+                headers += 1
+            elif len(row) != len(header):
+                broken += 1
+    return rows - headers - broken, headers, broken
+
+
+def main(count=5000, writers=8, base=None):
+    total = count * writers
+    with tempfile.TemporaryDirectory(dir=base) as directory:
+        seconds, _ = timed(
+            run_writers, shared_writer, directory, count, writers
+        )
+        report(f'{writers} writers, one shared file', total, seconds)
+        good, headers, broken = damage(daily_filename(directory=directory))
+        print(
+            f'    {good} good rows, {total - good} lost or damaged, '
+            f'{headers} extra headers, {broken} broken rows'
+        )
+    with tempfile.TemporaryDirectory(dir=base) as directory:
+        seconds, _ = timed(run_writers, shard_writer, directory, count, writers)
+        report(f'{writers} writers, one shard each', total, seconds)
+        seconds, filename = timed(merge_shards, directory=directory)
+        report('merge_shards', total, seconds)
+        good, headers, broken = damage(filename)
+        print(f'    {good} good rows, {total - good} lost or damaged')
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    writers = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    base = sys.argv[3] if len(sys.argv) > 3 else None
+    main(count, writers, base)
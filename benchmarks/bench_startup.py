@@ -0,0 +1,105 @@
+'''Time cold startup and break the import time down by module
+
+Run from the repository root:
+
+    python -m benchmarks.bench_startup [runs] [--xvfb]
+
+The import breakdown comes from python -X importtime and needs no
+display. With a display (or Xvfb) each run also starts the Application
+in a fresh interpreter and reports how long until the first frame is
+drawn and until the staged form is complete.
+'''
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.bench_gui import ROOT, virtual_display
+from instrument import Profile
+
+# Print seconds to the first frame and to the finished form
+STARTUP = '''
+from time import perf_counter
+start = perf_counter()
+import data_entry_app
+app = data_entry_app.Application()
+app.update()
+first = perf_counter() - start
+while not app.recordform.built():
+    app.update()
+print(first, perf_counter() - start)
+app.destroy()
+'''
+
+
+def import_times(module='data_entry_app'):
+    """Return the time to import module and [(cumulative us, own us,
+    name)] for each module it imports directly"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    children = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        # Imports are listed after the ones they trigger, indented two
+        # spaces more than the module importing them
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children.append((int(cumulative), int(own), name.strip()))
+        elif depth == 0:
+            if name.strip() == module:
+                return int(cumulative), sorted(children, reverse=True)
+            children = []
+    return 0, []
+
+
+def startup_times(runs):
+    env = dict(os.environ, PYTHONPATH=str(ROOT))
+    times = []
+    with tempfile.TemporaryDirectory() as directory:
+        for _ in range(runs):
+            output = subprocess.run(
+                [sys.executable, '-c', STARTUP], cwd=directory, env=env,
+                capture_output=True, text=True, check=True
+            ).stdout
+            first, built = map(float, output.split()[-2:])
+            times.append((first, built))
+    return times
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('runs', nargs='?', type=int, default=10)
+    parser.add_argument('--xvfb', action='store_true')
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args(argv)
+
+    total, times = import_times()
+    print(f'import data_entry_app: {total / 1000:.1f}ms')
+    for cumulative, own, name in times[:args.top]:
+        print(f'    {name:<30} {cumulative / 1000:8.2f}ms ({own / 1000:.2f}ms own)')
+
+    if not os.environ.get('DISPLAY') and not args.xvfb:
+        try:
+            subprocess.run(['Xvfb', '-help'], capture_output=True)
+        except OSError:
+            print('No display and no Xvfb, skipping the window timings')
+            return
+    profile = Profile()
+    with virtual_display(args.xvfb):
+        for first, built in startup_times(args.runs):
+            profile.record('first frame', first)
+            profile.record('form complete', built)
+    for name, stats in profile.summary().items():
+        print(
+            f'{name:<30} p50={stats["p50_ms"]:8.1f}ms '
+            f'max={stats["max_ms"]:8.1f}ms'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+'''Insert throughput and query latency of the storage backends
+
+    python -m benchmarks.bench_storage [records] [directory]
+
+The default is 1,000,000 records per backend. Records are written in
+flush groups of 1000, then the records for one Lab and Plot are queried.
+'''
+from pathlib import Path
+import sys
+import tempfile
+import time
+
+from benchmarks.common import sample_record, timed, report
+from models import make_storage, today
+from schema import RECORD_SCHEMA
+
+QUERIES = 10
+
+
+def write_all(store, records):
+    for record in records:
+        store.write(record)
+    store.flush()
+
+
+def main(count=1000000, base=None):
+    records = [sample_record(i) for i in range(count)]
+    for record in records:
+        record['Date'] = today()
+    for backend in ('csv', 'sqlite'):
+        with tempfile.TemporaryDirectory(dir=base) as directory:
+            kwargs = {'directory': directory} if backend == 'csv' else {
+                'filename': Path(directory) / 'records.db'
+            }
+            store = make_storage(
+                backend, fields=RECORD_SCHEMA.types, flush_every=1000, **kwargs
+            )
+            seconds, _ = timed(write_all, store, records)
+            report(f'{backend} insert', count, seconds)
+            latencies = []
+            for i in range(QUERIES):
+                start = time.perf_counter()
+                found = list(store.records(Lab='ABC'[i % 3], Plot=i + 1))
+                latencies.append(time.perf_counter() - start)
+            store.close()
+            latencies.sort()
+            print(f'{backend} query Lab/Plot: {len(found)} rows, '
+                  f'median {latencies[len(latencies) // 2] * 1000:.1f}ms')
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    base = sys.argv[2] if len(sys.argv) > 2 else None
+    main(count, base)
@@ -0,0 +1,109 @@
+'''Upload throughput and recovery against a local collection server
+
+Run from the repository root:
+
+    python -m benchmarks.bench_sync [records] [batch sizes...]
+
+Fills an outbox and times draining it through the Uploader at each
+batch size, over one keep-alive connection to a CollectionServer on the
+loopback interface. Then it takes the server away for a while as
+records keep arriving, printing the outbox depth as it grows and drains,
+and checks that every record was stored exactly once.
+'''
+from pathlib import Path
+import socket
+import sys
+import tempfile
+import time
+
+from benchmarks.common import sample_record, timed, report
+from collection_server import CollectionServer
+from sync import Outbox, Uploader
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def fill(outbox, count, start=0):
+    records = []
+    for i in range(start, start + count):
+        record = sample_record(i)
+        record['Plot'] = str(i)
+        records.append(record)
+    outbox.append(records, '2026-10-18')
+
+
+def stored(directory, client):
+    with open(Path(directory) / f'{client}.jsonl') as fh:
+        return [line for line in fh]
+
+
+def throughput(directory, count, batch_sizes):
+    server = CollectionServer(directory=f'{directory}/collected')
+    server.serve_in_thread()
+    for size in batch_sizes:
+        outbox = Outbox(f'{directory}/outbox{size}.bin')
+        fill(outbox, count)
+        uploader = Uploader(outbox, server.url, f'bench{size}', size)
+        seconds, sent = timed(uploader.drain)
+        report(f'drain, batches of {size}', sent, seconds)
+        outbox.close()
+    server.shutdown()
+    server.server_close()
+
+
+def outage(directory, rate=500, down=3, seconds=8):
+    """Save rate records a second, with the server away for a while"""
+    port = free_port()
+    url = f'http://127.0.0.1:{port}/records'
+    outbox = Outbox(f'{directory}/outage.bin')
+    uploader = Uploader(
+        outbox, url, 'outage', retry_delay=.1, max_delay=1
+    ).start()
+    server = None
+    saved = 0
+    caught_up = None
+    start = time.monotonic()
+    next_report = 0
+    while time.monotonic() - start < seconds or outbox.depth:
+        elapsed = time.monotonic() - start
+        if server is None and elapsed >= down:
+            server = CollectionServer(
+                ('127.0.0.1', port), f'{directory}/collected'
+            )
+            server.serve_in_thread()
+        elif server and caught_up is None and outbox.depth <= rate // 10:
+            caught_up = elapsed - down
+        if elapsed < seconds:
+            fill(outbox, rate // 10, saved)
+            saved += rate // 10
+            uploader.wake()
+        if elapsed >= next_report:
+            print(f'    {elapsed:4.1f}s  {uploader.status()}')
+            next_report += 1
+        time.sleep(.1)
+    uploader.stop()
+    outbox.close()
+    count = len(stored(f'{directory}/collected', 'outage'))
+    print(
+        f'    {saved} saved, {count} stored, caught up {caught_up:.1f}s '
+        'after the server came back'
+    )
+    server.shutdown()
+    server.server_close()
+
+
+def main(count=50000, batch_sizes=(50, 500, 2000)):
+    with tempfile.TemporaryDirectory() as directory:
+        throughput(directory, count, batch_sizes)
+        print('server away for the first 3s of 8, 500 records/s saved:')
+        outage(directory)
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    sizes = [int(a) for a in sys.argv[2:]] or (50, 500, 2000)
+    main(count, sizes)
@@ -0,0 +1,39 @@
+'''Helpers shared by the benchmark scripts'''
+import random
+import time
+
+
+def sample_record(i=0, rng=random):
+    """Return a record shaped like DataRecordForm.get() output"""
+    return {
+        'Date': '2026-10-18',
+        'Time': rng.choice(['8:00', '12:00', '16:00', '20:00']),
+        'Technician': f'Tech {i % 7}',
+        'Lab': rng.choice('ABC'),
+        'Plot': str(i % 20 + 1),
+        'Seed Sample': f'AX{i % 1000:04d}',
+        'Humidity': round(rng.uniform(0.5, 52.0), 2),
+        'Light': round(rng.uniform(0, 100), 2),
+        'Temperature': round(rng.uniform(4, 40), 2),
+        'Equipment Fault': False,
+        'Plants': rng.randint(0, 20),
+        'Blossoms': rng.randint(0, 1000),
+        'Fruit': rng.randint(0, 1000),
+        'Min Height': round(rng.uniform(0, 10), 2),
+        'Max Height': round(rng.uniform(10, 20), 2),
+        'Med Height': round(rng.uniform(5, 15), 2),
+        'Notes': '',
+    }
+
+
+def timed(func, *args, **kwargs):
+    """Call func and return (seconds taken, result)"""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def report(name, count, seconds, unit='records'):
+    """Print a throughput line"""
+    rate = count / seconds if seconds else float('inf')
+    print(f'{name:<40} {count:>9} {unit} {seconds:8.3f}s {rate:12.0f}/s')
@@ -0,0 +1,193 @@
+'''Import records into the daily files without the form
+
+    python -m bulk_import readings.csv more.jsonl --errors rejects.csv
+
+Input is CSV with a header row, or JSON lines with one object per record
+(chosen by extension, or with --format); '-' reads standard input. Each
+batch of records is checked column by column with the schema's rules,
+good records are appended to abq_data_record_<Date>.csv for their own
+Date, and bad ones go to the errors file with the reasons.
+'''
+from itertools import compress, islice
+from pathlib import Path
+import argparse
+import csv
+import json
+import sys
+
+from models import RecordStore
+from schema import RECORD_SCHEMA
+
+
+def read_csv(fh):
+    """Return an iterator of records as lists of strings in schema order"""
+    reader = csv.reader(fh)
+    header = next(reader, None)
+    if header is None or header == RECORD_SCHEMA.names:
+        return reader
+    positions = {name: i for i, name in enumerate(header)}
+    order = [positions.get(n) for n in RECORD_SCHEMA.names]
+    return (
+        [row[i] if i is not None and i < len(row) else '' for i in order]
+        for row in reader
+    )
+
+
+def _text(value):
+    if value is None:
+        return ''
+    return str(value)
+
+
+def read_jsonl(fh):
+    """Yield records as lists of strings in schema order"""
+    names = RECORD_SCHEMA.names
+    for line in fh:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        yield [_text(record.get(name)) for name in names]
+
+
+readers = {'csv': read_csv, 'jsonl': read_jsonl}
+
+
+class Importer:
+    """Validates batches of records and writes them out"""
+
+    def __init__(self, directory='.', errors=None, batch_size=10000):
+        self.directory = Path(directory)
+        self.errors_filename = errors
+        self.batch_size = batch_size
+        self.imported = 0
+        self.rejected = 0
+        # One store for every day: it moves from file to file as the
+        # dates change, so only one daily file is ever open
+        self._store = None
+        self._errors_fh = None
+        self._errors_writer = None
+        self._date = RECORD_SCHEMA.names.index('Date')
+
+    def run(self, rows):
+        """Import every record from an iterable of rows"""
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                break
+            self.import_batch(batch)
+
+    def import_batch(self, batch):
+        """Validate one batch and write out the results"""
+        names = RECORD_SCHEMA.names
+        width = len(names)
+        if any(len(row) != width for row in batch):
+            batch = [(row + [''] * width)[:width] for row in batch]
+        columns = dict(zip(names, map(list, zip(*batch))))
+        errors = RECORD_SCHEMA.check_columns(columns)
+        # Store the fault flag and blanked fields the way the form does
+        faults = RECORD_SCHEMA.faults(columns['Equipment Fault'])
+        columns['Equipment Fault'] = [
+            'True' if row in faults else 'False' for row in range(len(batch))
+        ] if faults else ['False'] * len(batch)
+        for name in RECORD_SCHEMA.fault_fields if faults else ():
+            column = columns[name]
+            for row in faults:
+                column[row] = ''
+        if errors:
+            self._reject(batch, errors)
+            keep = [row not in errors for row in range(len(batch))]
+            columns = {
+                name: list(compress(column, keep))
+                for name, column in columns.items()
+            }
+        rows = list(zip(*columns.values()))
+        dates = set(columns['Date'])
+        store = self._open_store()
+        if len(dates) == 1:
+            store.append_rows(rows, *dates)
+        else:
+            by_date = {}
+            for row in rows:
+                by_date.setdefault(row[self._date], []).append(row)
+            for datestring in sorted(by_date):
+                store.append_rows(by_date[datestring], datestring)
+        self.imported += len(batch) - len(errors)
+
+    def _open_store(self):
+        if self._store is None:
+            # The key index catches up with the new rows the next time
+            # it is opened, so don't pay for it row by row here.
+            self._store = RecordStore(
+                self.directory, fields=RECORD_SCHEMA.types, index=False,
+                flush_every=self.batch_size * 10
+            )
+        return self._store
+
+    def _reject(self, batch, errors):
+        self.rejected += len(errors)
+        if self.errors_filename is None:
+            return
+        if self._errors_writer is None:
+            self._errors_fh = open(self.errors_filename, 'w', newline='')
+            self._errors_writer = csv.writer(self._errors_fh)
+            self._errors_writer.writerow(RECORD_SCHEMA.names + ['Errors'])
+        self._errors_writer.writerows(
+            batch[row] + ['; '.join(
+                f'{name}: {message}' for name, message in messages.items()
+            )]
+            for row, messages in sorted(errors.items())
+        )
+
+    def close(self):
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+        if self._errors_fh is not None:
+            self._errors_fh.close()
+            self._errors_fh = self._errors_writer = None
+
+
+def _format(filename, given):
+    if given:
+        return given
+    return 'jsonl' if filename.endswith(('.jsonl', '.json')) else 'csv'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Import records into the ABQ daily record files'
+    )
+    parser.add_argument('inputs', nargs='+', help="files to import, or '-'")
+    parser.add_argument('--format', choices=sorted(readers))
+    parser.add_argument(
+        '--directory', default='.', help='where the daily files live'
+    )
+    parser.add_argument(
+        '--errors', default='import_errors.csv',
+        help='where rejected records are written'
+    )
+    parser.add_argument('--batch-size', type=int, default=10000)
+    args = parser.parse_args(argv)
+
+    importer = Importer(args.directory, args.errors, args.batch_size)
+    try:
+        for filename in args.inputs:
+            read = readers[_format(filename, args.format)]
+            if filename == '-':
+                importer.run(read(sys.stdin))
+                continue
+            with open(filename, newline='') as fh:
+                importer.run(read(fh))
+    finally:
+        importer.close()
+    print(
+        f'{importer.imported} records imported, '
+        f'{importer.rejected} rejected'
+        + (f' (see {args.errors})' if importer.rejected else ''),
+        file=sys.stderr
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+'''A stand-in for the central collection server, for testing uploads
+
+    python -m collection_server --port 8080 --directory collected
+
+Accepts the gzipped JSON batches sync.Uploader POSTs and appends their
+records to <directory>/<client>.jsonl. It remembers, per client, the
+outbox generation and offset it has stored up to, so records sent again
+after a lost acknowledgement are not stored twice. fail_rate and delay
+make it misbehave on purpose.
+'''
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import argparse
+import gzip
+import json
+import random
+import re
+import threading
+import time
+
+
+class CollectionHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # The reply goes out as headers then body; without this the body
+    # waits on the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        if self.server.verbose:
+            super().log_message(*args)
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        server = self.server
+        if server.delay:
+            time.sleep(server.delay)
+        if random.random() < server.fail_rate:
+            self._reply(503, {'error': 'unavailable'})
+            return
+        try:
+            if self.headers.get('Content-Encoding') == 'gzip':
+                body = gzip.decompress(body)
+            batch = json.loads(body)
+            client = batch['client']
+            generation = batch['generation']
+            entries = list(zip(batch['offsets'], batch['records']))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self._reply(400, {'error': str(e)})
+            return
+        if not re.fullmatch(r'[\w.-]+', client):
+            self._reply(400, {'error': 'bad client name'})
+            return
+        stored = server.store(client, generation, entries)
+        self._reply(200, {'received': len(entries), 'stored': stored})
+
+
+class CollectionServer(ThreadingHTTPServer):
+    """Collects uploaded records into a JSON lines file per client"""
+
+    daemon_threads = True
+
+    def __init__(
+        self, address=('127.0.0.1', 0), directory='collected',
+        fail_rate=0, delay=0, verbose=False
+    ):
+        super().__init__(address, CollectionHandler)
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.fail_rate = fail_rate
+        self.delay = delay
+        self.verbose = verbose
+        self.received = 0
+        self._lock = threading.Lock()
+        self._marks = self._load_marks()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/records'
+
+    def _load_marks(self):
+        try:
+            with open(self.directory / 'marks.json') as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return {}
+
+    def store(self, client, generation, entries):
+        """Append the records not already stored, returning how many"""
+        with self._lock:
+            mark_generation, mark = self._marks.get(client, (-1, -1))
+            if generation < mark_generation:
+                return 0
+            if generation > mark_generation:
+                mark = -1
+            new = [entry for offset, entry in entries if offset > mark]
+            if new:
+                with open(self.directory / f'{client}.jsonl', 'a') as fh:
+                    fh.writelines(
+                        json.dumps(entry, separators=(',', ':')) + '\n'
+                        for entry in new
+                    )
+                self._marks[client] = (generation, entries[-1][0])
+                with open(self.directory / 'marks.json', 'w') as fh:
+                    json.dump(self._marks, fh)
+            self.received += len(new)
+            return len(new)
+
+    def serve_in_thread(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--directory', default='collected')
+    parser.add_argument('--fail-rate', type=float, default=0)
+    parser.add_argument('--delay', type=float, default=0)
+    args = parser.parse_args(argv)
+    server = CollectionServer(
+        (args.host, args.port), args.directory, args.fail_rate, args.delay,
+        verbose=True
+    )
+    print(f'Collecting at {server.url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == '__main__':
+    main()
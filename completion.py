@@ -0,0 +1,72 @@
+'''Prefix lookups for the completing input widgets'''
+from functools import lru_cache
+
+
+class _Node:
+    __slots__ = ('count', 'value', 'folded', 'children')
+
+    def __init__(self, value=None, folded=None):
+        self.count = 0 if value is None else 1
+        self.value = value
+        self.folded = folded
+        self.children = None
+
+
+class PrefixIndex:
+    """Answers how many values start with a prefix, ignoring case
+
+    The trie only branches where two values share a prefix; below that a
+    node just remembers its single value, so lookups cost O(len(prefix))
+    and the index stays small for long lists.
+    """
+
+    def __init__(self, values):
+        self.values = tuple(dict.fromkeys(str(v) for v in values))
+        self._root = _Node()
+        for value in self.values:
+            self._insert(value, value.casefold())
+
+    def __len__(self):
+        return len(self.values)
+
+    def _insert(self, value, folded):
+        node = self._root
+        depth = 0
+        while True:
+            if not node.count:
+                node.count = 1
+                node.value, node.folded = value, folded
+                return
+            if node.children is None:
+                # Second value through here; push the first one down
+                node.children = {}
+                if depth < len(node.folded):
+                    node.children[node.folded[depth]] = _Node(
+                        node.value, node.folded
+                    )
+            node.count += 1
+            if depth == len(folded):
+                return
+            node = node.children.setdefault(folded[depth], _Node())
+            depth += 1
+
+    def match(self, prefix):
+        """Return the number of values starting with prefix, and the
+        first of them"""
+        prefix = prefix.casefold()
+        node = self._root
+        for depth, char in enumerate(prefix):
+            if node.children is None:
+                if node.count and node.folded.startswith(prefix):
+                    return 1, node.value
+                return 0, None
+            node = node.children.get(char)
+            if node is None:
+                return 0, None
+        return node.count, node.value
+
+
+@lru_cache(maxsize=32)
+def prefix_index(values):
+    """Return the PrefixIndex for a tuple of values, shared between widgets"""
+    return PrefixIndex(values)
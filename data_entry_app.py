@@ -1,36 +1,113 @@
 '''The ABQ Data Entry application'''
-from cgitb import text
-from datetime import datetime
-from operator import truediv
+from collections import OrderedDict, deque
 from pathlib import Path
-import csv
-from re import L
+import argparse
+from time import perf_counter
+import os
+import queue
+import sqlite3
+import sys
+import threading
 import tkinter as tk
 from tkinter import ttk
-from ttkthemes import ThemedTk
+
+from archive import day_files, day_name, locate, rotate
+from completion import prefix_index
+import instrument
+from journal import Journal
+from models import (
+    RecordFile, SavedKeys, SaveQueue, Storage, backends, daily_filename,
+    make_storage, merge_shards, shard_directory, shard_name, today
+)
+from notes_index import NotesIndex
+from schema import RECORD_SCHEMA, Field
+from session import SessionBuffer
+from stats import DailyStats
+from variables import VariableSnapshot
+
+def _common_prefix(a, b):
+    """Return the length of the longest common prefix of a and b"""
+    low, high = 0, min(len(a), len(b))
+    # Compare slices rather than characters so the work happens in C
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[low:middle] == b[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
 
 class BoundText(tk.Text):
-    """A Text widget with a bound variable"""
+    """A Text widget with a bound variable
+
+    Typing is copied to the variable once it pauses for sync_delay
+    milliseconds, on focus out, or when sync() is called. Writes to the
+    variable from elsewhere only replace the part of the text that
+    changed, and the widget's own writes are not echoed back.
+    """
+    sync_delay = 300
+
     def __init__(self, *args, textvariable=None, **kwargs):
         super().__init__(*args, **kwargs)
         self._variable = textvariable
+        self._content = ''
+        self._pending = None
         if self._variable:
-            self.insert('1.0', self._variable.get())
+            self._content = self._variable.get()
+            self.insert('1.0', self._content)
+            self.edit_modified(False)
             self._variable.trace_add('write', self._set_content)
             self.bind('<<Modified>>', self._set_var)
+            self.bind('<FocusOut>', self.sync, add=True)
+
+    def _cancel_sync(self):
+        if self._pending is not None:
+            self.after_cancel(self._pending)
+            self._pending = None
 
     def _set_content(self, *_):
         """Set the text contents to the variable"""
-        self.delete('1.0', tk.END)
-        self.insert('1.0', self._variable.get())
+        value = self._variable.get()
+        if self._pending is not None:
+            # Unsynced typing is overwritten by the new value
+            self._cancel_sync()
+            current = self.get('1.0', 'end-1chars')
+        else:
+            current = self._content
+        if value == current:
+            self._content = value
+            return
+        prefix = _common_prefix(current, value)
+        suffix = _common_prefix(current[prefix:][::-1], value[prefix:][::-1])
+        start = f'1.0 + {prefix} chars'
+        if len(current) - suffix > prefix:
+            self.delete(start, f'1.0 + {len(current) - suffix} chars')
+        if len(value) - suffix > prefix:
+            self.insert(start, value[prefix:len(value) - suffix])
+        self._content = value
+        self.edit_modified(False)
 
-    
     def _set_var(self, *_):
-        """Set the variable to the text contents"""
+        """Schedule copying the text contents to the variable"""
         if self.edit_modified():
-            content = self.get('1.0', 'end-1chars')
-            self._variable.set(content)
             self.edit_modified(False)
+            self._cancel_sync()
+            self._pending = self.after(self.sync_delay, self.sync)
+
+    def sync(self, *_):
+        """Set the variable to the text contents now"""
+        self._cancel_sync()
+        if not self._variable:
+            return
+        content = self.get('1.0', 'end-1chars')
+        if content != self._content:
+            self._content = content
+            self._variable.set(content)
+
+    def destroy(self):
+        self._cancel_sync()
+        super().destroy()
 
 
 class LabelInput(tk.Frame):
@@ -77,164 +154,234 @@ class LabelInput(tk.Frame):
         super().grid(sticky=sticky, **kwargs)
 
 
+class FormTemplate:
+    """How to build a DataRecordForm for a schema, worked out once
+
+    stages lists each section, then the fields outside any section, with
+    the input class and arguments of each of its fields. Every form for
+    the same schema (extra tabs for parallel entry, say) shares the
+    template from for_schema().
+    """
+
+    _templates = {}
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.defaults = schema.defaults()
+        sections = [(name, schema.section(name)) for name in schema.sections]
+        sections.append((None, [field for field in schema if not field.section]))
+        self.stages = []
+        for section, fields in sections:
+            inputs = []
+            for field in fields:
+                input_class = input_classes[field.widget]
+                inputs.append(
+                    (field, input_class, self._input_args(field, input_class))
+                )
+            self.stages.append((section, inputs))
+
+    @classmethod
+    def for_schema(cls, schema):
+        template = cls._templates.get(id(schema))
+        if template is None or template.schema is not schema:
+            template = cls._templates[id(schema)] = cls(schema)
+        return template
+
+    @staticmethod
+    def _input_args(field, input_class):
+        """Build the input widget's arguments from its field"""
+        args = dict(field.input_args)
+        if field.values and field.widget in ('combobox', 'radio'):
+            args['values'] = field.values
+        if field.widget == 'spinbox':
+            args.update(
+                from_=field.min, to=field.max, increment=field.increment or 1
+            )
+        if issubclass(input_class, ValidatedMixin):
+            args['field'] = field
+        return args
+
+
 class DataRecordForm(ttk.Frame):
     """The input form for our widgets"""
 
-    def __init__(self, *args, **kwargs):
+    var_types = {
+        str: tk.StringVar, float: tk.DoubleVar,
+        int: tk.IntVar, bool: tk.BooleanVar
+    }
+
+    # With staged set, the first section is built straight away and the
+    # rest one at a time this many milliseconds apart, so the window is
+    # drawn before the whole form exists
+    stage_delay = 1
+    _count = 0
+
+    def __init__(self, *args, schema=RECORD_SCHEMA, staged=False, **kwargs):
         super().__init__(*args, **kwargs)
+        self.schema = schema
+        self.template = FormTemplate.for_schema(schema)
         self._vars = {
-            'Date': tk.StringVar(),
-            'Time': tk.StringVar(),
-            'Technician': tk.StringVar(),
-            'Lab': tk.StringVar(),
-            'Plot': tk.StringVar(),
-            'Seed Sample': tk.StringVar(),
-            'Humidity': tk.DoubleVar(),
-            'Light': tk.DoubleVar(),
-            'Temperature': tk.DoubleVar(),
-            'Equipment Fault': tk.BooleanVar(),
-            'Plants': tk.IntVar(),
-            'Blossoms': tk.IntVar(),
-            'Fruit': tk.IntVar(),
-            'Min Height': tk.DoubleVar(),
-            'Max Height': tk.DoubleVar(),
-            'Med Height': tk.DoubleVar(),
-            'Notes': tk.StringVar()
+            field.name: self.var_types[field.type]() for field in schema
         }
-        r_info = self._add_frame('Record Information')
-        LabelInput(
-            r_info, 'Date', var=self._vars['Date']
-        ).grid(row=0, column=0)
-        LabelInput(
-            r_info,'Time', input_class=ttk.Combobox,
-            var=self._vars['Time'],
-            input_args={'values': ["8:00", '12:00', '16:00', '20:00']}
-        ).grid(row=0, column=1)
-        LabelInput(
-            r_info, 'Technician', var=self._vars['Technician']
-        ).grid(row=0, column=2)
-        LabelInput(
-            r_info, 'Lab', input_class=ttk.Radiobutton,
-            var=self._vars['Lab'],
-            input_args={'values': ['A', 'B', 'C']}
-        ).grid(row=1, column=0)
-        LabelInput(
-            r_info, 'Plot', input_class=ttk.Combobox,
-            var=self._vars['Plot'],
-            input_args={'values': list(range(1,21))}
-        ).grid(row=1, column=1)
-        LabelInput(
-            r_info, 'Seed Sample', var=self._vars['Seed Sample']
-        ).grid(row=1, column=2)
-        
-        e_info = self._add_frame('Environment Data')
-        LabelInput(
-            e_info, 'Humidity (g/m\u00b3)',
-            input_class=ttk.Spinbox, var=self._vars['Humidity'],
-            input_args={'from_': 0.5, 'to': 52.0, 'increment': .01}
-        ).grid(row=0, column=0)
-        LabelInput(
-            e_info, 'Light (klx)', input_class=ttk.Spinbox,
-            var=self._vars['Light'],
-            input_args={'from_': 0, 'to': 100, 'increment': .01}
-        ).grid(row=0, column=1)
-        LabelInput(
-            e_info, 'Temperature \u00b0\u0043', 
-            input_class=ttk.Spinbox, var=self._vars['Temperature'],
-            input_args={'from_': 4, 'to': 40, 'increment': .01}
-        ).grid(row=0, column=2)
-        LabelInput(
-            e_info, 'Equipment Fault',
-            input_class=ttk.Checkbutton,
-            var=self._vars['Equipment Fault']
-        ).grid(row=1, column=1, columnspan=3)
-
-        p_info = self._add_frame('Plant Data')
-        LabelInput(
-            p_info, 'Plants', input_class=ttk.Spinbox,
-            var=self._vars['Plants'],
-            input_args={'from_': 0, 'to': 20}
-        ).grid(row=0, column=0)
-        LabelInput(
-            p_info, 'Blossoms', input_class=ttk.Spinbox,
-            var=self._vars['Blossoms'],
-            input_args={'from_': 0, 'to': 1000}
-        ).grid(row=0, column=1)
-        LabelInput(
-            p_info, 'Fruit', input_class=ttk.Spinbox,
-            var=self._vars['Fruit'],
-            input_args={'from_': 0, 'to': 1000}
-        ).grid(row=0, column=2)
-        LabelInput(
-            p_info, 'Min Height (cm)',
-            input_class=ttk.Spinbox, var=self._vars['Min Height'],
-            input_args={'from_': 0, 'to': 1000, 'increment': .01}
-        ).grid(row=1, column=0)
-        LabelInput(
-            p_info, 'Max Height (cm)', input_class=ttk.Spinbox,
-            var=self._vars['Max Height'],
-            input_args={'from_': 0, 'to': 1000, 'increment': .01}
-        ).grid(row=1, column=1)
-        LabelInput(
-            p_info, 'Median Height (cm)', input_class=ttk.Spinbox,
-            var=self._vars['Med Height'],
-            input_args={'from_': 0, 'to': 1000, 'increment': .01}
-        ).grid(row=1, column=2)
-        LabelInput(
-            self, 'Notes', input_class=BoundText,
-            var=self._vars['Notes'],
-            input_args={'width': 75, 'height': 10}
-        ).grid(sticky=tk.W, row=3, column=0)
+        self._snapshot = VariableSnapshot(self._vars)
+        self._fault_index = self._snapshot.keys.index('Equipment Fault')
+        self._defaults = self.template.defaults
+        self._define_reset()
+        self.inputs = {}
+        self._texts = []
+        stages = self.template.stages
         buttons = tk.Frame(self)
-        buttons.grid(sticky=tk.W + tk.E, row=4)
+        buttons.grid(row=len(stages), sticky=tk.W + tk.E)
         self.savebutton = ttk.Button(
             buttons, text='Save', command=self.master._on_save
         )
-       
-        
         self.savebutton.pack(side=tk.RIGHT)
         self.resetbutton = ttk.Button(
             buttons, text='Reset', command=self.reset
         )
         self.resetbutton.pack(side=tk.RIGHT)
+        stages = list(enumerate(stages))
+        if staged:
+            self._build_stages(stages[:1])
+            self._pending_stages = stages[1:]
+            self.after(self.stage_delay, self._build_next_stage)
+        else:
+            self._build_stages(stages)
+            self._pending_stages = []
+
+    def _define_reset(self):
+        """Compile the Tcl proc reset() calls
+
+        It turns validation off on the validated inputs, writes the
+        default values kept in Tcl (so only changed variables fire their
+        traces, once each), turns validation back on and clears any error
+        still showing. On bare variables this is slower than setting them
+        one by one (17us against 10us); it is meant to pay off with the
+        widgets attached, as timed by benchmarks/bench_gui.py.
+        """
+        DataRecordForm._count += 1
+        self._validated = f'::abq::validated{self._count}'
+        self._reset_proc = f'::abq::form_reset{self._count}'
+        template = self._snapshot.template(self._defaults)
+        self.tk.call('set', self._validated, '')
+        self.tk.eval(
+            f'proc {self._reset_proc} {{}} {{\n'
+            f'    foreach {{w e}} ${self._validated} '
+            '{$w configure -validate none}\n'
+            f'    {self._snapshot.apply_command(template)}\n'
+            f'    foreach {{w e}} ${self._validated} {{\n'
+            '        $w configure -validate all\n'
+            '        if {[set $e] ne {}} {\n'
+            '            set $e {}\n'
+            '            $w configure -foreground black\n'
+            '        }\n'
+            '    }\n'
+            '}'
+        )
+
+    def _build_stages(self, stages):
+        for row, (section, inputs) in stages:
+            if section:
+                parent = self._add_frame(section, row)
+            else:
+                parent = ttk.Frame(self)
+                parent.grid(row=row, sticky=tk.W + tk.E)
+            for field, input_class, input_args in inputs:
+                self._add_input(parent, field, input_class, input_args)
+
+    def _build_next_stage(self):
+        if not self._pending_stages:
+            return
+        self._build_stages([self._pending_stages.pop(0)])
+        if self._pending_stages:
+            self.after(self.stage_delay, self._build_next_stage)
 
-    def _add_frame(self, label, cols=3):
+    def built(self):
+        """True once every section of the form exists"""
+        return not self._pending_stages
+
+    def _add_input(self, parent, field, input_class, input_args):
+        """Build the LabelInput for a field"""
+        widget = LabelInput(
+            parent, field.label,
+            input_class=input_class, var=self._vars[field.name],
+            input_args=dict(input_args)
+        )
+        self.inputs[field.name] = widget
+        if isinstance(widget.input, ValidatedMixin):
+            self.tk.call(
+                'lappend', self._validated,
+                str(widget.input), f'::{widget.input.error}'
+            )
+        if field.section:
+            widget.grid(
+                row=field.row, column=field.column,
+                columnspan=field.columnspan
+            )
+        else:
+            widget.grid(sticky=tk.W, column=0)
+        if input_class is BoundText:
+            self._texts.append(widget.input)
+
+    def _add_frame(self, label, row, cols=3):
         """Add a LabelFrame to the form"""
         frame = ttk.LabelFrame(self, text=label)
-        frame.grid(sticky=tk.W + tk.E)
+        frame.grid(row=row, sticky=tk.W + tk.E)
         for i in range(cols):
             frame.columnconfigure(i, weight=1)
         return frame
 
     def reset(self):
-        """Reset the form entries"""
-        for var in self._vars.values():
-            if isinstance(var, tk.BooleanVar):
-                var.set(False)
-            else:
-                var.set('')
+        """Reset the form entries in a single Tcl call"""
+        self.tk.call(self._reset_proc)
+
+    def draft(self):
+        """Return what is in the form as strings, or None if it is empty"""
+        for text in self._texts:
+            text.sync()
+        values = dict(zip(self._snapshot.keys, map(str, self._snapshot.read())))
+        if all(v in self._empty_values for v in values.values()):
+            return None
+        return values
+
+    # Values a fresh or reset form holds
+    _empty_values = frozenset(('', '0', '0.0', 'False', 'false'))
+
+    def restore(self, values):
+        """Put values from draft() back into the form"""
+        self._snapshot.set(values)
 
     def get(self):
-        data = dict()
-        fault = self._vars['Equipment Fault'].get()
-        for key, variable in self._vars.items():
-            if fault and key in ('Light', 'Humidity', 'Temperature'):
-                data[key] = ''
-            else:
-                try:
-                    data[key] = variable.get()
-                except tk.TclError:
-                    message = f'Error in field: {key}. Data was not saved!'
-                    raise ValueError(message)
-        return data
+        for text in self._texts:
+            text.sync()
+        values = self._snapshot.read()
+        fault = self.tk.getboolean(values[self._fault_index])
+        skip = self.schema.fault_fields if fault else ()
+        try:
+            return self._snapshot.convert(values, skip)
+        except ValueError as e:
+            message = f'Error in field: {e}. Data was not saved!'
+            raise ValueError(message)
 
 
 class ValidatedMixin:
-    """Adds a validation functionality to an input widget"""
-    
-    def __init__(self, *args, error_var=None, **kwargs):
+    """Adds a validation functionality to an input widget
+
+    Focus-out validation runs the field's checker from the schema;
+    subclasses without a field fall back to their default_field.
+    """
+    default_field = None
+
+    def __init__(self, *args, error_var=None, field=None, **kwargs):
         self.error = error_var or tk.StringVar()
+        self.field = field or self.default_field
         super().__init__(*args, **kwargs)
+        self._validators = {
+            'focusout': self._focusout_validate, 'key': self._key_validate
+        }
+        self._invalid_handlers = {
+            'focusout': self._focusout_invalid, 'key': self._key_invalid
+        }
         vcmd = self.register(self._validate)
         invcmd = self.register(self._invalid)
         self.configure(
@@ -249,34 +396,33 @@ class ValidatedMixin:
     def _validate(self, proposed, current, char, event, index, action):
         self.error.set('')
         self._toggle_error()
-        valid = True
-        state = str(self.configure('state')[-1])
-        if state == tk.DISABLED:
-            return valid
-        if event == 'focusout':
-            valid = self._focusout_validate(event=event)
-        elif event == 'key':
-            valid = self._key_validate(
-                propsed=proposed,
-                current=current,
-                char=char,
-                event=event,
-                index=index,
-                action=action
-            )
-        return valid
+        validator = self._validators.get(event)
+        if validator is None or self.instate([tk.DISABLED]):
+            return True
+        return validator(
+            proposed=proposed,
+            current=current,
+            char=char,
+            event=event,
+            index=index,
+            action=action
+        )
 
     def _focusout_validate(self, **kwargs):
-        return True
+        if self.field is None:
+            return True
+        message = self.field.check(self.get())
+        if message:
+            self.error.set(message)
+        return not message
 
     def _key_validate(self, **kwargs):
         return True
 
     def _invalid(self, proposed, current, char, event, index, action):
-        if event == 'focusout':
-            self._focusout_invalid(event=event)
-        elif event == 'key':
-            self._key_invalid(
+        handler = self._invalid_handlers.get(event)
+        if handler is not None:
+            handler(
                 proposed=proposed,
                 current=current,
                 char=char,
@@ -302,74 +448,731 @@ class ValidatedMixin:
 
 class RequiredEntry(ValidatedMixin, ttk.Entry):
     """An Entry that requires a value"""
-    
-    def _focusout_validate(self, event):
-        valid = True
-        if not self.get():
-            valid = False
-            self.error.set('A value is required')
-        return valid
+    default_field = Field('Value')
+
 
 class DateEntry(ValidatedMixin, ttk.Entry):
     """An Entry that only accepts ISO Date strings"""
+    default_field = Field('Date', widget='date')
+    _digit_positions = frozenset(('0', '1', '2', '3', '5', '6', '8', '9'))
+    _dash_positions = frozenset(('4', '7'))
 
     def _key_validate(self, action, index, char, **kwargs):
         valid = True
         if action == '0':
             valid = True
-        elif index in ('0', '1', '2' , '3', '5', '6' ,'8' ,'9'):
+        elif index in self._digit_positions:
             valid = char.isdigit()
-        elif index in ('4', '7'):
+        elif index in self._dash_positions:
             valid = char == '-'
         else:
             valid = False
         return valid
 
-    def _focusout_validate(self, event):
-        valid = True
-        if not self.get():
-            self.error.set('A value is required')
-            valid = False
+
+class ValidatedSpinbox(ValidatedMixin, ttk.Spinbox):
+    """A Spinbox that only takes numbers within its field's range"""
+    default_field = Field('Value', float)
+
+    def _key_validate(self, proposed, action, **kwargs):
+        if action == '0' or proposed in ('', '-', '.', '-.'):
+            return True
         try:
-            datetime.strptime(self.get(), '%Y-%m-%d')
+            self.field.type(proposed)
         except ValueError:
-            self.error.set('Invalid date')
-            valid = False
-        return valid
+            return False
+        return True
 
     
 class ValidatedCombobox(ValidatedMixin, ttk.Combobox):
     """A combox that only takes values from its string list"""
+    default_field = Field('Value')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._update_index()
+
+    def _update_index(self):
+        """Look up the prefix index for the current values"""
+        values = self.tk.splitlist(self.cget('values'))
+        self._index = prefix_index(tuple(values))
+
+    def configure(self, cnf=None, **kwargs):
+        result = super().configure(cnf, **kwargs)
+        if 'values' in kwargs or (cnf and 'values' in cnf):
+            self._update_index()
+        return result
+
+    config = configure
+
+    def __setitem__(self, key, value):
+        self.configure({key: value})
+
     def _key_validate(self, proposed, action, **kwargs):
         valid = True
         if action == '0':
             self.set('')
             return True
-        values = self.cget('values')
-        matching = [
-            x for x in values
-            if x.lower().startswith(proposed.lower())
-        ]
-
-        if len(matching) == 0:
+        count, match = self._index.match(proposed)
+        if count == 0:
             valid = False
-        elif len(matching) == 1:
-            self.set(matching[0])
-            self.icursos(tk.END)
+        elif count == 1:
+            self.set(match)
+            self.icursor(tk.END)
             valid = False
         return valid
 
-    def _focusout_validate(self, **kwargs):
-        valid = True
-        if not self.get():
-            valid = False
-            self.error.set('A value is required')
-        return valid
 
-class Application(ThemedTk):
-    """Application root window"""
-    
-    def __init__(self, *args, **kwargs):
+# The input class the form builds for each kind of schema field
+input_classes = {
+    'date': DateEntry,
+    'entry': RequiredEntry,
+    'combobox': ValidatedCombobox,
+    'radio': ttk.Radiobutton,
+    'spinbox': ValidatedSpinbox,
+    'check': ttk.Checkbutton,
+    'text': BoundText,
+}
+
+
+class BatchEntry(ttk.Frame):
+    """Enter a whole sweep of plots at once
+
+    Date, Time, Technician and Lab are typed once above a grid with a
+    row per plot. Each cell is the same validated widget the form uses,
+    so it checks keystrokes and focus-out with the same rules. Return
+    moves down a column. Rows left empty are skipped, and save() hands
+    the rest to on_save as a list of records to be written together.
+    """
+    header_fields = ('Date', 'Time', 'Technician', 'Lab')
+    cell_width = {'spinbox': 6, 'entry': 10, 'text': 30}
+
+    def __init__(self, *args, schema=RECORD_SCHEMA, on_save=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.schema = schema
+        self.on_save = on_save
+        self.template = FormTemplate.for_schema(schema)
+        self.error = tk.StringVar()
+        self.header = {name: tk.StringVar() for name in self.header_fields}
+        header = ttk.Frame(self)
+        header.grid(row=0, column=0, sticky=tk.W)
+        for column, name in enumerate(self.header_fields):
+            field = schema[name]
+            input_class = input_classes[field.widget]
+            LabelInput(
+                header, field.label, var=self.header[name],
+                input_class=input_class,
+                input_args=FormTemplate._input_args(field, input_class)
+            ).grid(row=0, column=column)
+
+        self.columns = [
+            field for field in schema
+            if field.name not in self.header_fields and field.name != 'Plot'
+        ]
+        self.plots = schema['Plot'].values
+        grid = ttk.Frame(self)
+        grid.grid(row=1, column=0, sticky=tk.W)
+        ttk.Label(grid, text='Plot').grid(row=0, column=0)
+        for column, field in enumerate(self.columns, 1):
+            ttk.Label(grid, text=field.name).grid(row=0, column=column)
+        self.rows = []
+        self.cells = []
+        for row, plot in enumerate(self.plots, 1):
+            ttk.Label(grid, text=plot).grid(row=row, column=0)
+            variables = {}
+            cells = []
+            for column, field in enumerate(self.columns, 1):
+                variable, cell = self._cell(grid, field)
+                cell.grid(row=row, column=column)
+                cell.bind('<Return>', self._move_down)
+                variables[field.name] = variable
+                cells.append(cell)
+            self.rows.append(variables)
+            self.cells.append(cells)
+        ttk.Label(self, textvariable=self.error, foreground='red').grid(
+            row=2, column=0, sticky=tk.W
+        )
+        buttons = ttk.Frame(self)
+        buttons.grid(row=3, column=0, sticky=tk.E)
+        ttk.Button(buttons, text='Save sweep', command=self.save).pack(
+            side=tk.RIGHT
+        )
+        ttk.Button(buttons, text='Clear', command=self.clear).pack(
+            side=tk.RIGHT
+        )
+
+    def _cell(self, parent, field):
+        """Build the widget for one field of one plot"""
+        if field.widget == 'check':
+            variable = tk.BooleanVar()
+            return variable, ttk.Checkbutton(parent, variable=variable)
+        variable = tk.StringVar()
+        if field.widget == 'text':
+            return variable, ttk.Entry(
+                parent, textvariable=variable,
+                width=self.cell_width['text']
+            )
+        input_class = input_classes[field.widget]
+        args = FormTemplate._input_args(field, input_class)
+        args['width'] = self.cell_width.get(field.widget, 8)
+        return variable, input_class(
+            parent, textvariable=variable, error_var=self.error, **args
+        )
+
+    def _move_down(self, event):
+        for row, cells in enumerate(self.cells):
+            if event.widget in cells:
+                column = cells.index(event.widget)
+                below = self.cells[(row + 1) % len(self.cells)][column]
+                below.focus_set()
+                return 'break'
+
+    def _row_values(self, variables):
+        """Return a row's values as strings, or None if it is empty"""
+        values = {}
+        empty = True
+        for name, variable in variables.items():
+            value = variable.get()
+            if isinstance(value, bool):
+                empty = empty and not value
+                value = str(value)
+            else:
+                empty = empty and not value
+            values[name] = value
+        return None if empty else values
+
+    def records(self):
+        """Return the sweep's filled-in rows as records, or raise
+        ValueError naming the bad cells"""
+        shared = {name: var.get() for name, var in self.header.items()}
+        records = []
+        errors = []
+        for plot, variables, cells in zip(self.plots, self.rows, self.cells):
+            values = self._row_values(variables)
+            if values is None:
+                continue
+            record = dict(shared, Plot=plot, **values)
+            bad = self.schema.errors(record)
+            for column, field in enumerate(self.columns):
+                cell = cells[column]
+                if isinstance(cell, ValidatedMixin):
+                    cell._toggle_error(field.name in bad)
+            errors.extend(f'plot {plot} {name}' for name in bad)
+            records.append(record)
+        if errors:
+            raise ValueError(
+                f'Errors in: {", ".join(errors)}. The sweep was not saved!'
+            )
+        return [self.schema.convert(record) for record in records]
+
+    def save(self):
+        """Check the sweep and pass it to on_save, clearing it if saved"""
+        try:
+            records = self.records()
+        except ValueError as e:
+            self.error.set(str(e))
+            return
+        if not records:
+            self.error.set('Nothing to save')
+            return
+        if self.on_save is None or self.on_save(records):
+            self.clear()
+
+    def clear(self):
+        """Empty every row, keeping the shared fields"""
+        for variables in self.rows:
+            for variable in variables.values():
+                variable.set(
+                    False if isinstance(variable, tk.BooleanVar) else ''
+                )
+        self.error.set('')
+
+
+class MergedDay:
+    """A merged daily file followed by the rows of one writer's shard
+    saved since the merge, read like a RecordFile
+
+    merged_rows is how many of the shard's rows the merged file holds.
+    refresh() only reads what was appended to the shard.
+    """
+
+    def __init__(self, filename, shard, merged_rows):
+        self.merged = RecordFile(filename)
+        self.fieldnames = self.merged.fieldnames
+        self.shard = shard
+        self.merged_rows = merged_rows
+        self.tail = None
+        self._positions = []
+        self.refresh()
+
+    def __len__(self):
+        if self.tail is None:
+            return len(self.merged)
+        return len(self.merged) + max(0, len(self.tail) - self.merged_rows)
+
+    def refresh(self):
+        if self.tail is not None:
+            self.tail.refresh()
+            return
+        try:
+            self.tail = RecordFile(self.shard)
+        except FileNotFoundError:
+            return
+        # The shard has a column of its own, and may order them differently
+        names = self.tail.fieldnames
+        self._positions = [
+            names.index(n) if n in names else None for n in self.fieldnames
+        ]
+
+    def rows(self, start, stop):
+        count = len(self.merged)
+        rows = self.merged.rows(start, min(stop, count))
+        if self.tail is not None and stop > count:
+            first = self.merged_rows + max(0, start - count)
+            for row in self.tail.rows(first, self.merged_rows + stop - count):
+                rows.append([
+                    row[i] if i is not None and i < len(row) else ''
+                    for i in self._positions
+                ])
+        return rows
+
+
+def _shard_rows(shard):
+    try:
+        return len(RecordFile(shard))
+    except FileNotFoundError:
+        return 0
+
+
+class RecordList(ttk.Frame):
+    """A list of saved records that only loads the rows on screen
+
+    The scrollbar is driven by hand: the Treeview only ever holds the
+    visible rows, which are read from the file a page at a time and kept
+    in a small cache.
+    """
+    page_size = 200
+    cached_pages = 8
+    # With merge set, how often in milliseconds the day shown is merged
+    # again, on a thread of its own, to pick up other writers' records
+    merge_interval = 10000
+
+    def __init__(
+        self, *args, directory='.', height=20, merge=False, writer=None,
+        **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+        self.directory = Path(directory)
+        # With merge set, daily files are built from the writers' shards
+        # on a thread of their own when they are opened and then every
+        # merge_interval; in between, this writer's new records are read
+        # from its own shard
+        self.merge = merge
+        self.writer = writer or shard_name()
+        self._merging = None
+        self._merged = None
+        # The day the merge thread should merge next
+        self._wanted = None
+        self._polling = False
+        self.recordfile = None
+        self._pages = OrderedDict()
+        self._top = 0
+        self.filename = tk.StringVar()
+        self.chooser = ttk.Combobox(
+            self, textvariable=self.filename, state='readonly',
+            postcommand=self._list_files
+        )
+        self.chooser.bind(
+            '<<ComboboxSelected>>', lambda _: self.load(self.filename.get())
+        )
+        self.chooser.grid(row=0, column=0, columnspan=2, sticky=(tk.W + tk.E))
+        self.tree = ttk.Treeview(
+            self, show='headings', height=height, selectmode='browse'
+        )
+        self.tree.grid(row=1, column=0, sticky='nsew')
+        self.scrollbar = ttk.Scrollbar(
+            self, orient=tk.VERTICAL, command=self._on_scroll
+        )
+        self.scrollbar.grid(row=1, column=1, sticky='ns')
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(1, weight=1)
+        self.tree.bind('<MouseWheel>', self._on_wheel)
+        self.tree.bind('<Button-4>', lambda _: self.scroll_to(self._top - 3))
+        self.tree.bind('<Button-5>', lambda _: self.scroll_to(self._top + 3))
+        self.tree.bind('<Up>', lambda _: self.scroll_to(self._top - 1))
+        self.tree.bind('<Down>', lambda _: self.scroll_to(self._top + 1))
+        self.tree.bind('<Prior>', lambda _: self.scroll_to(self._top - height))
+        self.tree.bind('<Next>', lambda _: self.scroll_to(self._top + height))
+        if merge:
+            self.after(self.merge_interval, self._merge_later)
+
+    def _list_files(self):
+        files = {day_name(f) for f in day_files(self.directory)}
+        if self.merge:
+            shards = shard_directory(self.directory)
+            for shard in shards.glob('abq_data_record_*.*.csv'):
+                files.add(shard.name.split('.', 1)[0] + '.csv')
+        self.chooser.configure(values=sorted(files, reverse=True))
+
+    def _shard(self, name):
+        """Return this writer's shard of the daily file called name"""
+        return shard_directory(self.directory) / (
+            f'{Path(name).stem}.{self.writer}.csv'
+        )
+
+    def _merge(self, name):
+        """Merge the shards of the daily file called name, returning how
+        many of this writer's rows it holds"""
+        shard = self._shard(name)
+        for _ in range(3):
+            rows = _shard_rows(shard)
+            merge_shards(Path(name).stem.rpartition('_')[2], self.directory)
+            # A record saved during the merge may or may not be in it
+            if _shard_rows(shard) == rows:
+                break
+        return rows
+
+    def load(self, filename):
+        """Show the records in filename
+
+        With merge set, what was merged last is shown straight away and
+        replaced once the day has been merged in the background.
+        """
+        path = self.directory / filename
+        if self.merge:
+            self._start_merge(path.name)
+        located = locate(self.directory, path.name)
+        if located is None:
+            if self.merge:
+                # Nothing merged yet: show the day once it is
+                self.filename.set(path.name)
+                self.recordfile = None
+                self.tree.delete(*self.tree.get_children())
+            return
+        if self.merge:
+            # Taking the shard as merged up to now, this writer's next
+            # saves show up as soon as they are made
+            shard = self._shard(path.name)
+            recordfile = MergedDay(located, shard, _shard_rows(shard))
+        else:
+            recordfile = RecordFile(located)
+        self._show(path.name, recordfile)
+        self.scroll_to(0)
+
+    def _show(self, name, recordfile):
+        self.filename.set(name)
+        self.recordfile = recordfile
+        self._pages.clear()
+        columns = self.recordfile.fieldnames
+        self.tree.configure(columns=columns)
+        for column in columns:
+            self.tree.heading(column, text=column)
+            self.tree.column(column, width=80, stretch=False)
+
+    def refresh(self):
+        """Pick up records appended to the file being shown"""
+        if self.recordfile is None:
+            return
+        last_page = len(self.recordfile) // self.page_size
+        self.recordfile.refresh()
+        self._pages.pop(last_page, None)
+        self.scroll_to(self._top)
+
+    def _merge_later(self):
+        """Merge the day shown again, every merge_interval"""
+        name = self.filename.get()
+        if name:
+            self._start_merge(name)
+        self.after(self.merge_interval, self._merge_later)
+
+    def _start_merge(self, name):
+        """Merge the day called name on the merge thread, starting it if
+        it isn't running, and show the result when it is done"""
+        self._wanted = name
+        if not (self._merging and self._merging.is_alive()):
+            # A thread about to finish may miss the new name, in which
+            # case the next _merge_later() merges it
+            self._merging = threading.Thread(
+                target=self._merge_in_background, daemon=True
+            )
+            self._merging.start()
+        if not self._polling:
+            self._polling = True
+            self.after(100, self._show_merged)
+
+    def _show_merged(self):
+        """Show the last background merge, checking until it is done"""
+        if self._merged is not None:
+            name, recordfile = self._merged
+            self._merged = None
+            if name == self.filename.get():
+                self._show(name, recordfile)
+                self.scroll_to(self._top)
+        if self._merging.is_alive() or self._merged is not None:
+            self.after(100, self._show_merged)
+        else:
+            self._polling = False
+
+    def _merge_in_background(self):
+        """Merge days off the Tk thread until the one wanted is done,
+        reading the result if it changed"""
+        while True:
+            name = self._wanted
+            self._merge_day(name)
+            if self._wanted == name:
+                return
+
+    def _merge_day(self, name):
+        target = self.directory / name
+        def version():
+            try:
+                stat = target.stat()
+            except FileNotFoundError:
+                return None
+            return stat.st_ino, stat.st_size, stat.st_mtime_ns
+        before = version()
+        try:
+            merged_rows = self._merge(name)
+        except OSError:
+            # Another merge is slow or the share is unreachable, so what
+            # was merged last stays on show
+            return
+        if version() in (None, before):
+            return
+        try:
+            recordfile = MergedDay(target, self._shard(name), merged_rows)
+        except OSError:
+            return
+        # Picked up on the Tk thread by _show_merged
+        self._merged = (name, recordfile)
+
+    def _page(self, number):
+        """Return a page of rows, reading it from the file if needed"""
+        if number in self._pages:
+            self._pages.move_to_end(number)
+        else:
+            start = number * self.page_size
+            self._pages[number] = self.recordfile.rows(
+                start, start + self.page_size
+            )
+            if len(self._pages) > self.cached_pages:
+                self._pages.popitem(last=False)
+        return self._pages[number]
+
+    def scroll_to(self, top):
+        """Show the rows starting at row number top"""
+        if self.recordfile is None:
+            return
+        total = len(self.recordfile)
+        height = int(self.tree.cget('height'))
+        self._top = top = max(0, min(top, total - height))
+        self.tree.delete(*self.tree.get_children())
+        for row in range(top, min(top + height, total)):
+            page, index = divmod(row, self.page_size)
+            self.tree.insert('', tk.END, values=self._page(page)[index])
+        if total:
+            self.scrollbar.set(top / total, min(top + height, total) / total)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def _on_scroll(self, action, amount, unit=None):
+        height = int(self.tree.cget('height'))
+        if action == tk.MOVETO:
+            self.scroll_to(int(float(amount) * len(self.recordfile or ())))
+        elif unit == tk.PAGES:
+            self.scroll_to(self._top + int(amount) * height)
+        else:
+            self.scroll_to(self._top + int(amount))
+
+    def _on_wheel(self, event):
+        self.scroll_to(self._top - event.delta // 120 * 3)
+
+
+class StatsPane(ttk.Frame):
+    """Shows the running statistics of the day's records
+
+    Only the rows of the groups a record belongs to are redrawn when it
+    is counted. Selecting a row shows its median height distribution.
+    """
+    columns = (
+        'Records', 'Humidity', 'Light', 'Temperature',
+        'Plants', 'Blossoms', 'Fruit', 'Med Height'
+    )
+
+    def __init__(self, *args, stats=None, height=8, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tree = ttk.Treeview(
+            self, columns=self.columns, height=height, selectmode='browse'
+        )
+        self.tree.heading('#0', text='Group')
+        self.tree.column('#0', width=70, stretch=False)
+        for column in self.columns:
+            self.tree.heading(column, text=column)
+            self.tree.column(column, width=110, stretch=False)
+        self.tree.grid(row=0, column=0, sticky='nsew')
+        scrollbar = ttk.Scrollbar(
+            self, orient=tk.VERTICAL, command=self.tree.yview
+        )
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.grid(row=0, column=1, sticky='ns')
+        self.distribution = tk.StringVar()
+        ttk.Label(self, textvariable=self.distribution).grid(
+            row=1, column=0, columnspan=2, sticky=tk.W
+        )
+        self.columnconfigure(0, weight=1)
+        self.tree.bind('<<TreeviewSelect>>', self._show_distribution)
+        self.stats = None
+        if stats is not None:
+            self.show(stats)
+
+    def show(self, stats):
+        """Show every group of a DailyStats"""
+        self.stats = stats
+        self.tree.delete(*self.tree.get_children())
+        for key, group in stats.sorted_groups():
+            self.tree.insert(
+                '', tk.END, iid=self._iid(key), text=' '.join(key),
+                values=self._values(group)
+            )
+
+    def update_groups(self, record):
+        """Redraw the groups record was counted in"""
+        for key in self.stats.keys:
+            group = (key, str(record.get(key, '')))
+            iid = self._iid(group)
+            values = self._values(self.stats.groups[group])
+            if self.tree.exists(iid):
+                self.tree.item(iid, values=values)
+            else:
+                self.show(self.stats)
+                return
+
+    @staticmethod
+    def _iid(key):
+        return '{}:{}'.format(*key)
+
+    @staticmethod
+    def _values(group):
+        def measure(name):
+            running = group.running[name]
+            if not running.count:
+                return ''
+            return (
+                f'{running.mean:.2f} ({running.min:g}\u2013{running.max:g})'
+            )
+        heights = group.running['Med Height']
+        return (
+            group.count,
+            measure('Humidity'),
+            measure('Light'),
+            measure('Temperature'),
+            group.total['Plants'],
+            group.total['Blossoms'],
+            group.total['Fruit'],
+            f'{heights.mean:.2f} \u00b1{heights.stdev:.2f}'
+            if heights.count else '',
+        )
+
+    def _show_distribution(self, _):
+        selected = self.tree.selection()
+        if not selected:
+            return
+        key = tuple(selected[0].split(':', 1))
+        group = self.stats.groups[key]
+        bins = ', '.join(
+            f'{low:g}\u2013{high:g}: {count}'
+            for low, high, count in group.histogram()
+        )
+        self.distribution.set(f'{" ".join(key)} median heights (cm): {bins}')
+
+
+class NoteSearch(ttk.Frame):
+    """A search box over the Notes of every saved record
+
+    Terms must all appear in a record's notes; "quoted phrases" must
+    appear as written. Double-clicking a result shows its day's records.
+    """
+    columns = ('Date', 'Time', 'Lab', 'Plot', 'Notes')
+
+    def __init__(self, *args, index=None, on_open=None, limit=200, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.index = index
+        self.on_open = on_open
+        self.limit = limit
+        self.query = tk.StringVar()
+        entry = ttk.Entry(self, textvariable=self.query)
+        entry.grid(row=0, column=0, sticky=(tk.W + tk.E))
+        entry.bind('<Return>', lambda _: self.search())
+        ttk.Button(self, text='Search', command=self.search).grid(
+            row=0, column=1, columnspan=2, padx=(5, 0)
+        )
+        self.tree = ttk.Treeview(
+            self, columns=self.columns, show='headings', height=12,
+            selectmode='browse'
+        )
+        for column in self.columns:
+            self.tree.heading(column, text=column)
+            self.tree.column(column, width=80, stretch=False)
+        self.tree.column('Notes', width=400, stretch=True)
+        self.tree.grid(row=1, column=0, columnspan=2, sticky='nsew')
+        scrollbar = ttk.Scrollbar(
+            self, orient=tk.VERTICAL, command=self.tree.yview
+        )
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.grid(row=1, column=2, sticky='ns')
+        self.message = tk.StringVar()
+        ttk.Label(self, textvariable=self.message).grid(
+            row=2, column=0, columnspan=3, sticky=tk.W
+        )
+        # How far indexing the older days has got, while it runs
+        self.progress = tk.StringVar()
+        ttk.Label(self, textvariable=self.progress).grid(
+            row=3, column=0, columnspan=3, sticky=tk.W
+        )
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(1, weight=1)
+        self.tree.bind('<Double-1>', self._open)
+        self._files = {}
+        entry.focus()
+
+    def search(self):
+        """Show the records matching the query"""
+        start = perf_counter()
+        try:
+            results = self.index.search(self.query.get(), self.limit)
+        except (ValueError, sqlite3.Error) as e:
+            # shlex rejects an unclosed quote
+            self.message.set(f'Could not search: {e}')
+            return
+        self.tree.delete(*self.tree.get_children())
+        self._files.clear()
+        for name, record in results:
+            iid = self.tree.insert('', tk.END, values=[
+                record.get(column, '').replace('\n', ' ')
+                for column in self.columns
+            ])
+            self._files[iid] = name
+        more = '+' if len(results) >= self.limit else ''
+        self.message.set(
+            f'{len(results)}{more} records in '
+            f'{(perf_counter() - start) * 1000:.1f}ms'
+        )
+
+    def _open(self, _):
+        selected = self.tree.selection()
+        if selected and self.on_open:
+            self.on_open(self._files[selected[0]])
+
+
+class Application(tk.Tk):
+    """Application root window
+
+    Only what the first frame needs is built before the window is shown;
+    the theme, the rest of the form and the saved records follow in
+    after() callbacks.
+    """
+
+    def __init__(self, *args, storage='csv', sync_url=None, **kwargs):
         super().__init__(*args, **kwargs)
         # self.overrideredirect(True)
         # self.geometry('600x600+100+100')
@@ -390,44 +1193,569 @@ class Application(ThemedTk):
             self, text='ABQ Data Entry Application',
             font=('TkDefaultFont', 16)
         ).grid(row=0)
-        self.recordform = DataRecordForm(self)
+        buttons = ttk.Frame(self)
+        buttons.grid(row=0, column=1, padx=10, sticky=tk.E)
+        ttk.Button(
+            buttons, text='Search notes...', command=self._open_search
+        ).pack(side=tk.LEFT)
+        ttk.Button(
+            buttons, text='Plot sweep...', command=self._open_sweep
+        ).pack(side=tk.LEFT, padx=(5, 0))
+        self._sweep = None
+        self._search = None
+        self.notes_index = None
+        # Brings every day into the notes index, the first time the
+        # search is opened: (thread, [days done, days], stop event)
+        self._catch_up = None
+        self.recordform = DataRecordForm(self, staged=True)
         self.recordform.grid(row=1, padx=10, sticky=(tk.E + tk.W))
+        self.recordlist = RecordList(self, merge=storage == 'shards')
+        self.recordlist.grid(row=1, column=1, padx=10, sticky='nsew')
         self.status = tk.StringVar()
         self.s = ttk.Style()
-        
-        self.s.theme_use('breeze')
-        self.tk.call('ttk::style', 'configure', 'TButton', '-background', 'green')
+        self.after(1, self._load_theme)
         # print(self.s.theme_names())
         # print(self.s.theme_use('yaru'))
         ttk.Label(
             self, textvariable=self.status,
         ).grid(row=2, padx=10,sticky=(tk.E + tk.W))
         self._records_saved = 0
+        self._failed = []
+        # A record journalled on the Tk thread whose write then failed, so
+        # that saving it again doesn't journal it twice
+        self._journaled = None
+        self.save_latencies = deque(maxlen=1000)
+        # Every record saved since the application started
+        self.session = SessionBuffer(self.recordform.schema)
+        self.store = make_storage(
+            storage, fields=self.recordform.schema.types,
+            flush_every=self.flush_every, flush_interval=self.flush_interval
+        )
+        # Writers sharing a directory each need a journal of their own
+        writer = getattr(self.store, 'writer', None)
+        self.journal = Journal(
+            f'abq_journal.{writer}.bin' if writer else 'abq_journal.bin'
+        )
+        self.sync_status = tk.StringVar()
+        self.uploader = None
+        self.outbox = None
+        if sync_url:
+            self._start_sync(sync_url, writer)
+        self._recover()
+        self.saved_keys = SavedKeys(self.store)
+        self.stats = DailyStats()
+        self.statspane = StatsPane(self, stats=self.stats)
+        self.statspane.grid(
+            row=3, column=0, columnspan=2, padx=10, sticky=(tk.E + tk.W)
+        )
+        self.after(1, self._load_records)
+        if self.background_saves:
+            self.savequeue = SaveQueue(
+                self.store, journal=self.journal, outbox=self.outbox
+            )
+            self.after(self.poll_interval, self._poll_saves)
+        else:
+            self.savequeue = None
+            self.after(self.flush_interval, self._flush_store)
+        self.after(self.draft_interval, self._save_draft)
+        if storage == 'csv' and self.archive_after is not None:
+            threading.Thread(
+                target=self._archive_old_days, daemon=True
+            ).start()
+
+    # Saves are flushed after this many records, or at least this often
+    # in milliseconds, whichever comes first
+    flush_every = 1
+    flush_interval = 1000
+    # Write records on a worker thread, checking for results this often
+    background_saves = True
+    poll_interval = 50
+    # How often the form's contents are written to the journal
+    draft_interval = 2000
+    # The ttkthemes theme applied once the window is up
+    theme = 'breeze'
+    # Ask before saving a record whose Date, Time, Lab and Plot match one
+    # saved earlier the same day
+    check_duplicates = True
+    # Daily files older than this many days are compressed into the
+    # archive on a background thread at startup; None leaves them be
+    archive_after = 7
+    # Records per upload, and how often in milliseconds the upload's
+    # progress is shown
+    sync_batch_size = 500
+    sync_status_interval = 1000
+
+    def _load_theme(self):
+        """Apply the theme, if ttkthemes is installed"""
+        try:
+            from ttkthemes import ThemedStyle
+        except ImportError:
+            return
+        self.s = ThemedStyle(self)
+        self.s.set_theme(self.theme)
+        self.tk.call('ttk::style', 'configure', 'TButton', '-background', 'green')
+
+    def _load_records(self):
+        """Show today's records and their statistics"""
+        self.recordlist.load(daily_filename().name)
+        self._index_notes()
+        self._load_keys()
+        try:
+            self.stats.load()
+        except (OSError, ValueError) as e:
+            self.status.set(f'Could not read today\'s records: {e}')
+        self.statspane.show(self.stats)
+
+    def _start_sync(self, url, writer=None):
+        """Upload saved records to url, through an outbox on disk"""
+        from sync import Outbox, Uploader
+
+        try:
+            outbox = Outbox(
+                f'abq_outbox.{writer}.bin' if writer else 'abq_outbox.bin'
+            )
+        except OSError as e:
+            self.status.set(f'Could not open the upload outbox: {e}')
+            return
+        self.outbox = outbox
+        self.uploader = Uploader(
+            outbox, url, writer or shard_name(),
+            batch_size=self.sync_batch_size
+        ).start()
+        ttk.Label(self, textvariable=self.sync_status).grid(
+            row=2, column=1, padx=10, sticky=tk.E
+        )
+        self._show_sync()
+
+    def _show_sync(self):
+        self.sync_status.set(self.uploader.status())
+        self.after(self.sync_status_interval, self._show_sync)
+
+    def _queue_upload(self, records, day):
+        """Put records saved on the Tk thread in the outbox
+
+        SaveQueue does this itself for the records it writes.
+        """
+        if self.outbox is None:
+            return
+        try:
+            self.outbox.append(records, day)
+        except OSError as e:
+            self.status.set(f'Could not queue the record for upload: {e}')
+            return
+        self.uploader.wake()
+
+    def _archive_old_days(self):
+        """Rotate old daily files into the archive, off the Tk thread"""
+        try:
+            rotate(keep=self.archive_after)
+        except (OSError, ValueError) as e:
+            print(f'Could not archive old records: {e}', file=sys.stderr)
+
+    def _recover(self):
+        """Replay the journal left by a crash and restore the draft"""
+        try:
+            recovered, draft = self.journal.replay(self.store, self.outbox)
+            self.journal.compact(self.store, self.outbox)
+        except OSError as e:
+            self.status.set(f'Could not recover the journal: {e}')
+            return
+        messages = []
+        if recovered:
+            messages.append(f'Recovered {recovered} unsaved records.')
+        if draft:
+            self.recordform.restore(draft)
+            messages.append('Restored the unfinished record.')
+        if messages:
+            self.status.set(' '.join(messages))
+
+    def _compact_journal(self):
+        """Compact the journal once it has grown past its limit"""
+        try:
+            if self.journal.needs_compaction():
+                self.journal.compact(self.store, self.outbox)
+        except OSError as e:
+            self.status.set(f'Could not compact the journal: {e}')
+
+    def _save_draft(self):
+        """Periodically journal what is in the form"""
+        try:
+            self.journal.append_draft(self.recordform.draft())
+        except OSError as e:
+            self.status.set(f'Could not write the journal: {e}')
+        self.after(self.draft_interval, self._save_draft)
+
+    def _flush_store(self):
+        """Periodically push buffered records to disk"""
+        self.store.flush()
+        self.after(self.flush_interval, self._flush_store)
 
     def _on_save(self):
         """Handles save button clicks"""
-        datestring = datetime.today().strftime('%Y-%m-%d')
-        filename = f'abq_data_record_{datestring}.csv'
-        newfile = not Path(filename).exists()
+        start = perf_counter()
         try:
             data = self.recordform.get()
         except ValueError as e:
             self.status.set(str(e))
             return
-        with open(filename, 'a', newline='') as fh:
-            csvwriter = csv.DictWriter(fh, fieldnames=data.keys())
-            if newfile:
-                csvwriter.writeheader()
-            csvwriter.writerow(data)
-        self._records_saved += 1
+        job = (data, today())
+        if not self._confirm_new([data], job[1]):
+            return
+        if self.savequeue:
+            if not self._submit(job):
+                return
+            self.saved_keys.add(*job)
+        else:
+            try:
+                if job != self._journaled:
+                    self.journal.append_record(*job)
+                    self._journaled = job
+                self.store.write(*job)
+            except OSError as e:
+                self.status.set(f'Error saving record: {e}')
+                return
+            self._journaled = None
+            self._queue_upload([data], job[1])
+            self._compact_journal()
+            self.saved_keys.add(*job)
+            self._records_saved += 1
+            self._count_saved(job)
+            self._show_saved()
+        self.recordform.reset()
+        self.save_latencies.append((perf_counter() - start) * 1000)
+
+    def _open_sweep(self):
+        """Show the window for entering a sweep of plots"""
+        if self._sweep is not None and self._sweep.winfo_exists():
+            self._sweep.lift()
+            return
+        self._sweep = tk.Toplevel(self)
+        self._sweep.title('Plot sweep')
+        BatchEntry(
+            self._sweep, schema=self.recordform.schema,
+            on_save=self._save_batch
+        ).pack(padx=10, pady=10)
+
+    def _open_search(self):
+        """Show the window for searching the notes"""
+        if self._search is not None and self._search.winfo_exists():
+            self._search.lift()
+            return
+        if self.notes_index is None:
+            self._index_notes()
+        if self.notes_index is None:
+            return
+        self._search = tk.Toplevel(self)
+        self._search.title('Search notes')
+        self.notesearch = NoteSearch(
+            self._search, index=self.notes_index,
+            on_open=self.recordlist.load
+        )
+        self.notesearch.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
+        if self._catch_up is None:
+            self._catch_up_notes()
+
+    def _catch_up_notes(self):
+        """Index the days not yet indexed, such as other writers' files,
+        on a thread of its own
+
+        Days new to the index are indexed in a pool of processes (see
+        NotesIndex.update_all). The search works meanwhile, on what is
+        indexed so far.
+        """
+        progress = [0, 0]
+        stop = threading.Event()
+        def run():
+            index = NotesIndex(self.notes_index.directory)
+            def report(done, total):
+                progress[:] = done, total
+            try:
+                index.update_all(progress=report, stop=stop)
+            except (OSError, sqlite3.Error) as e:
+                progress.append(e)
+            finally:
+                index.close()
+        thread = threading.Thread(target=run, daemon=True)
+        self._catch_up = (thread, progress, stop)
+        thread.start()
+        self._show_catch_up()
+
+    def _show_catch_up(self):
+        thread, progress, _ = self._catch_up
+        running = thread.is_alive()
+        if self._search is not None and self._search.winfo_exists():
+            if len(progress) > 2:
+                message = f'Could not index the older notes: {progress[2]}'
+            elif running:
+                message = f'Indexing notes: {progress[0]} of {progress[1]} days'
+            else:
+                message = ''
+            self.notesearch.progress.set(message)
+            if not running and self.notesearch.query.get():
+                # Search again now every day is in
+                self.notesearch.search()
+        if running:
+            self.after(200, self._show_catch_up)
+
+    def _index_notes(self):
+        """Add the day's newly saved notes to the search index"""
+        try:
+            if self.notes_index is None:
+                self.notes_index = NotesIndex()
+            self.notes_index.update(daily_filename())
+        except (OSError, sqlite3.Error) as e:
+            self.status.set(f'Could not index the notes: {e}')
+
+    def _save_batch(self, records):
+        """Save a sweep's records with one batched write"""
+        day = today()
+        if not self._confirm_new(records, day):
+            return False
+        if self.savequeue:
+            try:
+                self.savequeue.submit_many(records, day)
+            except queue.Full:
+                self.status.set(
+                    'The save queue is full, please try again. '
+                    'The sweep has not been cleared.'
+                )
+                return False
+            for data in records:
+                self.saved_keys.add(data, day)
+            return True
+        try:
+            if (records, day) != self._journaled:
+                self.journal.append_records(records, day)
+                self._journaled = (records, day)
+            self.store.write_many(records, day)
+        except OSError as e:
+            self.status.set(f'Error saving the sweep: {e}')
+            return False
+        self._journaled = None
+        self._queue_upload(records, day)
+        self._compact_journal()
+        for data in records:
+            self.saved_keys.add(data, day)
+        for data in records:
+            self._records_saved += 1
+            self._count_saved((data, day))
+        self._show_saved()
+        return True
+
+    def _load_keys(self):
+        """Read the keys saved today, so the first save needn't"""
+        try:
+            self.saved_keys.load()
+        except (OSError, ValueError, sqlite3.Error) as e:
+            self.status.set(f'Could not read today\'s record keys: {e}')
+
+    def _confirm_new(self, records, day):
+        """Return whether to save records, asking first if any of them
+        has the same Date, Time, Lab and Plot as one already saved"""
+        if not self.check_duplicates:
+            return True
+        try:
+            saved = self.saved_keys.load(day)
+        except (OSError, ValueError, sqlite3.Error):
+            # Saving matters more than the check
+            return True
+        duplicates = []
+        seen = set()
+        for data in records:
+            key = SavedKeys.key(data)
+            if key in saved or key in seen:
+                duplicates.append(key)
+            seen.add(key)
+        if not duplicates:
+            return True
+        from tkinter import messagebox
+
+        described = '\n'.join(
+            f'{date} {time}, lab {lab}, plot {plot}'
+            for date, time, lab, plot in duplicates[:10]
+        )
+        if len(duplicates) > 10:
+            described += f'\n...and {len(duplicates) - 10} more'
+        return messagebox.askyesno(
+            title='Duplicate record',
+            message=(
+                'Already saved today'
+                + (' or entered twice' if len(records) > 1 else '')
+                + ':\n\n' + described
+            ),
+            detail=(
+                'Save anyway? The new record replaces the earlier one '
+                'when records are looked up by key.'
+            ),
+            icon=messagebox.WARNING, default=messagebox.NO, parent=self
+        )
+
+    def _submit(self, job):
+        """Queue failed records and then job, keeping whatever won't fit"""
+        jobs = self._failed + [job]
+        for i, queued in enumerate(jobs):
+            data, day, *journaled = queued
+            try:
+                self.savequeue.submit(data, day, journaled=bool(journaled))
+            except queue.Full:
+                self._failed = jobs[i:-1]
+                self.status.set(
+                    'The save queue is full, please try again. '
+                    'The form has not been cleared.'
+                )
+                return False
+        self._failed = []
+        return True
+
+    def _poll_saves(self):
+        """Collect the results of background saves"""
+        saved = self._records_saved
+        errors = []
+        while True:
+            try:
+                job, error = self.savequeue.results.get_nowait()
+            except queue.Empty:
+                break
+            if error is None:
+                self._records_saved += 1
+                self._count_saved(job)
+                continue
+            if job is not None:
+                self._failed.append(job)
+            errors.append(error)
+        if errors:
+            self.status.set(
+                f'Error saving record: {errors[-1]}. '
+                f'{len(self._failed)} records will be retried on next save.'
+            )
+        elif self._records_saved != saved:
+            self._show_saved()
+        self.after(self.poll_interval, self._poll_saves)
+
+    def _count_saved(self, job):
+        """Add a saved record to the running statistics"""
+        data, day = job
+        if day != self.stats.day:
+            self.stats = DailyStats(day)
+            self.statspane.show(self.stats)
+        self.stats.add(data)
+        self.statspane.update_groups(data)
+        self.session.append(data)
+        if self.uploader is not None:
+            # Already in the outbox; send it now rather than at the next poll
+            self.uploader.wake()
+
+    def _show_saved(self):
         self.status.set(
             f'{self._records_saved} records saved this session.'
         )
-        self.recordform.reset()
+        filename = daily_filename().name
+        shown = self.recordlist.filename.get()
+        if shown == filename:
+            self.recordlist.refresh()
+        elif not shown:
+            self.recordlist.load(filename)
+        self._index_notes()
+
+    def destroy(self):
+        """Close the record file before the window goes away
+
+        Anything that could not be saved stays in the journal and is
+        replayed on the next start.
+        """
+        self.journal.append_draft(self.recordform.draft())
+        if self.savequeue:
+            for data, day, *journaled in self._failed:
+                self.savequeue.submit(
+                    data, day, block=True, journaled=bool(journaled)
+                )
+            self.savequeue.close()
+            while not self.savequeue.results.empty():
+                job, error = self.savequeue.results.get()
+                if error is not None:
+                    print(f'Error saving record: {error}', file=sys.stderr)
+                elif job is not None:
+                    self.stats.add(job[0])
+        try:
+            self.journal.compact(self.store, self.outbox)
+        except OSError as e:
+            print(f'Could not compact the journal: {e}', file=sys.stderr)
+        self.store.close()
+        self.journal.close()
+        if self.uploader is not None:
+            # Whatever is not uploaded yet goes on the next start
+            self.uploader.stop()
+            self.uploader.outbox.close()
+        if self._catch_up is not None:
+            thread, _, stop = self._catch_up
+            stop.set()
+            thread.join()
+        if self.notes_index is not None:
+            self._index_notes()
+            self.notes_index.close()
+        try:
+            self.stats.save_checkpoint()
+        except OSError as e:
+            print(f'Could not save the statistics: {e}', file=sys.stderr)
+        if os.environ.get('ABQ_SAVE_LATENCY'):
+            self._print_save_latency()
+        super().destroy()
+
+    def _print_save_latency(self):
+        """Print how long the form was blocked by each save"""
+        latencies = sorted(self.save_latencies)
+        if not latencies:
+            return
+        def pct(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+        mode = 'background' if self.savequeue else 'synchronous'
+        print(
+            f'{mode} saves: {len(latencies)} '
+            f'p50={pct(.5):.2f}ms p95={pct(.95):.2f}ms '
+            f'max={latencies[-1]:.2f}ms'
+        )
 
     def _move_window(self, event):
         self.geometry('+{0}+{1}'.format(event.x_root, event.y_root))
 
+# The methods --profile times; validation is split by event
+PROFILED = [
+    (ValidatedMixin, '_validate', lambda args: args[4]),
+    (ValidatedMixin, '_invalid', lambda args: args[4]),
+    (DataRecordForm, 'get'),
+    (DataRecordForm, 'reset'),
+    (BoundText, 'sync'),
+    (BoundText, '_set_content'),
+    (Application, '_on_save'),
+    (BatchEntry, 'save'),
+    (Storage, 'write_many'),
+    (Storage, 'flush'),
+]
+
 if __name__ == '__main__':
-    run = Application()
-    run.mainloop()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='ABQ Data Entry')
+    parser.add_argument(
+        '--storage', choices=sorted(backends), default='csv',
+        help='where saved records go (default: csv); use shards when '
+        'several workstations save into the same directory'
+    )
+    parser.add_argument(
+        '--profile', metavar='FILE', default=os.environ.get('ABQ_PROFILE'),
+        help='time the hot paths and write the timings to FILE on exit'
+    )
+    parser.add_argument(
+        '--profile-overlay', action='store_true',
+        default=bool(os.environ.get('ABQ_PROFILE_OVERLAY')),
+        help='show the timings in a window while profiling'
+    )
+    parser.add_argument(
+        '--sync-url', metavar='URL', default=os.environ.get('ABQ_SYNC_URL'),
+        help='upload saved records to the collection server at URL'
+    )
+    args = parser.parse_args()
+    if args.profile or args.profile_overlay:
+        instrument.install(PROFILED, args.profile)
+    run = Application(storage=args.storage, sync_url=args.sync_url)
+    if args.profile_overlay:
+        instrument.show_overlay(run)
+    run.mainloop()
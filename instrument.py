@@ -0,0 +1,137 @@
+'''Timers for the application's hot paths, off unless asked for
+
+    ABQ_PROFILE=profile.json python data_entry_app.py
+    python data_entry_app.py --profile profile.json --profile-overlay
+
+install() swaps the methods it is given for timed wrappers, so when it
+is never called nothing is wrapped and nothing is paid. On exit the
+samples are written to the JSON file with, for each method, its call
+count, total, mean, p50, p95, p99 and maximum in milliseconds and a
+histogram of power of two buckets.
+'''
+from array import array
+from time import perf_counter
+import atexit
+import functools
+import json
+import math
+import os
+
+
+class Profile:
+    """Durations in milliseconds of each timed method's calls"""
+
+    def __init__(self):
+        self.samples = {}
+
+    def record(self, name, seconds):
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples.setdefault(name, array('d'))
+        samples.append(seconds * 1000)
+
+    def wrap(self, function, name, detail=None):
+        """Return function timed under name, plus detail(args) if given"""
+        record = self.record
+        if detail is None:
+            @functools.wraps(function)
+            def timed(*args, **kwargs):
+                start = perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    record(name, perf_counter() - start)
+        else:
+            @functools.wraps(function)
+            def timed(*args, **kwargs):
+                start = perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    record(f'{name}:{detail(args)}', perf_counter() - start)
+        return timed
+
+    def summary(self):
+        """Return {name: statistics} for every method called so far"""
+        summary = {}
+        for name, samples in sorted(self.samples.items()):
+            samples = sorted(samples)
+            if not samples:
+                continue
+            count = len(samples)
+            def pct(p):
+                return samples[min(count - 1, int(count * p))]
+            histogram = {}
+            for sample in samples:
+                bucket = 2.0 ** math.ceil(math.log2(max(sample, 2 ** -10)))
+                histogram[bucket] = histogram.get(bucket, 0) + 1
+            summary[name] = {
+                'count': count,
+                'total_ms': sum(samples),
+                'mean_ms': sum(samples) / count,
+                'p50_ms': pct(.5),
+                'p95_ms': pct(.95),
+                'p99_ms': pct(.99),
+                'max_ms': samples[-1],
+                # Calls taking at most each number of milliseconds
+                'histogram': [[bucket, n] for bucket, n in histogram.items()],
+            }
+        return summary
+
+    def write(self, filename):
+        """Write the summary to a JSON file"""
+        temporary = f'{filename}.tmp'
+        with open(temporary, 'w') as fh:
+            json.dump(self.summary(), fh, indent=1)
+        os.replace(temporary, filename)
+
+
+profile = None
+
+
+def install(targets, filename=None):
+    """Time the methods in targets, a list of (class, method name) or
+    (class, method name, detail) tuples, and return the Profile
+
+    detail is called with the method's arguments (self first) and its
+    result is added to the name, to split a method's timings by kind.
+    With filename, the summary is written there when Python exits.
+    """
+    global profile
+    if profile is None:
+        profile = Profile()
+        if filename:
+            atexit.register(profile.write, filename)
+    for cls, name, *detail in targets:
+        function = getattr(cls, name)
+        setattr(
+            cls, name,
+            profile.wrap(function, f'{cls.__name__}.{name}', *detail)
+        )
+    return profile
+
+
+def show_overlay(master, interval=500):
+    """Open a small window that keeps the timings on screen"""
+    import tkinter as tk
+
+    window = tk.Toplevel(master)
+    window.title('Timings')
+    window.attributes('-topmost', True)
+    text = tk.StringVar()
+    tk.Label(
+        window, textvariable=text, font='TkFixedFont', justify=tk.LEFT
+    ).pack(padx=5, pady=5)
+
+    def update():
+        lines = [f'{"":<32} {"calls":>7} {"p50":>7} {"p95":>7} {"p99":>7}']
+        for name, stats in profile.summary().items():
+            lines.append(
+                f'{name:<32} {stats["count"]:>7} {stats["p50_ms"]:>7.2f} '
+                f'{stats["p95_ms"]:>7.2f} {stats["p99_ms"]:>7.2f}'
+            )
+        text.set('\n'.join(lines))
+        window.after(interval, update)
+
+    update()
+    return window
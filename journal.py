@@ -0,0 +1,205 @@
+'''Crash-safe journal of saves and form drafts'''
+from pathlib import Path
+import json
+import os
+import struct
+import threading
+import zlib
+
+RECORD = b'R'
+DRAFT = b'D'
+_HEADER = struct.Struct('>IcI')
+_KEY = ('Date', 'Time', 'Lab', 'Plot')
+
+
+def _matches(saved, record):
+    """True if a record read back from storage is the one in the journal"""
+    for key, value in record.items():
+        stored = saved.get(key)
+        if stored == value or str(stored) == str(value):
+            continue
+        if stored in (None, '') and value in (None, ''):
+            continue
+        if isinstance(value, bool) and str(stored) == str(int(value)):
+            continue
+        return False
+    return True
+
+
+class Journal:
+    """An append-only log of saved records and snapshots of the form
+
+    Each entry is a 9 byte header (payload length, kind and CRC32 of the
+    payload) followed by a JSON payload. Saved records are fsynced before
+    they are handed to storage; drafts are only flushed, since losing the
+    last few seconds of typing is acceptable and an fsync per snapshot is
+    not. Reading stops at the first torn or corrupt entry, which is cut
+    off before anything new is appended.
+
+    Once the journal passes max_size, compact() rewrites it with just the
+    latest draft, after making sure every record in it is in storage and,
+    given an outbox, fsynced in the outbox.
+    """
+
+    def __init__(self, filename='abq_journal.bin', max_size=1 << 20):
+        self.filename = Path(filename)
+        self.max_size = max_size
+        self._lock = threading.RLock()
+        self._last_draft = None
+        valid = 0
+        for end, _, _ in self._read():
+            valid = end
+        self._fh = open(self.filename, 'ab')
+        if self._fh.tell() != valid:
+            self._fh.truncate(valid)
+            self._fh.seek(valid)
+
+    def _read(self):
+        """Yield (end offset, kind, payload) for each intact entry"""
+        try:
+            data = self.filename.read_bytes()
+        except FileNotFoundError:
+            return
+        offset = 0
+        while offset + _HEADER.size <= len(data):
+            length, kind, crc = _HEADER.unpack_from(data, offset)
+            start = offset + _HEADER.size
+            payload = data[start:start + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                return
+            offset = start + length
+            yield offset, kind, json.loads(payload)
+
+    def entries(self):
+        """Return [(kind, payload)] for each intact entry"""
+        with self._lock:
+            self._fh.flush()
+            return [(kind, payload) for _, kind, payload in self._read()]
+
+    def _append(self, kind, payload, sync):
+        data = json.dumps(payload, separators=(',', ':')).encode()
+        with self._lock:
+            self._fh.write(_HEADER.pack(len(data), kind, zlib.crc32(data)))
+            self._fh.write(data)
+            self._fh.flush()
+            if sync:
+                os.fsync(self._fh.fileno())
+
+    def append_record(self, data, datestring):
+        """Durably log a record about to be saved in datestring's file"""
+        self._append(RECORD, {'day': datestring, 'record': data}, sync=True)
+        self._last_draft = None
+
+    def append_records(self, records, datestring):
+        """Durably log several records with a single fsync"""
+        with self._lock:
+            for data in records:
+                self._append(
+                    RECORD, {'day': datestring, 'record': data}, sync=False
+                )
+            os.fsync(self._fh.fileno())
+        self._last_draft = None
+
+    def append_draft(self, values):
+        """Log the form's current values, unless they haven't changed"""
+        if values == self._last_draft:
+            return
+        self._last_draft = values
+        self._append(DRAFT, values, sync=False)
+
+    def size(self):
+        return self._fh.tell()
+
+    def needs_compaction(self):
+        return self.size() > self.max_size
+
+    def pending(self):
+        """Return the logged records and the draft that followed them"""
+        records = []
+        draft = None
+        for kind, payload in self.entries():
+            if kind == RECORD:
+                records.append(payload)
+                draft = None
+            elif kind == DRAFT:
+                draft = payload
+        return records, draft
+
+    def replay(self, store, outbox=None):
+        """Save any logged record missing from store, returning how many
+        were written and the draft to restore (or None)
+
+        With an outbox (see sync.py), any logged record that isn't in it
+        is queued for upload too, whether it was missing from store or a
+        crash came between writing it and queueing it.
+        """
+        records, draft = self.pending()
+        missing = self._missing(store, records)
+        if missing:
+            for entry in missing:
+                store.write(entry['record'], entry['day'])
+            store.sync()
+        if outbox is not None and records:
+            for entry in outbox.missing(records):
+                outbox.append([entry['record']], entry['day'])
+        return len(missing), draft
+
+    @staticmethod
+    def _missing(store, entries):
+        """Return the entries not in store, in the order they were logged
+
+        The journal holds the latest saves, so of the entries under one
+        key, those that reached storage are the last rows stored under
+        it, oldest first. A key logged once is checked against its last
+        row alone; only a key saved again needs all of its rows.
+        """
+        groups = {}
+        for entry in entries:
+            record = entry['record']
+            key = tuple(record.get(k) for k in _KEY)
+            groups.setdefault((entry['day'], key), []).append(entry)
+        written = set()
+        for (day, key), group in groups.items():
+            try:
+                if len(group) == 1:
+                    saved = store.find(key, day)
+                    rows = [] if saved is None else [saved]
+                else:
+                    rows = store.find_all(key, day)
+            except (OSError, ValueError):
+                rows = []
+            for count in range(min(len(group), len(rows)), 0, -1):
+                if all(
+                    _matches(saved, entry['record'])
+                    for saved, entry in zip(rows[-count:], group)
+                ):
+                    written.update(id(entry) for entry in group[:count])
+                    break
+        return [entry for entry in entries if id(entry) not in written]
+
+    def compact(self, store, outbox=None):
+        """Make sure everything logged is in store and outbox, then start
+        the journal again holding only the latest draft"""
+        with self._lock:
+            _, draft = self.replay(store, outbox)
+            store.sync()
+            if outbox is not None:
+                outbox.sync()
+            temporary = self.filename.with_name(self.filename.name + '.tmp')
+            with open(temporary, 'wb') as fh:
+                if draft is not None:
+                    data = json.dumps(draft, separators=(',', ':')).encode()
+                    fh.write(_HEADER.pack(len(data), DRAFT, zlib.crc32(data)))
+                    fh.write(data)
+                fh.flush()
+                os.fsync(fh.fileno())
+            self._fh.close()
+            os.replace(temporary, self.filename)
+            self._fh = open(self.filename, 'ab')
+            if outbox is not None:
+                # Nothing in the outbox can be queued again now
+                outbox.trim()
+
+    def close(self):
+        with self._lock:
+            self._fh.close()
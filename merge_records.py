@@ -0,0 +1,45 @@
+'''Build the daily record files from the shards written by each workstation
+
+    python -m merge_records [2026-10-18 ...] [--directory DIR]
+
+With no dates, every day that has shards is merged. The record browser
+does the same for the day it shows when the application is started with
+--storage shards.
+'''
+import argparse
+import sys
+
+from models import merge_shards, shard_directory
+
+
+def shard_dates(directory='.'):
+    """Return the dates that have shards in directory, oldest first"""
+    return sorted({
+        shard.name.split('.', 1)[0].rpartition('_')[2]
+        for shard in shard_directory(directory).glob('abq_data_record_*.*.csv')
+    })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Merge the ABQ record shards into the daily files'
+    )
+    parser.add_argument('dates', nargs='*', help='days to merge (YYYY-MM-DD)')
+    parser.add_argument(
+        '--directory', default='.', help='where the daily files live'
+    )
+    parser.add_argument(
+        '--force', action='store_true',
+        help='merge even if no shard has changed'
+    )
+    args = parser.parse_args(argv)
+    for datestring in args.dates or shard_dates(args.directory):
+        filename = merge_shards(datestring, args.directory, force=args.force)
+        if filename is None:
+            print(f'{datestring}: no shards', file=sys.stderr)
+        else:
+            print(filename)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,974 @@
+'''Storage for the ABQ Data Entry application'''
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from array import array
+import csv
+import io
+import locale
+import os
+import queue
+import socket
+import sqlite3
+import threading
+import time
+
+from archive import locate, open_day, read_records
+
+
+def today():
+    """Return today's date as used in the record file names"""
+    return datetime.today().strftime('%Y-%m-%d')
+
+
+def daily_filename(datestring=None, directory='.'):
+    """Return the path of the record file for the given date string"""
+    datestring = datestring or today()
+    return Path(directory) / f'abq_data_record_{datestring}.csv'
+
+
+class Storage:
+    """Base class for the places records can be saved
+
+    Subclasses implement _append(), _commit() and close(). Records are
+    buffered until the flush policy says otherwise: flush_every flushes
+    after that many records (1 flushes every record) and flush_interval
+    flushes once that many milliseconds have passed since the last flush.
+    """
+
+    def __init__(self, fields=None, flush_every=1, flush_interval=None):
+        self.fields = fields if isinstance(fields, dict) else None
+        self.fieldnames = list(fields) if fields else None
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def write(self, data, datestring=None):
+        """Save a record, in the file for datestring if there is one"""
+        self.write_many([data], datestring)
+
+    def write_many(self, rows, datestring=None):
+        """Save several records, flushing at most once"""
+        if not rows:
+            return
+        if self.fieldnames is None:
+            self.fieldnames = list(rows[0].keys())
+        self._append(rows, datestring)
+        self._written(len(rows))
+
+    def _written(self, count):
+        """Count records written, flushing if the policy says so"""
+        self._pending += count
+        if self._pending >= self.flush_every or self._interval_elapsed():
+            self.flush()
+
+    def _interval_elapsed(self):
+        if self.flush_interval is None:
+            return False
+        elapsed = (time.monotonic() - self._last_flush) * 1000
+        return elapsed >= self.flush_interval
+
+    def flush(self):
+        """Make buffered records durable"""
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        self._commit()
+        self._pending = 0
+
+    def sync(self):
+        """Flush and make sure everything written is on the disk"""
+        self.flush()
+
+    def records(self, datestring=None, **where):
+        """Yield the saved records for a day matching the given fields"""
+        raise NotImplementedError
+
+    def find(self, key, datestring=None):
+        """Return the record saved under (Date, Time, Lab, Plot), or None
+
+        datestring names the day it was saved on, if not the one in key.
+        """
+        raise NotImplementedError
+
+    def find_all(self, key, datestring=None):
+        """Return every record saved under key, oldest first
+
+        Unlike find() this reads the whole day, so it is meant for the
+        rare key that was saved more than once.
+        """
+        where = dict(zip(RecordIndex.key_fields, key))
+        return list(self.records(datestring or str(key[0]), **where))
+
+    def saved_keys(self, datestring=None):
+        """Yield the (Date, Time, Lab, Plot) key of every record saved on
+        a day
+
+        Unlike the other methods this may be called from another thread
+        while a SaveQueue is writing, so it reads without the store's own
+        files or connection.
+        """
+        raise NotImplementedError
+
+    def _append(self, rows, datestring=None):
+        raise NotImplementedError
+
+    def _commit(self):
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class RecordStore(Storage):
+    """Keeps the daily record file open between saves
+
+    fsync forces flushed data onto the disk rather than just handing it to
+    the operating system. With index set, each flush also brings the
+    file's RecordIndex up to date so find() never reads the whole file.
+    """
+
+    def __init__(
+        self, directory='.', fields=None, fsync=False, index=True, **kwargs
+    ):
+        super().__init__(fields, **kwargs)
+        self.directory = Path(directory)
+        self.fsync = fsync
+        self.indexed = index
+        self.index = None
+        self.filename = None
+        self._datestring = None
+        self._fh = None
+        self._writer = None
+
+    def _open(self, datestring):
+        """Open the file for datestring, writing the header if it is new"""
+        self.close()
+        self.filename = self._filename(datestring)
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+        self._fh = open(self.filename, 'a', newline='')
+        self._datestring = datestring
+        self._writer = csv.DictWriter(self._fh, fieldnames=self.fieldnames)
+        # In append mode the position is the end of the file, so a zero
+        # position means the file is new and needs a header.
+        if self._fh.tell() == 0:
+            self._writer.writeheader()
+            self._pending += 1
+        if self.indexed:
+            self.index = RecordIndex(self.filename)
+
+    def _filename(self, datestring):
+        return daily_filename(datestring, self.directory)
+
+    def _append(self, rows, datestring=None):
+        datestring = datestring or today()
+        if datestring != self._datestring:
+            self._open(datestring)
+        self._writer.writerows(rows)
+
+    def append_rows(self, rows, datestring=None):
+        """Append rows of values in field order to the file for datestring
+
+        This skips building a dict per record, for bulk writes.
+        """
+        if self.fieldnames is None:
+            raise ValueError('append_rows needs the store\'s fields')
+        datestring = datestring or today()
+        if datestring != self._datestring:
+            self._open(datestring)
+        self._writer.writer.writerows(rows)
+        self._written(len(rows))
+
+    def _commit(self):
+        if self._fh is None:
+            return
+        self._fh.flush()
+        if self.fsync:
+            os.fsync(self._fh.fileno())
+        if self.index is not None:
+            self.index.update()
+
+    def sync(self):
+        self._pending = max(self._pending, 1)
+        self.flush()
+        if self._fh is not None and not self.fsync:
+            os.fsync(self._fh.fileno())
+
+    def find(self, key, datestring=None):
+        """Look a record up through the daily file's index"""
+        datestring = datestring or str(key[0])
+        if datestring == self._datestring:
+            self.flush()
+            return self.index.get(key) if self.index else None
+        filename = self._filename(datestring)
+        if not filename.exists():
+            return self._find_archived(key, datestring)
+        index = RecordIndex(filename)
+        try:
+            return index.get(key)
+        finally:
+            index.close()
+
+    def _find_archived(self, key, datestring):
+        """Look a record up in an archived day by reading it through"""
+        filename = locate(self.directory, self._filename(datestring).name)
+        if filename is None:
+            return None
+        key = tuple(map(str, key))
+        found = None
+        for record in read_records(filename):
+            if tuple(record.get(f) for f in RecordIndex.key_fields) == key:
+                found = record
+        return found
+
+    def saved_keys(self, datestring=None):
+        """Read the keys from the daily file's index and what follows it"""
+        return read_keys(self._filename(datestring or today()))
+
+    def records(self, datestring=None, **where):
+        """Yield the records of a daily file by reading it through"""
+        filename = self._filename(datestring or today())
+        if datestring in (None, self._datestring):
+            self.flush()
+        filename = locate(filename.parent, filename.name)
+        if filename is None:
+            return
+        for row in read_records(filename):
+            if all(row[k] == str(v) for k, v in where.items()):
+                yield row
+
+    def close(self):
+        """Flush and close the open file"""
+        if self._fh is None:
+            return
+        self.flush()
+        self._fh.close()
+        self._fh = None
+        self._writer = None
+        if self.index is not None:
+            self.index.close()
+        self.index = None
+        self._datestring = None
+
+
+def shard_name():
+    """Return the name this workstation's shard files are written under"""
+    return socket.gethostname()
+
+
+def shard_directory(directory='.'):
+    """Return where the shards of the daily files in directory live"""
+    return Path(directory) / 'abq_shards'
+
+
+class ShardStore(RecordStore):
+    """A RecordStore for one of several writers sharing a directory
+
+    Each writer appends to its own shard of the daily file, named
+    abq_shards/abq_data_record_<date>.<writer>.csv, so no two processes
+    ever append to the same file. writer defaults to the host name, and
+    must be different for every process writing at the same time. Rows
+    carry the time they were saved in an extra column, which
+    merge_shards() uses to build the ordered daily file.
+    """
+
+    saved_field = '_saved'
+
+    def __init__(self, directory='.', fields=None, writer=None, **kwargs):
+        super().__init__(directory, fields, **kwargs)
+        self.writer = writer or shard_name()
+        if self.fieldnames is not None:
+            self.fieldnames.append(self.saved_field)
+
+    def _filename(self, datestring):
+        return shard_directory(self.directory) / (
+            f'abq_data_record_{datestring}.{self.writer}.csv'
+        )
+
+    @staticmethod
+    def _stamp():
+        return f'{time.time_ns():020d}'
+
+    def _append(self, rows, datestring=None):
+        if self.saved_field not in self.fieldnames:
+            self.fieldnames.append(self.saved_field)
+        saved = self._stamp()
+        super()._append(
+            [{**row, self.saved_field: saved} for row in rows], datestring
+        )
+
+    def append_rows(self, rows, datestring=None):
+        saved = self._stamp()
+        super().append_rows([(*row, saved) for row in rows], datestring)
+
+    def saved_keys(self, datestring=None):
+        """Read the keys from the merged daily file and every writer's
+        shard of it"""
+        datestring = datestring or today()
+        yield from read_keys(daily_filename(datestring, self.directory))
+        shards = shard_directory(self.directory)
+        for shard in shards.glob(f'abq_data_record_{datestring}.*.csv'):
+            yield from read_keys(shard)
+
+
+@contextmanager
+def _merge_lock(directory, timeout=10, stale=60):
+    """Hold a lock file in directory so only one merge runs at a time
+
+    A lock older than stale seconds was left by a merge that died and is
+    taken over.
+    """
+    lock = Path(directory) / 'merge.lock'
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time.time() - lock.stat().st_mtime > stale:
+                    lock.unlink()
+                    continue
+            except FileNotFoundError:
+                continue
+            if time.monotonic() > deadline:
+                raise TimeoutError(f'{lock} is held by another merge')
+            time.sleep(.05)
+    try:
+        yield
+    finally:
+        try:
+            lock.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def merge_shards(datestring=None, directory='.', force=False):
+    """Write the daily file for datestring from its shards, in the order
+    the records were saved, and return its path
+
+    The daily file is replaced in one step, so readers see either the
+    old or the new version. When the merge only adds rows after those
+    already in it, the usual case, they are appended instead, so the file
+    keeps its key index and the notes index reads just the new rows.
+    If it already held records before the first merge (saved by a single
+    writer), they are moved into a shard of their own and kept first.
+    Nothing is done unless a shard has changed since the last merge, or
+    force is set. Returns None if the day has no shards.
+    """
+    datestring = datestring or today()
+    shards = shard_directory(directory)
+    pattern = f'abq_data_record_{datestring}.*.csv'
+    target = daily_filename(datestring, directory)
+    marker = shards / f'abq_data_record_{datestring}.merged'
+    if not any(shards.glob(pattern)):
+        return None
+    with _merge_lock(shards):
+        filenames = sorted(shards.glob(pattern))
+        if marker.exists() and target.exists() and not force:
+            merged = target.stat().st_mtime
+            if all(f.stat().st_mtime < merged for f in filenames):
+                return target
+        if target.exists() and not marker.exists():
+            legacy = shards / f'abq_data_record_{datestring}.0.csv'
+            os.replace(target, legacy)
+            filenames.insert(0, legacy)
+        # From here on the daily file only ever holds merged shards
+        marker.touch()
+
+        saved_field = ShardStore.saved_field
+        fieldnames = None
+        rows = []
+        for filename in filenames:
+            records = RecordFile(filename)
+            names = records.fieldnames
+            if not names:
+                continue
+            if fieldnames is None:
+                fieldnames = [n for n in names if n != saved_field]
+            positions = [
+                names.index(n) if n in names else None for n in fieldnames
+            ]
+            saved = names.index(saved_field) if saved_field in names else None
+            for row in records.rows(0, len(records)):
+                rows.append((
+                    row[saved] if saved is not None else '',
+                    [row[i] if i is not None else '' for i in positions]
+                ))
+        # sort() is stable, so records saved together keep their order
+        rows.sort(key=lambda row: row[0])
+        if fieldnames is None:
+            return None
+
+        text = io.StringIO(newline='')
+        writer = csv.writer(text)
+        writer.writerow(fieldnames)
+        writer.writerows(row for _, row in rows)
+        data = text.getvalue().encode(locale.getpreferredencoding(False))
+        try:
+            with open(target, 'rb') as fh:
+                merged = fh.read()
+        except FileNotFoundError:
+            merged = None
+        if merged and data.startswith(merged):
+            # Only newer rows were added: append them, keeping the file
+            # and its key index
+            with open(target, 'ab') as fh:
+                fh.write(data[len(merged):])
+                fh.flush()
+                os.fsync(fh.fileno())
+            return target
+        temporary = target.with_name(target.name + '.tmp')
+        with open(temporary, 'wb') as fh:
+            fh.write(data)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(temporary, target)
+        # The old key index points into the file that was replaced
+        try:
+            target.with_name(target.name + '.idx').unlink()
+        except FileNotFoundError:
+            pass
+    return target
+
+
+def retire_shards(datestring, directory='.'):
+    """Merge datestring's shards and then delete them, leaving the daily
+    file to hold the day's records on its own
+
+    For days nobody is saving to any more, such as those being archived.
+    Returns False, keeping the shards, if one of them changed after the
+    merge.
+    """
+    target = merge_shards(datestring, directory)
+    if target is None:
+        return True
+    shards = shard_directory(directory)
+    with _merge_lock(shards):
+        filenames = list(shards.glob(f'abq_data_record_{datestring}.*.csv'))
+        merged = target.stat().st_mtime
+        if any(f.stat().st_mtime >= merged for f in filenames):
+            return False
+        for filename in filenames:
+            filename.unlink()
+            filename.with_name(filename.name + '.idx').unlink(missing_ok=True)
+        # Without its marker a day starts over from the daily file
+        (shards / f'abq_data_record_{datestring}.merged').unlink(
+            missing_ok=True
+        )
+    return True
+
+
+class SQLiteStorage(Storage):
+    """Saves records into an SQLite database
+
+    fields maps each field name to its Python type (str, float, int or
+    bool), which decides the column type. The connection is kept open in
+    WAL mode and each flush commits every record written since the last
+    one in a single transaction.
+    """
+
+    column_types = {str: 'TEXT', float: 'REAL', int: 'INTEGER', bool: 'INTEGER'}
+
+    def __init__(self, filename='abq_data_records.db', fields=None, **kwargs):
+        if not fields:
+            raise ValueError('SQLiteStorage needs the record fields')
+        super().__init__(fields, **kwargs)
+        self.filename = Path(filename)
+        columns = ', '.join(self._quote(f) for f in self.fieldnames)
+        params = ', '.join('?' for _ in self.fieldnames)
+        self._insert = f'INSERT INTO records ({columns}) VALUES ({params})'
+        self._connection = None
+
+    @staticmethod
+    def _quote(name):
+        return '"{}"'.format(name.replace('"', '""'))
+
+    @property
+    def connection(self):
+        """The shared connection, opened and set up on first use"""
+        if self._connection is None:
+            # SaveQueue writes from its worker thread and closes from the
+            # Tk thread, but never both at once.
+            self._connection = sqlite3.connect(
+                self.filename, check_same_thread=False
+            )
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            columns = ', '.join(
+                f'{self._quote(name)} {self.column_types.get(kind, "TEXT")}'
+                for name, kind in self.fields.items()
+            )
+            with self._connection:
+                self._connection.execute(
+                    f'CREATE TABLE IF NOT EXISTS records ({columns})'
+                )
+                self._connection.execute(
+                    'CREATE INDEX IF NOT EXISTS records_key ON records '
+                    '("Date", "Time", "Lab", "Plot")'
+                )
+        return self._connection
+
+    def _append(self, rows, datestring=None):
+        fieldnames = self.fieldnames
+        self.connection.executemany(self._insert, [
+            tuple(None if row[f] == '' else row[f] for f in fieldnames)
+            for row in rows
+        ])
+
+    def _commit(self):
+        self.connection.commit()
+
+    def records(self, datestring=None, **where):
+        """Yield the records for a day matching the given fields"""
+        self.flush()
+        where = {'Date': datestring or today(), **where}
+        clause = ' AND '.join(f'{self._quote(k)} = ?' for k in where)
+        cursor = self.connection.execute(
+            f'SELECT * FROM records WHERE {clause}', tuple(where.values())
+        )
+        names = [d[0] for d in cursor.description]
+        for row in cursor:
+            yield dict(zip(names, row))
+
+    def find(self, key, datestring=None):
+        """Look a record up through the table's key index"""
+        self.flush()
+        cursor = self.connection.execute(
+            'SELECT * FROM records WHERE "Date" = ? AND "Time" = ? '
+            'AND "Lab" = ? AND "Plot" = ? ORDER BY rowid DESC LIMIT 1',
+            tuple(str(k) for k in key)
+        )
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip((d[0] for d in cursor.description), row))
+
+    def saved_keys(self, datestring=None):
+        """Read the day's keys through a connection of its own"""
+        if not self.filename.exists():
+            return
+        connection = sqlite3.connect(self.filename)
+        try:
+            cursor = connection.execute(
+                'SELECT "Date", "Time", "Lab", "Plot" FROM records '
+                'WHERE "Date" = ?', (datestring or today(),)
+            )
+            for key in cursor:
+                yield tuple('' if k is None else str(k) for k in key)
+        except sqlite3.OperationalError:
+            # No records table until the first save
+            return
+        finally:
+            connection.close()
+
+    def close(self):
+        """Commit and close the connection"""
+        if self._connection is None:
+            return
+        self.flush()
+        self._connection.close()
+        self._connection = None
+
+
+backends = {
+    'csv': RecordStore, 'shards': ShardStore, 'sqlite': SQLiteStorage
+}
+
+
+def make_storage(backend='csv', **kwargs):
+    """Create the storage backend named by backend"""
+    try:
+        cls = backends[backend]
+    except KeyError:
+        raise ValueError(f'Unknown storage backend: {backend}')
+    return cls(**kwargs)
+
+
+def scan_rows(fh, position=0):
+    """Yield the offset and raw bytes of each complete row in a CSV file
+
+    fh is a binary file, read from position. Quoted fields may span lines
+    (Notes often do), so a row only ends at a newline once the quotes seen
+    so far are balanced. A partly written last row is not yielded.
+    """
+    fh.seek(position)
+    parts = []
+    quotes = 0
+    for line in fh:
+        quotes += line.count(b'"')
+        if quotes % 2 or not line.endswith(b'\n'):
+            parts.append(line)
+            continue
+        if parts:
+            parts.append(line)
+            line = b''.join(parts)
+            parts = []
+        yield position, line
+        position += len(line)
+        quotes = 0
+
+
+class RecordFile:
+    """Random access to the rows of a record CSV file
+
+    Opening the file records where each row starts in a compact array of
+    byte offsets; rows are only parsed when rows() asks for them. The
+    file may be an archived day, read through open_day().
+    """
+
+    def __init__(self, filename, encoding=None):
+        self.filename = Path(filename)
+        self.encoding = encoding or locale.getpreferredencoding(False)
+        self.fieldnames = []
+        self._offsets = array('q')
+        self._end = 0
+        self.refresh()
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def refresh(self):
+        """Index any rows appended since the file was last read"""
+        offsets = self._offsets
+        start = row = None
+        with open_day(self.filename) as fh:
+            for start, row in scan_rows(fh, self._end):
+                if self.fieldnames:
+                    offsets.append(start)
+                else:
+                    header = row.decode(self.encoding)
+                    self.fieldnames = next(csv.reader([header]))
+        # A partly written last row is picked up on the next refresh
+        if row is not None:
+            self._end = start + len(row)
+
+    def rows(self, start, stop):
+        """Return rows start to stop as lists of strings"""
+        start = max(start, 0)
+        stop = min(stop, len(self._offsets))
+        if start >= stop:
+            return []
+        begin = self._offsets[start]
+        end = self._offsets[stop] if stop < len(self._offsets) else self._end
+        with open_day(self.filename) as fh:
+            fh.seek(begin)
+            text = fh.read(end - begin).decode(self.encoding)
+        return list(csv.reader(io.StringIO(text, newline='')))
+
+
+class RecordIndex:
+    """Finds records in a daily file by key without reading the whole file
+
+    The index lives in a sidecar file next to the CSV (the CSV name plus
+    .idx) with one line per record: its byte offset, the offset just past
+    it and its Date, Time, Lab and Plot. update() only reads rows appended
+    since the last call, and the index is rebuilt from scratch when the
+    sidecar is missing, does not match the CSV or points at the wrong row.
+    When a key was saved more than once the last record wins.
+    """
+    key_fields = ('Date', 'Time', 'Lab', 'Plot')
+
+    def __init__(self, filename, encoding=None):
+        self.filename = Path(filename)
+        self.index_filename = self.filename.with_name(
+            self.filename.name + '.idx'
+        )
+        self.encoding = encoding or locale.getpreferredencoding(False)
+        self.fieldnames = None
+        self._offsets = {}
+        self._end = 0
+        self._csv_fh = None
+        self._index_fh = None
+        self._load()
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __contains__(self, key):
+        return tuple(map(str, key)) in self._offsets
+
+    def _load(self):
+        """Read the sidecar, throwing it away if it looks stale"""
+        try:
+            with open(self.index_filename, newline='') as fh:
+                for start, end, *key in csv.reader(fh):
+                    self._offsets[tuple(key)] = int(start)
+                    self._end = int(end)
+        except (OSError, ValueError):
+            self._reset()
+        size = self.filename.stat().st_size if self.filename.exists() else 0
+        if self._end > size:
+            self._reset()
+
+    def _reset(self):
+        self._offsets = {}
+        self._end = 0
+        self.fieldnames = None
+        if self._index_fh is not None:
+            self._index_fh.close()
+            self._index_fh = None
+        self.index_filename.unlink(missing_ok=True)
+
+    def _csv(self):
+        """The CSV, kept open for reading between updates"""
+        if self._csv_fh is None:
+            self._csv_fh = open(self.filename, 'rb')
+        return self._csv_fh
+
+    def _parse(self, row):
+        return next(csv.reader([row.decode(self.encoding)]))
+
+    def _key_of(self, values):
+        return tuple(values[self._key_positions[f]] for f in self.key_fields)
+
+    def _read_header(self, fh):
+        for _, row in scan_rows(fh):
+            self.fieldnames = self._parse(row)
+            self._key_positions = {
+                f: self.fieldnames.index(f) for f in self.key_fields
+            }
+            return len(row)
+        return 0
+
+    def update(self):
+        """Index the rows appended to the CSV since the last update"""
+        if self._csv_fh is None and not self.filename.exists():
+            return
+        fh = self._csv()
+        if self.fieldnames is None:
+            header_end = self._read_header(fh)
+            if not header_end:
+                return
+            self._end = max(self._end, header_end)
+        entries = []
+        for start, row in scan_rows(fh, self._end):
+            key = self._key_of(self._parse(row))
+            self._offsets[key] = start
+            self._end = start + len(row)
+            entries.append((start, self._end, *key))
+        if entries:
+            if self._index_fh is None:
+                self._index_fh = open(self.index_filename, 'a', newline='')
+            csv.writer(self._index_fh).writerows(entries)
+            self._index_fh.flush()
+
+    def rebuild(self):
+        """Throw the index away and index the whole CSV again"""
+        self._reset()
+        self.update()
+
+    def get(self, key, _retry=True):
+        """Return the record saved under key as a dict, or None"""
+        key = tuple(map(str, key))
+        self.update()
+        start = self._offsets.get(key)
+        if start is None:
+            return None
+        row = next(scan_rows(self._csv(), start), (None, b''))[1]
+        values = self._parse(row) if row else []
+        if len(values) == len(self.fieldnames) and self._key_of(values) == key:
+            return dict(zip(self.fieldnames, values))
+        if _retry:
+            self.rebuild()
+            return self.get(key, _retry=False)
+        return None
+
+    def close(self):
+        """Close the files the index keeps open"""
+        for fh in (self._csv_fh, self._index_fh):
+            if fh is not None:
+                fh.close()
+        self._csv_fh = self._index_fh = None
+
+
+def read_keys(filename, encoding=None):
+    """Return the key of every record in a daily file
+
+    Keys come from the file's RecordIndex sidecar as far as it goes, and
+    the rest of the file (all of it, with no usable sidecar) is read in a
+    single streaming pass. Nothing is written, so this is safe while the
+    file's RecordStore appends to it and updates the sidecar.
+    """
+    filename = Path(filename)
+    encoding = encoding or locale.getpreferredencoding(False)
+    try:
+        size = filename.stat().st_size
+    except FileNotFoundError:
+        return []
+    keys = []
+    end = 0
+    sidecar = filename.with_name(filename.name + '.idx')
+    try:
+        with open(sidecar, newline='') as fh:
+            for start, stop, *key in csv.reader(fh):
+                keys.append(tuple(key))
+                end = int(stop)
+    except (OSError, ValueError):
+        keys, end = [], 0
+    if end > size:
+        keys, end = [], 0
+    with open(filename, 'rb') as fh:
+        rows = scan_rows(fh)
+        header = next(rows, None)
+        if header is None:
+            return keys
+        fieldnames = next(csv.reader([header[1].decode(encoding)]))
+        positions = [fieldnames.index(f) for f in RecordIndex.key_fields]
+        for _, row in scan_rows(fh, max(end, len(header[1]))):
+            values = next(csv.reader([row.decode(encoding)]))
+            if len(values) == len(fieldnames):
+                keys.append(tuple(values[i] for i in positions))
+    return keys
+
+
+class SavedKeys:
+    """The keys of the records saved on each day, for catching duplicates
+
+    A day's keys are loaded with the store's saved_keys() the first time
+    that day is asked about and are then kept current by add(), so
+    checking a record is a set lookup however large the file has grown.
+    Only the most recent few days are kept.
+    """
+
+    def __init__(self, store, days=2):
+        self.store = store
+        self.days = days
+        self._keys = OrderedDict()
+
+    @staticmethod
+    def key(record):
+        return tuple(str(record.get(f, '')) for f in RecordIndex.key_fields)
+
+    def load(self, datestring=None):
+        """Return the set of keys saved on a day, reading them if needed"""
+        datestring = datestring or today()
+        keys = self._keys.get(datestring)
+        if keys is None:
+            keys = self._keys[datestring] = set(
+                self.store.saved_keys(datestring)
+            )
+            while len(self._keys) > self.days:
+                self._keys.popitem(last=False)
+        else:
+            self._keys.move_to_end(datestring)
+        return keys
+
+    def seen(self, record, datestring=None):
+        """Return whether a record with the same key was saved that day"""
+        return self.key(record) in self.load(datestring)
+
+    def add(self, record, datestring=None):
+        self.load(datestring).add(self.key(record))
+
+
+class SaveQueue:
+    """Writes records to a Storage on a background thread
+
+    Records go in through submit(), which raises queue.Full rather than
+    blocking when maxsize records are already waiting. Every job comes
+    back out of the results queue as ((record, datestring), error), where
+    error is None when the write succeeded, so nothing is dropped
+    silently. A failed record that had already been journalled comes back
+    as (record, datestring, True), to be submitted again with journaled
+    set so the journal doesn't hold it twice. The worker owns the store,
+    including the interval flushes.
+    With a journal, each record is logged to it before it is written,
+    and the journal is compacted once it grows past its limit. With an
+    outbox, each record is queued for upload as soon as it is written.
+    """
+
+    def __init__(self, store, maxsize=1000, journal=None, outbox=None):
+        self.store = store
+        self.journal = journal
+        self.outbox = outbox
+        self.results = queue.Queue()
+        self._jobs = queue.Queue(maxsize)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, data, datestring=None, block=False, journaled=False):
+        """Queue a record for writing to datestring's file"""
+        self._jobs.put((data, datestring or today(), journaled), block=block)
+
+    def submit_many(self, rows, datestring=None, block=False):
+        """Queue several records to be written together
+
+        They are journalled with one fsync and written with one
+        write_many(), but still come back out of results one by one.
+        """
+        self._jobs.put((list(rows), datestring or today(), False), block=block)
+
+    def pending(self):
+        """Return the number of records waiting to be written"""
+        return self._jobs.qsize()
+
+    def _run(self):
+        interval = self.store.flush_interval
+        timeout = interval / 1000 if interval else None
+        while True:
+            try:
+                job = self._jobs.get(timeout=timeout)
+            except queue.Empty:
+                self._flush()
+                continue
+            if job is None:
+                break
+            data, datestring, journaled = job
+            batch = isinstance(data, list)
+            try:
+                if batch:
+                    if self.journal is not None:
+                        self.journal.append_records(data, datestring)
+                        journaled = True
+                    self.store.write_many(data, datestring)
+                else:
+                    if self.journal is not None and not journaled:
+                        self.journal.append_record(data, datestring)
+                        journaled = True
+                    self.store.write(data, datestring)
+            except Exception as e:
+                error = e
+            else:
+                error = None
+                self._after_write(data if batch else [data], datestring)
+            for record in data if batch else [data]:
+                if error is not None and journaled:
+                    self.results.put(((record, datestring, True), error))
+                else:
+                    self.results.put(((record, datestring), error))
+        self._flush()
+
+    def _after_write(self, records, datestring):
+        """Queue written records for upload and compact the journal
+
+        The records are saved by now, so a failure here comes back out of
+        results on its own rather than as a failed save.
+        """
+        try:
+            if self.outbox is not None:
+                self.outbox.append(records, datestring)
+            if self.journal is not None and self.journal.needs_compaction():
+                self.journal.compact(self.store, self.outbox)
+        except Exception as e:
+            self.results.put((None, e))
+
+    def _flush(self):
+        try:
+            self.store.flush()
+        except OSError as e:
+            self.results.put((None, e))
+
+    def close(self):
+        """Write everything still queued, then close the store"""
+        self._jobs.put(None)
+        self._thread.join()
+        self.store.close()
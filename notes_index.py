@@ -0,0 +1,347 @@
+'''Full-text search over the Notes of every saved record
+
+    python -m notes_index rebuild --jobs 4
+    python -m notes_index search mildew '"sensor reset"'
+
+The index is an SQLite database (abq_notes.db) of postings: for every
+term, the daily files and byte offsets of the rows whose Notes hold it.
+Each file's entry remembers how far it has been indexed, so update()
+only reads rows appended since; the application calls it after saves.
+A query matches rows holding all of its terms; quoted phrases are then
+checked against the notes themselves.
+'''
+from itertools import groupby
+from operator import itemgetter
+from pathlib import Path
+import argparse
+import csv
+import locale
+import re
+import shlex
+import sqlite3
+import sys
+
+from archive import day_files, day_name, is_archived, locate, open_day, size
+from models import scan_rows
+
+_TERM = re.compile(r'\w+')
+
+
+def terms(text):
+    """Return the distinct search terms in text"""
+    return set(_TERM.findall(text.casefold()))
+
+
+def _normalise(text):
+    return ' '.join(_TERM.findall(text.casefold()))
+
+
+def _header(fh, encoding):
+    for _, row in scan_rows(fh):
+        return next(csv.reader([row.decode(encoding)]))
+    return []
+
+
+def index_file(filename, start=0):
+    """Return (end offset, [(term, row offset)]) for the rows of a daily
+    file from start on"""
+    encoding = locale.getpreferredencoding(False)
+    postings = []
+    end = start
+    with open_day(filename) as fh:
+        header = _header(fh, encoding)
+        if 'Notes' not in header:
+            return end, postings
+        notes = header.index('Notes')
+        for offset, row in scan_rows(fh, start):
+            end = offset + len(row)
+            if offset == 0:
+                continue
+            values = next(csv.reader([row.decode(encoding)]), [])
+            if len(values) > notes and values[notes]:
+                postings.extend((term, offset) for term in terms(values[notes]))
+    return end, postings
+
+
+def _index_whole_file(filename):
+    """Worker task for rebuild()"""
+    inode = None if is_archived(filename) else Path(filename).stat().st_ino
+    end, postings = index_file(filename)
+    return day_name(filename), inode, end, postings
+
+
+def parse_query(query):
+    """Split a query into its terms and its quoted phrases"""
+    words = []
+    phrases = []
+    for part in shlex.split(query):
+        if ' ' in part.strip():
+            phrases.append(_normalise(part))
+        words.extend(terms(part))
+    return words, phrases
+
+
+class NotesIndex:
+    """The postings of the Notes in the daily files of a directory"""
+
+    # How many files new to the index it takes for update_all() to start
+    # a pool of processes
+    pool_size = 4
+
+    def __init__(self, directory='.', filename='abq_notes.db'):
+        self.directory = Path(directory)
+        self.filename = self.directory / filename
+        self.connection = sqlite3.connect(self.filename)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS files (
+                id INTEGER PRIMARY KEY, name TEXT UNIQUE,
+                inode INTEGER, indexed INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT, file INTEGER, offset INTEGER,
+                PRIMARY KEY (term, file, offset)
+            ) WITHOUT ROWID;
+        ''')
+
+    def _files(self):
+        return day_files(self.directory)
+
+    def _file_id(self, name):
+        row = self.connection.execute(
+            'SELECT id FROM files WHERE name = ?', (name,)
+        ).fetchone()
+        if row is not None:
+            return row[0]
+        return self.connection.execute(
+            'INSERT INTO files (name, inode, indexed) VALUES (?, NULL, 0)',
+            (name,)
+        ).lastrowid
+
+    def _store(self, name, inode, end, postings, replace=False):
+        file = self._file_id(name)
+        if replace:
+            self.connection.execute(
+                'DELETE FROM postings WHERE file = ?', (file,)
+            )
+        self.connection.executemany(
+            'INSERT OR IGNORE INTO postings VALUES (?, ?, ?)',
+            ((term, file, offset) for term, offset in postings)
+        )
+        self.connection.execute(
+            'UPDATE files SET inode = ?, indexed = ? WHERE id = ?',
+            (inode, end, file)
+        )
+
+    def update(self, filename):
+        """Index the rows appended to a daily file since the last update
+
+        A file that was replaced or cut short is indexed again from the
+        start. An archived day holds the same rows at the same offsets,
+        so once its last rows are indexed it is never read again.
+        """
+        filename = Path(filename)
+        name = day_name(filename)
+        archived = is_archived(filename)
+        row = self.connection.execute(
+            'SELECT inode, indexed FROM files WHERE name = ?', (name,)
+        ).fetchone()
+        if archived and row is not None and row[0] is None:
+            return 0
+        try:
+            inode = None if archived else filename.stat().st_ino
+            length = size(filename)
+        except FileNotFoundError:
+            return 0
+        start = 0
+        if row is not None and row[1] <= length and (
+            archived or row[0] == inode
+        ):
+            start = row[1]
+            if start == length and row[0] == inode:
+                return 0
+        end, postings = index_file(filename, start)
+        with self.connection:
+            self._store(name, inode, end, postings, replace=start == 0)
+        return len(postings)
+
+    def update_all(self, progress=None, stop=None, jobs=None):
+        """Bring every daily file in the directory up to date
+
+        Files the index has never seen, when there are pool_size or more
+        of them (other writers' days, or every day the first time), are
+        indexed whole in a pool of jobs processes as rebuild() does; the
+        rest are updated here. progress, if given, is called with the
+        number of files done and the number in all after each one.
+        Setting the stop event ends the update after the file in hand.
+        """
+        filenames = self._files()
+        known = {
+            row[0] for row in self.connection.execute('SELECT name FROM files')
+        }
+        new = [f for f in filenames if day_name(f) not in known]
+        if len(new) < self.pool_size:
+            new = []
+        count, done = self._index_whole(
+            new, jobs, progress, stop, len(filenames)
+        )
+        new = set(new)
+        for filename in filenames:
+            if stop is not None and stop.is_set():
+                break
+            if filename in new:
+                continue
+            count += self.update(filename)
+            done += 1
+            if progress is not None:
+                progress(done, len(filenames))
+        return count
+
+    def rebuild(self, jobs=None, progress=None, stop=None):
+        """Index every daily file from scratch in a pool of processes
+
+        progress and stop are as for update_all(). Files not reached
+        before a stop are left for the next update_all().
+        """
+        filenames = self._files()
+        with self.connection:
+            self.connection.execute('DELETE FROM postings')
+            self.connection.execute('DELETE FROM files')
+        count, _ = self._index_whole(
+            filenames, jobs, progress, stop, len(filenames)
+        )
+        return count
+
+    def _index_whole(self, filenames, jobs, progress, stop, total):
+        """Index filenames from the start in a pool of jobs processes,
+        returning the postings added and the files done"""
+        if not filenames:
+            return 0, 0
+        # Imported here as it takes a while, and the application only
+        # starts a pool away from startup
+        from concurrent.futures import ProcessPoolExecutor
+
+        count = 0
+        done = 0
+        with ProcessPoolExecutor(jobs) as executor:
+            for name, inode, end, postings in executor.map(
+                _index_whole_file, filenames
+            ):
+                with self.connection:
+                    self._store(name, inode, end, postings, replace=True)
+                count += len(postings)
+                done += 1
+                if progress is not None:
+                    progress(done, total)
+                if stop is not None and stop.is_set():
+                    executor.shutdown(cancel_futures=True)
+                    break
+        return count, done
+
+    def postings(self, term):
+        """Return the set of (file name, offset) for rows holding term"""
+        return set(self.connection.execute(
+            'SELECT files.name, postings.offset FROM postings '
+            'JOIN files ON files.id = postings.file WHERE postings.term = ?',
+            (term,)
+        ))
+
+    def search(self, query, limit=100):
+        """Return (file name, record) for rows matching query, newest
+        first
+
+        Every term must be in a row's Notes, and every quoted phrase must
+        appear in them as written (ignoring case and punctuation).
+        """
+        words, phrases = parse_query(query)
+        if not words:
+            return []
+        # Start from the rarest term so the intersections stay small
+        sets = sorted((self.postings(word) for word in words), key=len)
+        matches = sets[0]
+        for other in sets[1:]:
+            if not matches:
+                break
+            matches &= other
+        results = []
+        for name, record in self.records(sorted(matches, reverse=True)):
+            notes = _normalise(record.get('Notes', ''))
+            if all(phrase in notes for phrase in phrases):
+                results.append((name, record))
+                if len(results) >= limit:
+                    break
+        return results
+
+    def records(self, postings):
+        """Yield (file name, record) for each (file name, offset), opening
+        each file once for a run of offsets in it"""
+        encoding = locale.getpreferredencoding(False)
+        for name, run in groupby(postings, key=itemgetter(0)):
+            filename = locate(self.directory, name)
+            try:
+                fh = open_day(filename) if filename else None
+            except FileNotFoundError:
+                fh = None
+            if fh is None:
+                continue
+            with fh:
+                header = _header(fh, encoding)
+                for _, offset in run:
+                    for _, row in scan_rows(fh, offset):
+                        values = next(csv.reader([row.decode(encoding)]))
+                        yield name, dict(zip(header, values))
+                        break
+
+    def read(self, name, offset):
+        """Return the record at offset in a daily file as a dict"""
+        for _, record in self.records([(name, offset)]):
+            return record
+        return None
+
+    def close(self):
+        self.connection.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Search the Notes of the ABQ daily record files'
+    )
+    parser.add_argument(
+        '--directory', default='.', help='where the daily files live'
+    )
+    commands = parser.add_subparsers(dest='command', required=True)
+    rebuild = commands.add_parser('rebuild', help='index every file again')
+    rebuild.add_argument('--jobs', type=int, default=None)
+    update = commands.add_parser(
+        'update', help='index rows added since last time'
+    )
+    update.add_argument('--jobs', type=int, default=None)
+    search = commands.add_parser('search', help='find records by their notes')
+    search.add_argument('query', nargs='+')
+    search.add_argument('--limit', type=int, default=100)
+    args = parser.parse_args(argv)
+
+    index = NotesIndex(args.directory)
+    try:
+        if args.command == 'rebuild':
+            count = index.rebuild(args.jobs)
+            print(f'{count} postings indexed', file=sys.stderr)
+        elif args.command == 'update':
+            count = index.update_all(jobs=args.jobs)
+            print(f'{count} postings added', file=sys.stderr)
+        else:
+            index.update_all()
+            query = ' '.join(shlex.quote(part) for part in args.query)
+            writer = csv.writer(sys.stdout)
+            for name, record in index.search(query, args.limit):
+                writer.writerow([
+                    name, record.get('Date'), record.get('Time'),
+                    record.get('Lab'), record.get('Plot'), record.get('Notes')
+                ])
+    finally:
+        index.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,304 @@
+'''The record schema for the ABQ Data Entry application
+
+Every field of a record is described once here. The form builds its
+variables and widgets from it, the validated widgets and the bulk
+importer use its checkers, and storage takes its column layout from it.
+'''
+from datetime import datetime
+from math import isfinite
+import re
+
+# strptime() alone takes 2025-3-1, which would name a daily file no one
+# else can find
+_DATE = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+
+class Field:
+    """One field of a record
+
+    widget names the kind of input the form builds ('date', 'entry',
+    'combobox', 'radio', 'spinbox', 'check' or 'text'). check() is built
+    once from the rest of the description and returns an error message
+    for a bad value, or '' for a good one.
+    """
+
+    def __init__(
+        self, name, type=str, widget='entry', label=None, section=None,
+        row=0, column=0, columnspan=1, values=None, min=None, max=None,
+        increment=None, required=True, blank_on_fault=False, input_args=None
+    ):
+        self.name = name
+        self.type = type
+        self.widget = widget
+        self.label = label or name
+        self.section = section
+        self.row = row
+        self.column = column
+        self.columnspan = columnspan
+        self.values = [str(v) for v in values] if values else None
+        self.min = min
+        self.max = max
+        self.increment = increment
+        self.required = required
+        self.blank_on_fault = blank_on_fault
+        self.input_args = input_args or {}
+        self.check = self._make_checker()
+
+    def __repr__(self):
+        return f'Field({self.name!r}, {self.type.__name__})'
+
+    def default(self):
+        """The value a reset form holds"""
+        return False if self.type is bool else ''
+
+    def check_column(self, values):
+        """Check a column of strings, returning {row: message} for the bad
+        ones
+
+        Whole columns are checked in C where possible: numbers are
+        converted with map() and range checked with min() and max(), and
+        other fields only check each distinct value once. The per-value
+        checker only runs on a column known to hold a bad value.
+        """
+        if self.type in (int, float):
+            if '' not in values:
+                try:
+                    numbers = list(map(self.type, values))
+                except (TypeError, ValueError):
+                    pass
+                else:
+                    # nan passes every comparison, so is ruled out first
+                    if not numbers or (
+                        (self.type is int or all(map(isfinite, numbers)))
+                        and (self.min is None or min(numbers) >= self.min)
+                        and (self.max is None or max(numbers) <= self.max)
+                    ):
+                        return {}
+            check = self.check
+            return {
+                row: message for row, message in enumerate(map(check, values))
+                if message
+            }
+        bad = {}
+        for value in set(values):
+            message = self.check(value)
+            if message:
+                bad[value] = message
+        if not bad:
+            return {}
+        return {
+            row: bad[value] for row, value in enumerate(values)
+            if value in bad
+        }
+
+    def _make_checker(self):
+        """Build the function that checks a value typed into this field"""
+        required = self.required
+        if self.widget == 'date':
+            def check(value):
+                if not value:
+                    return 'A value is required' if required else ''
+                if not _DATE.fullmatch(value):
+                    return 'Invalid date'
+                try:
+                    datetime.strptime(value, '%Y-%m-%d')
+                except ValueError:
+                    return 'Invalid date'
+                return ''
+        elif self.values:
+            allowed = frozenset(self.values)
+            def check(value):
+                if not value:
+                    return 'A value is required' if required else ''
+                return '' if value in allowed else 'Not a valid choice'
+        elif self.type in (int, float):
+            convert = self.type
+            low, high = self.min, self.max
+            kind = 'a whole number' if convert is int else 'a number'
+            def check(value):
+                if value == '' or value is None:
+                    return 'A value is required' if required else ''
+                try:
+                    number = convert(value)
+                except (TypeError, ValueError):
+                    return f'Must be {kind}'
+                # float() takes 'nan' and 'inf', which no range rules out
+                if convert is float and not isfinite(number):
+                    return f'Must be {kind}'
+                if low is not None and number < low:
+                    return f'Value must be at least {low}'
+                if high is not None and number > high:
+                    return f'Value must be at most {high}'
+                return ''
+        elif self.type is bool:
+            def check(value):
+                return ''
+        else:
+            def check(value):
+                if required and not value:
+                    return 'A value is required'
+                return ''
+        return check
+
+
+def _true(value):
+    return value is True or str(value).lower() in ('true', '1', 'yes', 'on')
+
+
+class Schema:
+    """A compiled list of fields"""
+
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+        self.by_name = {f.name: f for f in self.fields}
+        self.names = [f.name for f in self.fields]
+        self.types = {f.name: f.type for f in self.fields}
+        self.checkers = {f.name: f.check for f in self.fields}
+        self.fault_fields = tuple(
+            f.name for f in self.fields if f.blank_on_fault
+        )
+        self.sections = list(dict.fromkeys(
+            f.section for f in self.fields if f.section
+        ))
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __getitem__(self, name):
+        return self.by_name[name]
+
+    def section(self, name):
+        """Return the fields shown in a section, in order"""
+        return [f for f in self.fields if f.section == name]
+
+    def defaults(self):
+        """Return a record with every field reset"""
+        return {f.name: f.default() for f in self.fields}
+
+    def check_columns(self, columns):
+        """Check a batch of records held as {field: [strings]}, returning
+        {row: {field: message}} for the rows with bad values
+
+        Rows with an equipment fault skip the fault_fields, as the form
+        does.
+        """
+        count = len(next(iter(columns.values()), []))
+        faults = self.faults(columns.get('Equipment Fault', [''] * count))
+        keep = None
+        if faults:
+            keep = [row for row in range(count) if row not in faults]
+        errors = {}
+        for field in self.fields:
+            values = columns.get(field.name)
+            if values is None:
+                values = [''] * count
+            if keep is not None and field.blank_on_fault:
+                bad = field.check_column([values[row] for row in keep])
+                bad = {keep[row]: message for row, message in bad.items()}
+            else:
+                bad = field.check_column(values)
+            for row, message in bad.items():
+                errors.setdefault(row, {})[field.name] = message
+        return errors
+
+    def convert(self, record):
+        """Return a record of strings with each value as its field's type
+
+        Blank values stay ''. On a record with an equipment fault the
+        fault_fields are blanked, as the form does.
+        """
+        fault = _true(record.get('Equipment Fault', ''))
+        data = {}
+        for field in self.fields:
+            value = record.get(field.name, '')
+            if fault and field.blank_on_fault:
+                value = ''
+            elif field.type is bool:
+                value = _true(value)
+            elif value != '':
+                value = field.type(value)
+            data[field.name] = value
+        return data
+
+    @staticmethod
+    def faults(values):
+        """Return the set of rows whose Equipment Fault value is true"""
+        true = {value for value in set(values) if _true(value)}
+        if not true:
+            return set()
+        return {row for row, value in enumerate(values) if value in true}
+
+    def errors(self, record):
+        """Return {field: message} for the bad values in a record of
+        strings, ignoring environment fields when there is a fault"""
+        fault = _true(record.get('Equipment Fault', ''))
+        errors = {}
+        for name, check in self.checkers.items():
+            if fault and name in self.fault_fields:
+                continue
+            message = check(record.get(name, ''))
+            if message:
+                errors[name] = message
+        return errors
+
+
+RECORD_SCHEMA = Schema([
+    Field('Date', widget='date', section='Record Information'),
+    Field(
+        'Time', widget='combobox', section='Record Information', column=1,
+        values=['8:00', '12:00', '16:00', '20:00']
+    ),
+    Field('Technician', section='Record Information', column=2),
+    Field(
+        'Lab', widget='radio', section='Record Information', row=1,
+        values=['A', 'B', 'C']
+    ),
+    Field(
+        'Plot', widget='combobox', section='Record Information', row=1,
+        column=1, values=range(1, 21)
+    ),
+    Field('Seed Sample', section='Record Information', row=1, column=2),
+    Field(
+        'Humidity', float, 'spinbox', 'Humidity (g/m\u00b3)',
+        'Environment Data', min=0.5, max=52.0, increment=.01,
+        blank_on_fault=True
+    ),
+    Field(
+        'Light', float, 'spinbox', 'Light (klx)', 'Environment Data',
+        column=1, min=0, max=100, increment=.01, blank_on_fault=True
+    ),
+    Field(
+        'Temperature', float, 'spinbox', 'Temperature \u00b0\u0043',
+        'Environment Data', column=2, min=4, max=40, increment=.01,
+        blank_on_fault=True
+    ),
+    Field(
+        'Equipment Fault', bool, 'check', section='Environment Data',
+        row=1, column=1, columnspan=3
+    ),
+    Field('Plants', int, 'spinbox', section='Plant Data', min=0, max=20),
+    Field(
+        'Blossoms', int, 'spinbox', section='Plant Data', column=1,
+        min=0, max=1000
+    ),
+    Field(
+        'Fruit', int, 'spinbox', section='Plant Data', column=2,
+        min=0, max=1000
+    ),
+    Field(
+        'Min Height', float, 'spinbox', 'Min Height (cm)', 'Plant Data',
+        row=1, min=0, max=1000, increment=.01
+    ),
+    Field(
+        'Max Height', float, 'spinbox', 'Max Height (cm)', 'Plant Data',
+        row=1, column=1, min=0, max=1000, increment=.01
+    ),
+    Field(
+        'Med Height', float, 'spinbox', 'Median Height (cm)', 'Plant Data',
+        row=1, column=2, min=0, max=1000, increment=.01
+    ),
+    Field(
+        'Notes', widget='text', required=False,
+        input_args={'width': 75, 'height': 10}
+    ),
+])
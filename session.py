@@ -0,0 +1,180 @@
+'''A compact in-memory buffer of the records saved in a session
+
+Records are kept column by column: numbers in typed arrays, repeated
+strings (Date, Time, Technician, Lab, Plot, Seed Sample) as codes into a
+table of distinct values, and only Notes as a list of strings. A record
+costs a few dozen bytes instead of a dict of boxed values.
+'''
+from array import array
+import math
+
+from schema import RECORD_SCHEMA, _true
+
+# Stands in for a blank whole number, as NaN does for a blank float
+MISSING_INT = -2 ** 63
+
+
+class StringTable:
+    """Distinct strings and the codes that stand for them"""
+
+    __slots__ = ('values', '_codes')
+
+    def __init__(self):
+        self.values = []
+        self._codes = {}
+
+    def code(self, value):
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class RecordView:
+    """One record of a SessionBuffer, read from its columns on access"""
+
+    __slots__ = ('_buffer', '_index')
+
+    def __init__(self, buffer, index):
+        self._buffer = buffer
+        self._index = index
+
+    def __getitem__(self, name):
+        return self._buffer.value(name, self._index)
+
+    def get(self, name, default=None):
+        if name not in self._buffer.columns:
+            return default
+        return self[name]
+
+    def keys(self):
+        return self._buffer.names
+
+    def to_dict(self):
+        """Return the record as DataRecordForm.get() would"""
+        return {name: self[name] for name in self._buffer.names}
+
+    def __repr__(self):
+        return f'RecordView({self.to_dict()!r})'
+
+
+class SessionBuffer:
+    """Records held in typed columns, appended one at a time
+
+    Floats are stored as array('d') with NaN for a blank, whole numbers
+    as array('q') with MISSING_INT, booleans as array('b'), text fields
+    as array('I') codes into a StringTable, and 'text' widget fields in a
+    list. Indexing returns a RecordView and slicing a new buffer; column()
+    hands out a memoryview of a column without copying it.
+    """
+
+    typecodes = {float: 'd', int: 'q', bool: 'b', str: 'I'}
+
+    def __init__(self, schema=RECORD_SCHEMA):
+        self.schema = schema
+        self.names = schema.names
+        self.columns = {}
+        self.tables = {}
+        self._appenders = []
+        for field in schema:
+            if field.widget == 'text':
+                column = []
+            else:
+                column = array(self.typecodes[field.type])
+            self.columns[field.name] = column
+            if field.type is str and field.widget != 'text':
+                self.tables[field.name] = StringTable()
+            self._appenders.append(
+                (field.name, column.append, self._encoder(field))
+            )
+        self._length = 0
+
+    def _encoder(self, field):
+        """Return the function turning a value into what its column holds"""
+        if field.widget == 'text':
+            return str
+        if field.type is str:
+            return self.tables[field.name].code
+        if field.type is float:
+            return lambda value: math.nan if value == '' else float(value)
+        if field.type is int:
+            return lambda value: MISSING_INT if value == '' else int(value)
+        return _true
+
+    def __len__(self):
+        return self._length
+
+    def append(self, record):
+        """Add a record as returned by DataRecordForm.get()"""
+        for name, append, encode in self._appenders:
+            append(encode(record.get(name, '')))
+        self._length += 1
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def value(self, name, index):
+        """Return one field of one record, decoded"""
+        stored = self.columns[name][index]
+        table = self.tables.get(name)
+        if table is not None:
+            return table.values[stored]
+        if stored != stored or stored == MISSING_INT:
+            return ''
+        if self.schema[name].type is bool:
+            return bool(stored)
+        return stored
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._slice(index)
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('record index out of range')
+        return RecordView(self, index)
+
+    def __iter__(self):
+        for index in range(self._length):
+            yield RecordView(self, index)
+
+    def _slice(self, index):
+        """Return a buffer of some of the records, sharing string tables"""
+        part = SessionBuffer.__new__(SessionBuffer)
+        part.schema = self.schema
+        part.names = self.names
+        part.tables = self.tables
+        part.columns = {
+            name: column[index] for name, column in self.columns.items()
+        }
+        part._appenders = [
+            (name, part.columns[name].append, encode)
+            for name, _, encode in self._appenders
+        ]
+        part._length = len(range(*index.indices(self._length)))
+        return part
+
+    def column(self, name):
+        """Return a column without copying it
+
+        Numeric and coded columns come back as a memoryview, which
+        numpy.frombuffer() or array.frombytes() take directly. Coded
+        columns are decoded with tables[name].values. The buffer can't
+        grow while a view of one of its columns is held; release() it
+        first.
+        """
+        column = self.columns[name]
+        if isinstance(column, list):
+            return column
+        return memoryview(column)
+
+    def export(self):
+        """Return {name: column()} for every field"""
+        return {name: self.column(name) for name in self.names}
+
+    def clear(self):
+        for column in self.columns.values():
+            del column[:]
+        self._length = 0
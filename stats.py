@@ -0,0 +1,246 @@
+'''Running statistics of a day's records, per Lab and per Plot
+
+Each record updates the aggregates in constant time, so they can be kept
+live while records are saved. They are built once from the daily file,
+and a checkpoint remembers how far into the file they have counted so a
+restart only reads the records saved since.
+'''
+from collections import Counter
+from math import sqrt
+from pathlib import Path
+import csv
+import io
+import json
+import locale
+import os
+
+from models import daily_filename, scan_rows, today
+
+
+class Running:
+    """Count, mean, variance, minimum and maximum of a stream of numbers
+
+    Welford's method keeps the mean and the sum of squared differences
+    up to date without keeping the numbers.
+    """
+
+    __slots__ = ('count', 'mean', '_m2', 'min', 'max')
+
+    def __init__(self, state=None):
+        self.count, self.mean, self._m2, self.min, self.max = (
+            state or (0, 0.0, 0.0, None, None)
+        )
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """Add in the numbers another Running has seen"""
+        if not other.count:
+            return
+        if not self.count:
+            self.__init__(other.state())
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self._m2 += other._m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def variance(self):
+        """The sample variance"""
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stdev(self):
+        return sqrt(self.variance)
+
+    def state(self):
+        return [self.count, self.mean, self._m2, self.min, self.max]
+
+
+def _blank(value):
+    return value is None or value == ''
+
+
+class GroupStats:
+    """The aggregates for the records of one Lab or one Plot
+
+    heights counts the median heights in bins of height_bin cm.
+    """
+
+    measures = (
+        'Humidity', 'Light', 'Temperature',
+        'Min Height', 'Max Height', 'Med Height'
+    )
+    totals = ('Plants', 'Blossoms', 'Fruit')
+    height_bin = 1
+
+    __slots__ = ('count', 'running', 'total', 'heights')
+
+    def __init__(self, state=None):
+        state = state or {}
+        running = state.get('running', {})
+        self.count = state.get('count', 0)
+        self.running = {
+            name: Running(running.get(name)) for name in self.measures
+        }
+        self.total = dict.fromkeys(self.totals, 0)
+        self.total.update(state.get('total', {}))
+        self.heights = Counter({
+            int(bin): count for bin, count in state.get('heights', {}).items()
+        })
+
+    def add(self, record):
+        """Count a record, skipping blank values"""
+        self.count += 1
+        for name, running in self.running.items():
+            value = record.get(name)
+            if not _blank(value):
+                running.add(float(value))
+        for name in self.totals:
+            value = record.get(name)
+            if not _blank(value):
+                self.total[name] += int(value)
+        height = record.get('Med Height')
+        if not _blank(height):
+            self.heights[int(float(height) // self.height_bin)] += 1
+
+    def histogram(self):
+        """Return [(low, high, count)] for the median height bins"""
+        size = self.height_bin
+        return [
+            (bin * size, (bin + 1) * size, self.heights[bin])
+            for bin in sorted(self.heights)
+        ]
+
+    def state(self):
+        return {
+            'count': self.count,
+            'running': {
+                name: running.state() for name, running in self.running.items()
+            },
+            'total': self.total,
+            'heights': self.heights,
+        }
+
+
+class DailyStats:
+    """Per Lab and per Plot statistics of the records saved on one day
+
+    groups maps ('Lab', 'A') or ('Plot', '7') to its GroupStats. load()
+    reads the daily file, starting from the checkpoint when it is for
+    the same file; add() counts each record saved afterwards. Only what
+    load() read goes in the checkpoint, since records added may not be
+    in the daily file yet (with shards, until they're merged).
+    """
+
+    keys = ('Lab', 'Plot')
+
+    def __init__(self, datestring=None, directory='.',
+                 checkpoint='abq_stats.json'):
+        self.day = datestring or today()
+        self.directory = Path(directory)
+        self.checkpoint_filename = self.directory / checkpoint
+        self.filename = daily_filename(self.day, self.directory)
+        self.groups = {}
+        self._fieldnames = None
+        self._end = 0
+        # The checkpoint as of the end of the last load(), as JSON text
+        # since add() changes the aggregates in place
+        self._loaded = None
+
+    def add(self, record):
+        """Count a record in its Lab's and its Plot's aggregates"""
+        groups = self.groups
+        for key in self.keys:
+            group = (key, str(record.get(key, '')))
+            stats = groups.get(group)
+            if stats is None:
+                stats = groups[group] = GroupStats()
+            stats.add(record)
+
+    def load(self):
+        """Count the records in the daily file not already counted"""
+        try:
+            status = self.filename.stat()
+        except FileNotFoundError:
+            return
+        self._restore(status)
+        encoding = locale.getpreferredencoding(False)
+        rows = []
+        with open(self.filename, 'rb') as fh:
+            for start, row in scan_rows(fh, self._end):
+                if self._fieldnames is None:
+                    header = row.decode(encoding)
+                    self._fieldnames = next(csv.reader([header]))
+                else:
+                    rows.append(row)
+                self._end = start + len(row)
+        text = b''.join(rows).decode(encoding)
+        fieldnames = self._fieldnames
+        for row in csv.reader(io.StringIO(text, newline='')):
+            self.add(dict(zip(fieldnames, row)))
+        self._loaded = json.dumps({
+            'day': self.day,
+            'inode': status.st_ino,
+            'end': self._end,
+            'fieldnames': self._fieldnames,
+            'groups': [
+                {'key': list(key), **stats.state()}
+                for key, stats in self.groups.items()
+            ],
+        }, separators=(',', ':'))
+
+    def _restore(self, status):
+        """Start from the checkpoint if it counted part of this file
+
+        A daily file that was replaced (by a merge) or has shrunk since is
+        counted again from the start.
+        """
+        try:
+            with open(self.checkpoint_filename) as fh:
+                state = json.load(fh)
+        except (OSError, ValueError):
+            return
+        if (
+            state.get('day') != self.day
+            or state.get('inode') != status.st_ino
+            or state.get('end', 0) > status.st_size
+        ):
+            return
+        self.groups = {
+            tuple(group['key']): GroupStats(group)
+            for group in state['groups']
+        }
+        self._fieldnames = state['fieldnames'] or None
+        self._end = state['end']
+
+    def save_checkpoint(self):
+        """Record the aggregates as load() left them, along with how much
+        of the file they cover"""
+        if self._loaded is None:
+            return
+        temporary = self.checkpoint_filename.with_name(
+            self.checkpoint_filename.name + '.tmp'
+        )
+        with open(temporary, 'w') as fh:
+            fh.write(self._loaded)
+        os.replace(temporary, self.checkpoint_filename)
+
+    def sorted_groups(self):
+        """Return [(key, GroupStats)] with Labs first and Plots in order"""
+        def order(item):
+            (key, value), _ = item
+            return (self.keys.index(key), len(value), value)
+        return sorted(self.groups.items(), key=order)
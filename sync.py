@@ -0,0 +1,416 @@
+'''Upload of saved records to the central collection server
+
+    ABQ_SYNC_URL=http://collect.example:8080/records python data_entry_app.py
+    python -m sync http://collect.example:8080/records
+
+Every saved record is appended to an outbox on disk. An Uploader thread
+sends what is in it, oldest first, as gzipped JSON batches over a single
+keep-alive connection, and moves a cursor past each batch once the
+server has acknowledged it. When the server can't be reached it backs
+off exponentially, and records keep collecting in the outbox meanwhile,
+across restarts if need be.
+
+Each batch names the outbox's generation and the offset of every record
+in it, so a batch sent twice (acknowledged, but the acknowledgement
+lost) is recognised by the server and only stored once; see
+collection_server.py.
+'''
+from collections import Counter, deque
+from pathlib import Path
+from urllib.parse import urlsplit
+import argparse
+import gzip
+import http.client
+import json
+import os
+import random
+import struct
+import sys
+import threading
+import time
+import zlib
+
+# Payload length and CRC32 of each outbox entry
+_ENTRY = struct.Struct('>II')
+
+
+class Outbox:
+    """An append-only file of records waiting to be uploaded
+
+    Entries are framed and checksummed like the journal's. The cursor
+    file (the outbox name plus .pos) holds the offset of the first entry
+    the server has not acknowledged, and a generation number that goes
+    up each time the emptied outbox is cut back to nothing, so that
+    offsets name one record for good. Appends are flushed, not fsynced;
+    the Uploader fsyncs the outbox every so often, and the journal (see
+    journal.py) fsyncs it before letting go of any record, having first
+    put back whatever a crash kept out of it. For that the outbox is
+    only cut back by trim(), when the journal is compacted.
+    """
+
+    def __init__(self, filename='abq_outbox.bin', compact_size=1 << 20):
+        self.filename = Path(filename)
+        self.cursor_filename = self.filename.with_name(
+            self.filename.name + '.pos'
+        )
+        self.compact_size = compact_size
+        self._lock = threading.Lock()
+        self.generation, self.cursor = self._read_cursor()
+        valid, self.depth = self._scan()
+        self._fh = open(self.filename, 'ab')
+        if self._fh.tell() != valid:
+            # Cut off an entry torn by a crash
+            self._fh.truncate(valid)
+            self._fh.seek(valid)
+        if self.cursor > valid:
+            # The outbox was emptied but the new cursor never written
+            self._start_generation()
+            _, self.depth = self._scan()
+
+    def _read_cursor(self):
+        try:
+            with open(self.cursor_filename) as fh:
+                cursor = json.load(fh)
+            return cursor['generation'], cursor['offset']
+        except (OSError, ValueError, KeyError, TypeError):
+            return 0, 0
+
+    def _write_cursor(self):
+        temporary = self.cursor_filename.with_name(
+            self.cursor_filename.name + '.tmp'
+        )
+        with open(temporary, 'w') as fh:
+            json.dump(
+                {'generation': self.generation, 'offset': self.cursor}, fh
+            )
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(temporary, self.cursor_filename)
+
+    def _entries(self, fh, offset, limit=None):
+        """Yield (offset, end offset, payload bytes) from offset on"""
+        fh.seek(offset)
+        while limit is None or limit > 0:
+            header = fh.read(_ENTRY.size)
+            if len(header) < _ENTRY.size:
+                return
+            length, crc = _ENTRY.unpack(header)
+            payload = fh.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                return
+            end = offset + _ENTRY.size + length
+            yield offset, end, payload
+            offset = end
+            if limit is not None:
+                limit -= 1
+
+    def _scan(self):
+        """Return the end of the last intact entry and how many entries
+        follow the cursor"""
+        valid = 0
+        depth = 0
+        try:
+            with open(self.filename, 'rb') as fh:
+                for offset, valid, _ in self._entries(fh, 0):
+                    depth += offset >= self.cursor
+        except FileNotFoundError:
+            pass
+        return valid, depth
+
+    @staticmethod
+    def _payload(record, datestring):
+        return json.dumps(
+            {'day': datestring, 'record': record}, separators=(',', ':')
+        ).encode()
+
+    def append(self, records, datestring):
+        """Add records saved to datestring's file"""
+        data = bytearray()
+        for record in records:
+            payload = self._payload(record, datestring)
+            data += _ENTRY.pack(len(payload), zlib.crc32(payload)) + payload
+        with self._lock:
+            self._fh.write(data)
+            self._fh.flush()
+            self.depth += len(records)
+
+    def sync(self):
+        with self._lock:
+            os.fsync(self._fh.fileno())
+
+    def missing(self, entries):
+        """Return the journal entries ({'day': ..., 'record': ...}) that
+        are not in the outbox, sent or not, in the order given"""
+        with self._lock:
+            self._fh.flush()
+        with open(self.filename, 'rb') as fh:
+            queued = Counter(payload for _, _, payload in self._entries(fh, 0))
+        missing = []
+        for entry in entries:
+            payload = self._payload(entry['record'], entry['day'])
+            if queued[payload]:
+                queued[payload] -= 1
+            else:
+                missing.append(entry)
+        return missing
+
+    def batch(self, size):
+        """Return (generation, [offsets], [payloads], end) for up to size
+        records after the cursor"""
+        with self._lock:
+            generation, cursor = self.generation, self.cursor
+            self._fh.flush()
+        offsets = []
+        payloads = []
+        end = cursor
+        with open(self.filename, 'rb') as fh:
+            for offset, end, payload in self._entries(fh, cursor, size):
+                offsets.append(offset)
+                payloads.append(payload)
+        return generation, offsets, payloads, end
+
+    def acknowledge(self, generation, end, count):
+        """Move the cursor past an uploaded batch"""
+        with self._lock:
+            if generation != self.generation or end <= self.cursor:
+                return
+            self.cursor = end
+            self.depth -= count
+            self._write_cursor()
+
+    def trim(self):
+        """Empty the outbox if everything in a large one has gone,
+        returning whether it was
+
+        Only call this once nothing it holds is still in the journal,
+        or a crash would queue those records again.
+        """
+        with self._lock:
+            end = self._fh.tell()
+            if self.cursor != end or end < self.compact_size:
+                return False
+            self._fh.truncate(0)
+            self._fh.seek(0)
+            self._start_generation()
+            return True
+
+    def _start_generation(self):
+        self.generation += 1
+        self.cursor = 0
+        self.depth = 0
+        self._write_cursor()
+
+    def close(self):
+        with self._lock:
+            self._fh.close()
+
+
+class SyncError(Exception):
+    """The server refused a batch"""
+
+
+class Uploader:
+    """Sends an Outbox's records to the server on a thread of its own
+
+    Batches of up to batch_size records go out as soon as there are
+    records to send. After a failure the next attempt waits retry_delay
+    seconds, doubling with each further failure up to max_delay, with
+    some jitter so a lab's workstations don't retry in step.
+    """
+
+    def __init__(
+        self, outbox, url, client, batch_size=500, retry_delay=1,
+        max_delay=300, timeout=30, sync_interval=5
+    ):
+        self.outbox = outbox
+        self.url = urlsplit(url)
+        self.client = client
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.sync_interval = sync_interval
+        self.sent = 0
+        self.failures = 0
+        self.last_error = None
+        self.next_attempt = 0
+        # (time, records) of recent batches, for the upload rate
+        self._recent = deque(maxlen=64)
+        self._connection = None
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def wake(self):
+        """Send what is in the outbox now rather than at the next poll"""
+        self._wake.set()
+
+    def _connect(self):
+        if self._connection is None:
+            cls = (
+                http.client.HTTPSConnection if self.url.scheme == 'https'
+                else http.client.HTTPConnection
+            )
+            self._connection = cls(self.url.netloc, timeout=self.timeout)
+        return self._connection
+
+    def _disconnect(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _post(self, body):
+        """POST a batch, returning the server's JSON reply"""
+        connection = self._connect()
+        connection.request(
+            'POST', self.url.path or '/', body=body, headers={
+                'Content-Type': 'application/json',
+                'Content-Encoding': 'gzip',
+            }
+        )
+        response = connection.getresponse()
+        reply = response.read()
+        if response.getheader('Connection', '').lower() == 'close':
+            self._disconnect()
+        if response.status != 200:
+            raise SyncError(f'{response.status} {response.reason}')
+        return json.loads(reply or b'{}')
+
+    def send_batch(self):
+        """Upload the next batch, returning how many records it held"""
+        generation, offsets, payloads, end = self.outbox.batch(self.batch_size)
+        if not offsets:
+            return 0
+        body = b''.join([
+            b'{"client":', json.dumps(self.client).encode(),
+            b',"generation":', str(generation).encode(),
+            b',"offsets":', json.dumps(offsets).encode(),
+            b',"records":[', b','.join(payloads), b']}'
+        ])
+        try:
+            self._post(gzip.compress(body, 6))
+        except (OSError, http.client.HTTPException):
+            # A keep-alive connection the server dropped fails on first
+            # use; one fresh connection is tried before giving up
+            self._disconnect()
+            self._post(gzip.compress(body, 6))
+        self.outbox.acknowledge(generation, end, len(offsets))
+        self.sent += len(offsets)
+        self._recent.append((time.monotonic(), len(offsets)))
+        return len(offsets)
+
+    def drain(self):
+        """Send batches until the outbox is empty, raising on failure"""
+        total = 0
+        while True:
+            sent = self.send_batch()
+            if not sent:
+                return total
+            total += sent
+
+    def _run(self):
+        last_sync = time.monotonic()
+        while not self._stopping:
+            if time.monotonic() >= self.next_attempt:
+                self._attempt()
+            if time.monotonic() - last_sync > self.sync_interval:
+                self.outbox.sync()
+                last_sync = time.monotonic()
+            if self.failures:
+                self._wake.wait(max(0, self.next_attempt - time.monotonic()))
+            else:
+                self._wake.wait(self.sync_interval)
+            self._wake.clear()
+        self._disconnect()
+
+    def _attempt(self):
+        """Send until the outbox is empty, scheduling a retry on failure"""
+        try:
+            while not self._stopping and self.send_batch():
+                pass
+        except (OSError, ValueError, SyncError,
+                http.client.HTTPException) as e:
+            self._disconnect()
+            self.failures += 1
+            self.last_error = str(e) or type(e).__name__
+            backoff = min(
+                self.max_delay, self.retry_delay * 2 ** (self.failures - 1)
+            )
+            self.next_attempt = (
+                time.monotonic() + backoff * random.uniform(.5, 1)
+            )
+        else:
+            self.failures = 0
+            self.last_error = None
+            self.next_attempt = 0
+
+    def rate(self, window=10):
+        """Return records uploaded per second over the last window
+        seconds"""
+        now = time.monotonic()
+        recent = [(t, n) for t, n in self._recent if now - t <= window]
+        if not recent:
+            return 0.0
+        elapsed = max(now - recent[0][0], 1)
+        return sum(n for _, n in recent) / elapsed
+
+    def status(self):
+        """Return a line describing the upload, for the status bar"""
+        waiting = self.outbox.depth
+        if self.last_error:
+            retry = max(0, self.next_attempt - time.monotonic())
+            return (
+                f'Sync: {waiting} waiting, retrying in {retry:.0f}s '
+                f'({self.last_error})'
+            )
+        return f'Sync: {waiting} waiting, {self.rate():.0f} records/s'
+
+    def stop(self, timeout=5):
+        """Stop the thread once it has finished any batch in flight
+
+        Anything not sent stays in the outbox for the next start.
+        """
+        self._stopping = True
+        self._wake.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+        self.outbox.sync()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Upload the records waiting in an outbox'
+    )
+    parser.add_argument('url', help='the collection server\'s records URL')
+    parser.add_argument('--outbox', default='abq_outbox.bin')
+    parser.add_argument('--client', default=None)
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args(argv)
+
+    from models import shard_name
+
+    outbox = Outbox(args.outbox)
+    uploader = Uploader(
+        outbox, args.url, args.client or shard_name(), args.batch_size
+    )
+    start = time.perf_counter()
+    try:
+        sent = uploader.drain()
+    except (OSError, SyncError, http.client.HTTPException) as e:
+        print(f'Upload stopped: {e}', file=sys.stderr)
+        sys.exit(1)
+    finally:
+        outbox.close()
+    seconds = time.perf_counter() - start
+    print(
+        f'{sent} records sent in {seconds:.2f}s, {outbox.depth} waiting',
+        file=sys.stderr
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,24 @@
+from datetime import date
+
+from archive import locate, read_records, rotate
+from models import ShardStore, shard_directory
+
+
+def test_rotate_archives_a_day_kept_in_shards(tmp_path):
+    fields = ['Date', 'Time', 'Lab', 'Plot', 'Notes']
+    for writer in ('one', 'two'):
+        store = ShardStore(tmp_path, fields=fields, writer=writer)
+        store.write(
+            {'Date': '2025-03-01', 'Time': '8:00', 'Lab': 'A',
+             'Plot': writer, 'Notes': ''},
+            '2025-03-01'
+        )
+        store.close()
+
+    archived = rotate(tmp_path, keep=7, today=date(2025, 3, 20))
+
+    assert len(archived) == 1
+    filename = locate(tmp_path, 'abq_data_record_2025-03-01.csv')
+    assert filename == archived[0]
+    assert [r['Plot'] for r in read_records(filename)] == ['one', 'two']
+    assert not list(shard_directory(tmp_path).glob('*2025-03-01*'))
@@ -0,0 +1,36 @@
+from datetime import date, timedelta
+import resource
+
+from bulk_import import Importer
+from schema import RECORD_SCHEMA
+
+
+def row(datestring):
+    record = {
+        'Date': datestring, 'Time': '8:00', 'Technician': 'J Simms',
+        'Lab': 'A', 'Plot': '1', 'Seed Sample': 'AX1', 'Humidity': '24.5',
+        'Light': '50', 'Temperature': '21', 'Equipment Fault': 'False',
+        'Plants': '9', 'Blossoms': '21', 'Fruit': '3', 'Min Height': '5',
+        'Max Height': '14', 'Med Height': '9', 'Notes': '',
+    }
+    return [record[name] for name in RECORD_SCHEMA.names]
+
+
+def test_import_many_days_keeps_few_files_open(tmp_path):
+    first = date(2010, 1, 1)
+    dates = [(first + timedelta(days)).isoformat() for days in range(3000)]
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    # Far fewer descriptors than days, so a file held open per day fails
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(256, hard), hard))
+    try:
+        importer = Importer(tmp_path, batch_size=500)
+        try:
+            importer.run(row(d) for d in dates)
+        finally:
+            importer.close()
+    finally:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+
+    assert importer.imported == 3000
+    assert importer.rejected == 0
+    assert len(list(tmp_path.glob('abq_data_record_*.csv'))) == 3000
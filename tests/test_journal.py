@@ -0,0 +1,109 @@
+import json
+
+from journal import Journal
+from models import RecordStore, SaveQueue
+
+
+def record(notes):
+    return {
+        'Date': '2025-03-01', 'Time': '8:00', 'Technician': 'J Simms',
+        'Lab': 'A', 'Plot': 1, 'Notes': notes,
+    }
+
+
+def test_compact_keeps_a_key_saved_twice(tmp_path):
+    journal = Journal(tmp_path / 'journal.bin')
+    store = RecordStore(tmp_path, fields=list(record('')))
+    for notes in ('first', 'second'):
+        journal.append_record(record(notes), '2025-03-01')
+        store.write(record(notes), '2025-03-01')
+
+    journal.compact(store)
+
+    rows = list(store.records('2025-03-01'))
+    assert [row['Notes'] for row in rows] == ['first', 'second']
+    assert store.find(('2025-03-01', '8:00', 'A', 1))['Notes'] == 'second'
+    store.close()
+    journal.close()
+
+
+def test_replay_writes_only_what_was_lost(tmp_path):
+    journal = Journal(tmp_path / 'journal.bin')
+    store = RecordStore(tmp_path, fields=list(record('')))
+    for notes in ('first', 'second', 'third'):
+        journal.append_record(record(notes), '2025-03-01')
+    # The crash came after the first two saves reached the file
+    store.write(record('first'), '2025-03-01')
+    store.write(record('second'), '2025-03-01')
+
+    written, _ = journal.replay(store)
+
+    assert written == 1
+    rows = list(store.records('2025-03-01'))
+    assert [row['Notes'] for row in rows] == ['first', 'second', 'third']
+    store.close()
+    journal.close()
+
+
+class FailingStore(RecordStore):
+    """A RecordStore whose first write fails"""
+
+    failures = 1
+
+    def write(self, data, datestring=None):
+        if self.failures:
+            self.failures -= 1
+            raise OSError('disk full')
+        super().write(data, datestring)
+
+
+def test_a_retried_save_is_journalled_once(tmp_path):
+    journal = Journal(tmp_path / 'journal.bin')
+    store = FailingStore(tmp_path, fields=list(record('')))
+    savequeue = SaveQueue(store, journal=journal)
+    savequeue.submit(record('only'), '2025-03-01')
+    job, error = savequeue.results.get(timeout=5)
+    assert error is not None
+    # Retried the way Application._submit does
+    data, day, *journaled = job
+    savequeue.submit(data, day, journaled=bool(journaled))
+    job, error = savequeue.results.get(timeout=5)
+    assert error is None
+
+    journal.compact(store)
+
+    rows = list(store.records('2025-03-01'))
+    assert [row['Notes'] for row in rows] == ['only']
+    savequeue.close()
+    journal.close()
+
+
+def test_replay_queues_what_never_reached_the_outbox(tmp_path):
+    from sync import Outbox
+
+    journal = Journal(tmp_path / 'journal.bin')
+    store = RecordStore(tmp_path, fields=list(record('')))
+    outbox = Outbox(tmp_path / 'outbox.bin', compact_size=0)
+    for notes in ('first', 'second'):
+        journal.append_record(record(notes), '2025-03-01')
+        store.write(record(notes), '2025-03-01')
+    # The crash came after both were saved but before the second was
+    # queued for upload
+    outbox.append([record('first')], '2025-03-01')
+
+    written, _ = journal.replay(store, outbox)
+
+    assert written == 0
+    _, _, payloads, end = outbox.batch(10)
+    assert [json.loads(p)['record']['Notes'] for p in payloads] == [
+        'first', 'second'
+    ]
+    # Once sent, compacting empties the outbox without queueing either again
+    outbox.acknowledge(outbox.generation, end, len(payloads))
+    journal.compact(store, outbox)
+    journal.replay(store, outbox)
+    assert outbox.depth == 0
+    assert outbox.batch(10)[2] == []
+    store.close()
+    outbox.close()
+    journal.close()
@@ -0,0 +1,34 @@
+import csv
+
+from notes_index import NotesIndex
+
+
+def write_day(directory, datestring, notes):
+    with open(directory / f'abq_data_record_{datestring}.csv', 'w',
+              newline='') as fh:
+        writer = csv.writer(fh)
+        writer.writerow(['Date', 'Time', 'Lab', 'Plot', 'Notes'])
+        writer.writerow([datestring, '8:00', 'A', '1', notes])
+
+
+def test_update_all_indexes_new_days_alongside_known_ones(tmp_path):
+    write_day(tmp_path, '2025-03-01', 'mildew on the leaves')
+    index = NotesIndex(tmp_path)
+    index.update_all()
+    # Days from other writers, more than enough for a pool
+    for day in range(2, 2 + NotesIndex.pool_size):
+        write_day(tmp_path, f'2025-03-{day:02d}', f'mildew day {day}')
+    write_day(tmp_path, '2025-03-01', 'mildew on the stems')
+    done = []
+
+    index.update_all(
+        progress=lambda *counts: done.append(counts), jobs=2
+    )
+
+    names = {name for name, _ in index.postings('mildew')}
+    assert len(names) == 1 + NotesIndex.pool_size
+    assert {name for name, _ in index.postings('stems')} == {
+        'abq_data_record_2025-03-01.csv'
+    }
+    assert done[-1] == (1 + NotesIndex.pool_size,) * 2
+    index.close()
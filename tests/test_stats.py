@@ -0,0 +1,34 @@
+from models import ShardStore, merge_shards
+from stats import DailyStats
+
+FIELDS = ['Date', 'Time', 'Lab', 'Plot', 'Humidity']
+
+
+def record(plot):
+    return {
+        'Date': '2025-03-01', 'Time': '8:00', 'Lab': 'A', 'Plot': plot,
+        'Humidity': '50',
+    }
+
+
+def save(directory, plot):
+    store = ShardStore(directory, fields=FIELDS, writer='one')
+    store.write(record(plot), '2025-03-01')
+    store.close()
+
+
+def test_checkpoint_leaves_out_saves_not_yet_merged(tmp_path):
+    save(tmp_path, 1)
+    merge_shards('2025-03-01', tmp_path)
+    stats = DailyStats('2025-03-01', tmp_path)
+    stats.load()
+    # Saved this session, but not in the daily file until the next merge
+    save(tmp_path, 2)
+    stats.add(record(2))
+    stats.save_checkpoint()
+
+    merge_shards('2025-03-01', tmp_path)
+    stats = DailyStats('2025-03-01', tmp_path)
+    stats.load()
+
+    assert stats.groups[('Lab', 'A')].count == 2
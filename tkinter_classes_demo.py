@@ -1,9 +1,14 @@
 import tkinter as tk
 import json
 
+from variables import RecordVar
+
 
 class JSONVar(tk.StringVar):
-    """A Tk variable that can hold dicts and lists"""
+    """A Tk variable that can hold dicts and lists
+
+    Every get() decodes the JSON again; variables.RecordVar caches it.
+    """
     def __init__(self, *args, **kwargs):
         kwargs['value'] = json.dumps(kwargs.get('value'))
         super().__init__(*args, **kwargs)
@@ -60,7 +65,7 @@ class Application(tk.Tk):
     """A simple form application"""
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.json_var = JSONVar(self)
+        self.json_var = RecordVar(self)
         self.output_var = tk.StringVar(self)
         tk.Label(self, text='Please fill the form').grid(stick='ew')
         MyForm(self, self.json_var).grid(sticky='nsew')
@@ -0,0 +1,217 @@
+'''Tk variable helpers for the ABQ Data Entry application'''
+from types import MappingProxyType
+import json
+import tkinter as tk
+
+
+class VariableSnapshot:
+    """Reads or writes a dict of Tk variables in a single Tcl call
+
+    Values are converted the way each variable's own get() would, raising
+    ValueError(key) for a value that won't convert. Reading is faster
+    than a get() per variable. Writing is not, on bare variables: handling
+    the traces costs about 10us. Any gain comes from the widgets and
+    validation behind the traces, which bench_gui measures.
+    """
+
+    _count = 0
+
+    def __init__(self, variables):
+        self.variables = variables
+        self.keys = list(variables)
+        self._names = [str(var) for var in variables.values()]
+        self._tk = next(iter(variables.values()))._tk
+        self._converters = [
+            self._converter(var) for var in variables.values()
+        ]
+        VariableSnapshot._count += 1
+        self._get_proc = f'::abq::snapshot_get{self._count}'
+        self._set_proc = f'::abq::snapshot_set{self._count}'
+        self._apply_proc = f'::abq::snapshot_apply{self._count}'
+        self._define_procs()
+
+    def _define_procs(self):
+        """Compile the Tcl procs that read and write the variables
+
+        The setter removes the variables' traces, sets them all, puts the
+        traces back and then writes each traced variable that changed
+        once more, so its traces fire exactly once with all the new
+        values in place, and those of unchanged variables not at all.
+        """
+        names = [f'{{::{name}}}' for name in self._names]
+        getter = 'list ' + ' '.join(f'[set {name}]' for name in names)
+        setter = []
+        for i, name in enumerate(names):
+            setter.append(
+                f'set t{i} [trace info variable {name}]\n'
+                f'foreach t $t{i} {{trace remove variable {name} {{*}}$t}}\n'
+                f'set o{i} [set {name}]\n'
+                f'set {name} [lindex $args {i}]'
+            )
+        for i, name in enumerate(names):
+            setter.append(
+                f'if {{[llength $t{i}]}} {{\n'
+                f'    foreach t [lreverse $t{i}] '
+                f'{{trace add variable {name} {{*}}$t}}\n'
+                f'    if {{$o{i} ne [set {name}]}} {{set {name} [set {name}]}}\n'
+                f'}}'
+            )
+        self._tk.eval('namespace eval ::abq {}')
+        self._tk.eval(f'proc {self._get_proc} {{}} {{{getter}}}')
+        self._tk.eval(
+            f'proc {self._set_proc} {{args}} {{\n' + '\n'.join(setter) + '\n}'
+        )
+        self._tk.eval(
+            f'proc {self._apply_proc} {{template}} '
+            f'{{{self._set_proc} {{*}}[set $template]}}'
+        )
+
+    def _converter(self, var):
+        if isinstance(var, tk.BooleanVar):
+            return self._tk.getboolean
+        if isinstance(var, tk.DoubleVar):
+            return float
+        if isinstance(var, tk.IntVar):
+            return self._int
+        return str
+
+    @staticmethod
+    def _int(value):
+        try:
+            return int(value)
+        except ValueError:
+            return int(float(value))
+
+    def read(self):
+        """Return the variables' values as Tcl holds them, in key order"""
+        return self._tk.splitlist(self._tk.call(self._get_proc))
+
+    def convert(self, values, skip=()):
+        """Convert values from read(), with '' for the keys in skip"""
+        data = dict()
+        for key, convert, value in zip(self.keys, self._converters, values):
+            if key in skip:
+                data[key] = ''
+                continue
+            try:
+                data[key] = convert(value)
+            except (ValueError, tk.TclError):
+                raise ValueError(key)
+        return data
+
+    def get(self):
+        """Return the variables' values"""
+        return self.convert(self.read())
+
+    def _values(self, data):
+        """Return data as a value per key, taking missing ones from the
+        variables"""
+        current = None
+        values = []
+        for i, key in enumerate(self.keys):
+            if key in data:
+                value = data[key]
+            else:
+                current = current or self.read()
+                value = current[i]
+            values.append(int(value) if isinstance(value, bool) else value)
+        return values
+
+    def set(self, data):
+        """Write every variable, firing each changed variable's traces once"""
+        self._tk.call(self._set_proc, *self._values(data))
+
+    def template(self, data):
+        """Keep a full set of values in Tcl to be written by apply()
+
+        Returns the name of the Tcl variable holding them. Keys missing
+        from data take the variables' current values.
+        """
+        VariableSnapshot._count += 1
+        name = f'::abq::template{VariableSnapshot._count}'
+        self._tk.call('set', name, tuple(self._values(data)))
+        return name
+
+    def apply_command(self, template):
+        """Return the Tcl command that applies a template"""
+        return f'{self._apply_proc} {template}'
+
+    def apply(self, template):
+        """Write the values kept by template() without leaving Tcl"""
+        self._tk.call(self._apply_proc, template)
+
+
+def _thaw(value):
+    if isinstance(value, MappingProxyType):
+        return dict(value)
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+# One encoder made up front: json.dumps() builds a new one whenever it is
+# given options
+_encode = json.JSONEncoder(
+    separators=(',', ':'), ensure_ascii=False, check_circular=False,
+    default=_thaw
+).encode
+
+
+def _freeze(value):
+    """Return value with its dicts made read-only and its lists tuples"""
+    if isinstance(value, dict):
+        frozen = dict(value)
+        for key, item in frozen.items():
+            if isinstance(item, (dict, list)):
+                frozen[key] = _freeze(item)
+        return MappingProxyType(frozen)
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+class RecordVar(tk.Variable):
+    """A Tk variable holding a record, or any JSON value, as Python
+
+    The decoded value is cached alongside the compact JSON written to
+    Tcl, so get() only decodes again when something else has written the
+    variable; version counts the changes. set() leaves the variable alone
+    when the new value encodes the same as what Tcl holds, so write
+    traces fire only on real changes. As get() hands out the cached
+    value, dicts come back read-only and lists as tuples.
+    """
+
+    _default = 'null'
+
+    def __init__(self, master=None, value=None, name=None):
+        self._string = self._default
+        self._value = None
+        self.version = 0
+        super().__init__(master, None, name)
+        if value is not None:
+            self.set(value)
+
+    def get(self):
+        """Return the value, decoding it only if Tcl holds a new one"""
+        string = self._tk.globalgetvar(self._name)
+        if string != self._string:
+            string = str(string)
+            self._value = _freeze(json.loads(string))
+            self._string = string
+            self.version += 1
+        return self._value
+
+    def set(self, value):
+        """Write value to Tcl unless that is what it already holds"""
+        string = _encode(value)
+        if string == self._string == self._tk.globalgetvar(self._name):
+            return
+        if isinstance(value, dict) and '[' not in string and (
+            '{' not in string[1:]
+        ):
+            # A flat record, the usual case, only needs a shallow copy
+            self._value = MappingProxyType(dict(value))
+        else:
+            self._value = _freeze(value)
+        self._string = string
+        self.version += 1
+        # Last, so write traces that call get() find the cache current
+        self._tk.globalsetvar(self._name, string)